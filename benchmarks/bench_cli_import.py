@@ -0,0 +1,124 @@
+"""
+Measure how much each tg-signer subcommand imports, using ``-X importtime``.
+
+Every subcommand has a budget: a maximum import time and a list of modules it
+must not load. Commands that never talk to Telegram must not pull in pyrogram,
+httpx and friends::
+
+    python benchmarks/bench_cli_import.py          # print the report
+    python benchmarks/bench_cli_import.py --check  # exit 1 when over budget
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+from typing import NamedTuple, Optional
+
+# loaded only by commands that talk to Telegram or call AI / HTTP APIs
+HEAVY_MODULES = (
+    "pyrogram",
+    "httpx",
+    "croniter",
+    "openai",
+    "nicegui",
+    "tg_signer.core",
+    "tg_signer.ai_tools",
+)
+
+
+class Budget(NamedTuple):
+    max_ms: float
+    forbidden: tuple[str, ...] = HEAVY_MODULES
+
+
+BUDGETS: dict[tuple[str, ...], Budget] = {
+    ("version",): Budget(300),
+    ("--help",): Budget(300),
+    ("monitor", "--help"): Budget(300),
+    ("send-text", "--help"): Budget(300),
+    ("list-topics", "--help"): Budget(300),
+    # offline commands load pydantic for the config models, but no client
+    ("list",): Budget(1000),
+    ("monitor", "list"): Budget(1000),
+    ("export", "missing-task"): Budget(1000),
+}
+
+
+class ImportReport(NamedTuple):
+    args: tuple[str, ...]
+    total_ms: float
+    modules: dict[str, float]  # top-level import -> cumulative ms
+    loaded: set[str]
+
+    def heaviest(self, n: int = 5) -> list[tuple[str, float]]:
+        return sorted(self.modules.items(), key=lambda item: -item[1])[:n]
+
+    def violations(self, budget: Budget) -> list[str]:
+        problems = []
+        if self.total_ms > budget.max_ms:
+            problems.append(f"{self.total_ms:.0f}ms > {budget.max_ms:.0f}ms")
+        for name in budget.forbidden:
+            if name in self.loaded:
+                problems.append(f"imports {name}")
+        return problems
+
+
+def parse_importtime(stderr: str) -> tuple[dict[str, float], set[str]]:
+    """
+    Return the cumulative time of the top-level imports done by tg-signer and
+    all modules loaded. Interpreter startup imports before it are ignored.
+    """
+    modules: dict[str, float] = {}
+    loaded = set()
+    started = False
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        module = name.strip()
+        loaded.add(module)
+        if name.startswith("  "):
+            continue
+        started = started or module.startswith("tg_signer")
+        if started:
+            modules[module] = modules.get(module, 0) + int(cumulative) / 1000
+    return modules, loaded
+
+
+def measure(args: tuple[str, ...], cwd: Optional[str] = None) -> ImportReport:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "tg_signer", *args],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    modules, loaded = parse_importtime(result.stderr)
+    return ImportReport(args, sum(modules.values()), modules, loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--check", action="store_true", help="fail when over budget")
+    options = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as cwd:
+        for args, budget in BUDGETS.items():
+            report = measure(args, cwd=cwd)
+            problems = report.violations(budget)
+            failed = failed or bool(problems)
+            status = "FAIL " + ", ".join(problems) if problems else "ok"
+            print(
+                f"tg-signer {' '.join(args):<20} {report.total_ms:8.1f}ms"
+                f"  budget {budget.max_ms:.0f}ms  {status}"
+            )
+            for name, ms in report.heaviest():
+                print(f"    {ms:8.1f}ms  {name}")
+    if options.check and failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Measure how long queueing messages for the JSONL file forward takes on the
+event loop and how fast the writer thread drains them to disk::
+
+    python benchmarks/bench_file_sink.py --messages 100000 --compress gzip
+"""
+
+import argparse
+import tempfile
+import time
+from datetime import datetime
+
+from pyrogram import enums
+from pyrogram.types import Chat, Message, User
+
+from tg_signer.filesink import JsonlFileSink
+
+
+def make_message(n: int) -> Message:
+    return Message(
+        id=n,
+        date=datetime.now(),
+        chat=Chat(id=-1001234567890, type=enums.ChatType.SUPERGROUP, title="group"),
+        from_user=User(id=42, is_bot=False, first_name="neo"),
+        text=f"新的抽奖已经创建... 参与关键词：「我要抽奖」 #{n}",
+    )
+
+
+def main(messages: int, compress: str, max_bytes: int):
+    batch = [make_message(n) for n in range(messages)]
+    with tempfile.TemporaryDirectory() as directory:
+        sink = JsonlFileSink(directory, max_bytes=max_bytes, compress=compress or None)
+        sink.start()
+        start = time.perf_counter()
+        for message in batch:
+            sink.write(message)
+        queued = time.perf_counter() - start
+        while sink.written + sink.dropped < messages:
+            time.sleep(0.001)
+        drained = time.perf_counter() - start
+        sink.close()
+        closed = time.perf_counter() - start
+    print(f"messages: {messages}, compress: {compress or 'none'}")
+    print(
+        f"queue:  {queued:.3f}s ({messages / queued:,.0f} msgs/s,"
+        f" {queued / messages * 1e6:.2f}us per message on the event loop)"
+    )
+    print(f"drain:  {drained:.3f}s ({messages / drained:,.0f} msgs/s to disk)")
+    print(f"close:  {closed:.3f}s (including compression), dropped: {sink.dropped}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--compress", choices=["", "gzip", "zstd"], default="")
+    parser.add_argument("--max-bytes", type=int, default=16 * 1024 * 1024)
+    args = parser.parse_args()
+    main(args.messages, args.compress, args.max_bytes)
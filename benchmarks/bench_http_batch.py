@@ -0,0 +1,124 @@
+"""
+Measure HTTP callback delivery throughput through the outbox for different
+batch sizes against a local HTTP server::
+
+    python benchmarks/bench_http_batch.py --events 2000 --batch-sizes 1,10,50,200
+
+Batch size 1 uses the per-message `http` delivery, larger sizes the batched
+`http_batch` delivery (one JSON array per request).
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import tempfile
+import time
+
+from tg_signer.outbox import Outbox, OutboxDispatcher, get_outbox_file
+
+MESSAGE = json.dumps(
+    {
+        "_": "Message",
+        "id": 2950,
+        "chat": {"_": "Chat", "id": -1001234567890, "type": "ChatType.SUPERGROUP"},
+        "text": "新的抽奖已经创建... 参与关键词：「我要抽奖」",
+    },
+    ensure_ascii=False,
+)
+
+
+class CountingServer:
+    """Minimal HTTP/1.1 server counting the messages it receives."""
+
+    def __init__(self):
+        self.items = 0
+        self.requests = 0
+        self.server = None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                headers = {}
+                for line in head.decode("latin-1").split("\r\n")[1:]:
+                    if ":" in line:
+                        key, value = line.split(":", 1)
+                        headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                if headers.get("content-encoding") == "gzip":
+                    body = gzip.decompress(body)
+                data = json.loads(body)
+                self.items += len(data) if isinstance(data, list) else 1
+                self.requests += 1
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}/messages"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+async def measure(events: int, batch_size: int, use_gzip: bool, linger_ms: int):
+    server = CountingServer()
+    url = await server.start()
+    with tempfile.TemporaryDirectory() as workdir:
+        dispatcher = OutboxDispatcher(Outbox(get_outbox_file(workdir)))
+        payload = {
+            "url": url,
+            "headers": {"Content-Type": "application/json"},
+            "content": MESSAGE,
+        }
+        kind = "http"
+        if batch_size > 1:
+            kind = "http_batch"
+            payload.update(
+                max_batch_size=batch_size, linger_ms=linger_ms, gzip=use_gzip
+            )
+        start = time.perf_counter()
+        dispatcher.start()
+        for _ in range(events):
+            dispatcher.submit(kind, url, payload)
+        while server.items < events:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        await dispatcher.release()
+        dispatcher.outbox.close()
+    await server.stop()
+    return elapsed, server.requests
+
+
+async def main(events: int, batch_sizes: list[int], use_gzip: bool, linger_ms: int):
+    print(f"events: {events}, gzip: {use_gzip}, linger_ms: {linger_ms}")
+    for batch_size in batch_sizes:
+        elapsed, requests = await measure(events, batch_size, use_gzip, linger_ms)
+        print(
+            f"batch size {batch_size:>4}: {events / elapsed:8.0f} events/s,"
+            f" {requests} requests, {elapsed:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--batch-sizes", default="1,10,50,200")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--linger-ms", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(
+        main(
+            args.events,
+            [int(size) for size in args.batch_sizes.split(",")],
+            args.gzip,
+            args.linger_ms,
+        )
+    )
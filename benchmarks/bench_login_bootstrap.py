@@ -0,0 +1,101 @@
+"""
+Measure login bootstrap time and RPC count for many accounts, cold vs warm.
+
+Telegram is simulated with fixed latencies, so the numbers show the cost of
+the bootstrap itself rather than of the network::
+
+    python benchmarks/bench_login_bootstrap.py --accounts 100
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+import tg_signer.core as core
+from tg_signer.core import UserSigner
+
+RPC_LATENCY = {"start": 0.3, "get_me": 0.1, "get_dialogs": 0.4}
+
+
+def patch_client(rpc_counter: Counter):
+    async def fake_start(self):
+        rpc_counter["start"] += 1
+        await asyncio.sleep(RPC_LATENCY["start"])
+
+    async def fake_stop(self):
+        await asyncio.sleep(0)
+
+    async def fake_get_me(self):
+        rpc_counter["get_me"] += 1
+        await asyncio.sleep(RPC_LATENCY["get_me"])
+        return SimpleNamespace(id=abs(hash(self.name)) % 10**9, first_name=self.name)
+
+    async def fake_get_dialogs(self, limit):
+        rpc_counter["get_dialogs"] += 1
+        await asyncio.sleep(RPC_LATENCY["get_dialogs"])
+        for i in range(limit):
+            yield SimpleNamespace(
+                chat=SimpleNamespace(
+                    id=-1000 - i,
+                    title=f"chat-{i}",
+                    type=core.ChatType.SUPERGROUP,
+                    username=None,
+                    first_name=None,
+                    last_name=None,
+                    is_forum=False,
+                )
+            )
+
+    async def fake_save_session_string(self):
+        await asyncio.sleep(0)
+
+    core.Client.start = fake_start
+    core.Client.stop = fake_stop
+    core.Client.get_me = fake_get_me
+    core.Client.get_dialogs = fake_get_dialogs
+    core.Client.save_session_string = fake_save_session_string
+    core.print_to_user = lambda *_args, **_kwargs: None
+
+
+async def bootstrap(accounts: int, workdir: str) -> tuple[float, Counter]:
+    # every run simulates a fresh process
+    core._CLIENT_INSTANCES.clear()
+    core._LOGIN_USERS.clear()
+    core._API_LAST_CALL_AT.clear()
+    core._API_ASYNC_LOCKS.clear()
+    core._LOGIN_ASYNC_LOCKS.clear()
+    core._CLIENT_ASYNC_LOCKS.clear()
+    core._CLIENT_REFS.clear()
+    rpc_counter = Counter()
+    patch_client(rpc_counter)
+    signers = [
+        UserSigner(
+            task_name="bench",
+            account=f"acct_{i}",
+            session_dir=workdir,
+            workdir=f"{workdir}/.signer",
+        )
+        for i in range(accounts)
+    ]
+    start = time.perf_counter()
+    await asyncio.gather(*(s.login(num_of_dialogs=50) for s in signers))
+    return time.perf_counter() - start, rpc_counter
+
+
+async def main(accounts: int):
+    with tempfile.TemporaryDirectory() as workdir:
+        cold, cold_rpcs = await bootstrap(accounts, workdir)
+        warm, warm_rpcs = await bootstrap(accounts, workdir)
+    print(f"accounts: {accounts}")
+    print(f"cold: {cold:.3f}s, rpcs: {sum(cold_rpcs.values())} {dict(cold_rpcs)}")
+    print(f"warm: {warm:.3f}s, rpcs: {sum(warm_rpcs.values())} {dict(warm_rpcs)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--accounts", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.accounts))
@@ -5,6 +5,8 @@ from tg_signer.core import UserSigner
 
 def _clear_core_client_state():
     import tg_signer.core as core
+    import tg_signer.tasks as tasks
+    import tg_signer.update_pool as update_pool
 
     core._CLIENT_INSTANCES.clear()
     core._CLIENT_REFS.clear()
@@ -13,6 +15,9 @@ def _clear_core_client_state():
     core._LOGIN_USERS.clear()
     core._API_ASYNC_LOCKS.clear()
     core._API_LAST_CALL_AT.clear()
+    update_pool._UPDATE_POOL = None
+    update_pool._UPDATE_POOL_SIZE = None
+    tasks._CONFIG_CACHE.clear()
 
 
 @pytest.fixture(autouse=True)
@@ -0,0 +1,113 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from tg_signer.archive import (
+    ArchiveWriter,
+    MessageArchive,
+    archive_record,
+    get_archive_file,
+)
+
+
+def make_message(message_id, text, chat_id=-100, sender_id=1, date=None, **chat):
+    return SimpleNamespace(
+        id=message_id,
+        text=text,
+        date=date or datetime(2024, 1, 1, 12, 0),
+        chat=SimpleNamespace(id=chat_id, title=chat.get("title", "群组"), **chat),
+        from_user=SimpleNamespace(
+            id=sender_id, username=f"user{sender_id}", first_name="张", last_name="三"
+        ),
+    )
+
+
+def make_archive(tmp_path, messages) -> MessageArchive:
+    archive = MessageArchive(get_archive_file(tmp_path))
+    archive.add_many([archive_record(42, message) for message in messages])
+    return archive
+
+
+def test_archive_record_extracts_chat_and_sender():
+    record = archive_record(42, make_message(7, "hi", username="chan"))
+    assert record == (
+        42,
+        -100,
+        7,
+        "群组",
+        "chan",
+        1,
+        "user1",
+        "张 三",
+        datetime(2024, 1, 1, 12, 0).timestamp(),
+        "hi",
+    )
+
+
+def test_search_by_text_including_chinese(tmp_path):
+    archive = make_archive(
+        tmp_path,
+        [
+            make_message(1, "新的抽奖已经创建，参与关键词：我要抽奖"),
+            make_message(2, "hello world"),
+            make_message(3, "今天天气不错"),
+        ],
+    )
+    assert [r["message_id"] for r in archive.search("我要抽奖")] == [1]
+    assert [r["message_id"] for r in archive.search("world")] == [2]
+    # shorter than a trigram
+    assert [r["message_id"] for r in archive.search("天气")] == [3]
+    # FTS5 syntax is matched literally
+    assert archive.search('"AND') == []
+    assert archive.count() == 3
+
+
+def test_search_filters_by_chat_sender_and_date(tmp_path):
+    archive = make_archive(
+        tmp_path,
+        [
+            make_message(1, "抽奖开始", chat_id=-100, sender_id=1, username="lucky"),
+            make_message(2, "抽奖开始", chat_id=-200, sender_id=2),
+            make_message(
+                3, "抽奖开始", chat_id=-100, sender_id=2, date=datetime(2024, 2, 1)
+            ),
+        ],
+    )
+    assert {r["message_id"] for r in archive.search("抽奖", chat="-100")} == {1, 3}
+    assert [r["message_id"] for r in archive.search(chat="@LUCKY")] == [1]
+    assert {r["message_id"] for r in archive.search(sender="user2")} == {2, 3}
+    assert [r["message_id"] for r in archive.search(sender="1")] == [1]
+    assert [r["message_id"] for r in archive.search(since=datetime(2024, 1, 15))] == [3]
+    assert archive.count("抽奖", until=datetime(2024, 1, 15)) == 2
+
+
+def test_search_pages_newest_first(tmp_path):
+    archive = make_archive(
+        tmp_path,
+        [
+            make_message(i, f"message {i}", date=datetime(2024, 1, 1, 0, i))
+            for i in range(1, 6)
+        ],
+    )
+    first = archive.search("message", limit=2)
+    second = archive.search("message", limit=2, offset=2)
+    assert [r["message_id"] for r in first + second] == [5, 4, 3, 2]
+
+
+def test_rewriting_a_message_updates_the_index(tmp_path):
+    archive = make_archive(tmp_path, [make_message(1, "old text")])
+    archive.add_many([archive_record(42, make_message(1, "new keyword"))])
+    assert archive.search("old text") == []
+    [row] = archive.search("keyword")
+    assert row["text"] == "new keyword"
+    assert archive.count() == 1
+
+
+def test_writer_batches_records_in_the_background(tmp_path):
+    writer = ArchiveWriter(MessageArchive(get_archive_file(tmp_path)))
+    writer.start()
+    for i in range(1200):
+        assert writer.write(archive_record(42, make_message(i, f"消息 {i}")))
+    writer.close()
+    assert writer.written == 1200
+    assert not writer.write(archive_record(42, make_message(0, "late")))
+    assert MessageArchive(get_archive_file(tmp_path)).count() == 1200
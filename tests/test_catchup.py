@@ -0,0 +1,22 @@
+from tg_signer.catchup import LastMessageIds
+
+
+def test_last_message_ids_only_move_forward_and_persist(tmp_path):
+    path = tmp_path / "user" / "last_message_ids.json"
+    ids = LastMessageIds(path)
+    ids.update(-100, 5)
+    ids.update(-100, 3)
+    ids.update(-200, 1)
+    ids.save()
+
+    reloaded = LastMessageIds(path)
+    assert reloaded.get(-100) == 5
+    assert sorted(reloaded.chat_ids()) == [-200, -100]
+
+
+def test_last_message_ids_ignores_a_corrupt_file(tmp_path):
+    path = tmp_path / "last_message_ids.json"
+    path.write_text("{", encoding="utf-8")
+    ids = LastMessageIds(path)
+    assert len(ids) == 0
+    assert ids.get(-100) is None
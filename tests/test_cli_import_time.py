@@ -0,0 +1,41 @@
+import importlib.util
+import pathlib
+
+import pytest
+
+BENCH_FILE = pathlib.Path(__file__).parents[1] / "benchmarks" / "bench_cli_import.py"
+
+
+def load_bench():
+    spec = importlib.util.spec_from_file_location("bench_cli_import", BENCH_FILE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+bench = load_bench()
+
+
+def test_parse_importtime_only_counts_tg_signer_imports():
+    stderr = "\n".join(
+        [
+            "import time: self [us] | cumulative | imported package",
+            "import time:       100 |       5000 | site",
+            "import time:       200 |        200 |   click.core",
+            "import time:       300 |       3000 | tg_signer.cli",
+            "import time:       400 |       1000 | tg_signer.logger",
+        ]
+    )
+
+    modules, loaded = bench.parse_importtime(stderr)
+
+    assert modules == {"tg_signer.cli": 3.0, "tg_signer.logger": 1.0}
+    assert {"site", "click.core", "tg_signer.cli"} <= loaded
+
+
+@pytest.mark.parametrize("args", list(bench.BUDGETS), ids=" ".join)
+def test_cli_import_budget(args, tmp_path):
+    report = bench.measure(args, cwd=str(tmp_path))
+
+    assert report.modules, "tg-signer was not imported"
+    assert report.violations(bench.BUDGETS[args]) == []
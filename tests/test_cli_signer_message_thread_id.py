@@ -71,12 +71,13 @@ class DummySigner:
             }
         )
 
-    async def list_topics(self, chat_id, limit=20):
+    async def list_topics(self, chat_id, limit=20, refresh=False):
         self.calls.append(
             {
                 "method": "list_topics",
                 "chat_id": chat_id,
                 "limit": limit,
+                "refresh": refresh,
             }
         )
 
@@ -144,3 +145,81 @@ def test_list_topics(dummy_signer, runner):
     assert dummy_signer.calls[0]["method"] == "list_topics"
     assert dummy_signer.calls[0]["chat_id"] == -1003763902761
     assert dummy_signer.calls[0]["limit"] == 50
+
+
+def test_list_topics_refresh(dummy_signer, runner):
+    result = runner.invoke(
+        signer_cli.tg_signer,
+        ["list-topics", "--chat_id", "@forum", "--refresh"],
+    )
+
+    assert result.exit_code == 0
+    assert dummy_signer.calls[0]["chat_id"] == "forum"
+    assert dummy_signer.calls[0]["refresh"] is True
+
+
+def test_send_text_is_forwarded_to_daemon(monkeypatch, runner):
+    import tg_signer.daemon as daemon
+
+    calls = []
+
+    def fake_call_daemon(socket_path, account_key, method, params):
+        calls.append((str(socket_path), account_key, method, params))
+        return ["sent"]
+
+    def fail_get_signer(*_args, **_kwargs):
+        raise AssertionError("should not start a local client")
+
+    monkeypatch.setattr(daemon, "call_daemon", fake_call_daemon)
+    monkeypatch.setattr(signer_cli, "get_signer", fail_get_signer)
+    result = runner.invoke(
+        signer_cli.tg_signer,
+        ["--daemon-socket", "d.sock", "send-text", "123456", "checkin"],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "sent" in result.output
+    [(socket_path, account_key, method, params)] = calls
+    assert socket_path == "d.sock"
+    assert account_key.endswith("my_account")
+    assert method == "send_text"
+    assert params["chat_id"] == 123456
+
+
+def test_no_daemon_runs_locally(monkeypatch, dummy_signer, runner):
+    import tg_signer.daemon as daemon
+
+    def fail_call_daemon(*_args, **_kwargs):
+        raise AssertionError("should not contact the daemon")
+
+    monkeypatch.setattr(daemon, "call_daemon", fail_call_daemon)
+    result = runner.invoke(
+        signer_cli.tg_signer, ["--no-daemon", "send-text", "123456", "checkin"]
+    )
+
+    assert result.exit_code == 0
+    assert dummy_signer.calls[0]["method"] == "send_text"
+
+
+def test_offline_commands_do_not_create_a_client(monkeypatch, runner, tmp_path):
+    import tg_signer.core as core
+
+    def fail_get_client(*_args, **_kwargs):
+        raise AssertionError("offline commands must not create a client")
+
+    monkeypatch.setattr(core, "get_client", fail_get_client)
+    workdir = str(tmp_path / ".signer")
+    config = '{"chats": [], "sign_at": "0 6 * * *"}'
+    config_file = tmp_path / "config.json"
+    config_file.write_text(config, encoding="utf-8")
+
+    result = runner.invoke(
+        signer_cli.tg_signer,
+        ["-w", workdir, "import", "-I", str(config_file), "mytask"],
+    )
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(signer_cli.tg_signer, ["-w", workdir, "export", "mytask"])
+    assert result.exit_code == 0, result.output
+    assert result.output.strip() == config
+    result = runner.invoke(signer_cli.tg_signer, ["-w", workdir, "list"])
+    assert result.output.split() == ["mytask"]
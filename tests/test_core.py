@@ -1,10 +1,12 @@
 import asyncio
+import json
 import pathlib
 from datetime import datetime, timezone
 from types import SimpleNamespace
 from unittest.mock import AsyncMock
 
 import pytest
+from pyrogram import Client as BaseClient
 
 from tg_signer.config import SendTextAction, SignChatV3
 from tg_signer.core import (
@@ -12,8 +14,10 @@ from tg_signer.core import (
     ChatType,
     chat_has_forum_topics,
     get_client,
+    get_now,
     readable_chat,
 )
+from tg_signer.update_pool import UpdateWorkerPool, get_update_pool
 
 
 class TestBaseUserWorker:
@@ -504,7 +508,7 @@ async def test_client_get_forum_topics_handles_missing_top_message(
     signer = signer_factory()
     invoke_calls = []
 
-    async def direct_call(_api_name, func):
+    async def direct_call(_api_name, func, **_kwargs):
         return await func()
 
     async def fake_resolve_peer(chat_id):
@@ -855,3 +859,1305 @@ async def test_get_schedule_messages_calls_chat_level_api(monkeypatch, signer_fa
     await signer.get_schedule_messages(-1003763902761)
 
     assert calls[0]["kwargs"] == {}
+
+
+def make_route_message(chat_id, message_thread_id=None, username=None, text="hi"):
+    return SimpleNamespace(
+        chat=SimpleNamespace(id=chat_id, username=username),
+        message_thread_id=message_thread_id,
+        id=1,
+        text=text,
+    )
+
+
+@pytest.mark.asyncio
+async def test_route_dispatcher_delivers_only_to_interested_workers(signer_factory):
+    signer1 = signer_factory(task_name="task_a")
+    signer2 = signer_factory(task_name="task_b")
+    dispatcher = signer1.app.route_dispatcher
+    assert signer2.app.route_dispatcher is dispatcher
+
+    received = []
+
+    async def on_message_a(_client, message):
+        received.append(("a", message.chat.id))
+
+    async def on_message_b(_client, message):
+        received.append(("b", message.chat.id))
+
+    dispatcher.subscribe(signer1, [(-100, 11)], on_message=on_message_a)
+    dispatcher.subscribe(
+        signer2, [(-200, None), ("@Foo", None)], on_message=on_message_b
+    )
+
+    await dispatcher.dispatch_message(signer1.app, make_route_message(-100, 11))
+    await dispatcher.dispatch_message(signer1.app, make_route_message(-100, 22))
+    await dispatcher.dispatch_message(signer1.app, make_route_message(-200, 5))
+    await dispatcher.dispatch_message(
+        signer1.app, make_route_message(-300, username="foo")
+    )
+    await get_update_pool().join()
+
+    assert sorted(received) == [("a", -100), ("b", -300), ("b", -200)]
+
+
+@pytest.mark.asyncio
+async def test_route_dispatcher_registration_is_idempotent(monkeypatch, signer_factory):
+    signer = signer_factory()
+    dispatcher = signer.app.route_dispatcher
+    added = []
+    monkeypatch.setattr(
+        signer.app, "add_handler", lambda handler, group=0: added.append(handler)
+    )
+    calls = []
+
+    async def on_message(_client, message):
+        calls.append(message)
+
+    for _ in range(3):
+        dispatcher.subscribe(signer, [(-100, None)], on_message=on_message)
+
+    await dispatcher.dispatch_message(signer.app, make_route_message(-100))
+    await get_update_pool().join()
+
+    assert len(added) == 2
+    assert len(calls) == 1
+
+    signer.unsubscribe_routes()
+    await dispatcher.dispatch_message(signer.app, make_route_message(-100))
+
+    assert len(calls) == 1
+    assert dispatcher.routes == set()
+    assert not dispatcher.is_subscribed(signer)
+
+
+@pytest.mark.asyncio
+async def test_route_dispatcher_applies_message_filter(signer_factory):
+    signer = signer_factory()
+    dispatcher = signer.app.route_dispatcher
+    calls = []
+
+    async def on_message(_client, message):
+        calls.append(message.text)
+
+    dispatcher.subscribe(
+        signer,
+        [(-100, None)],
+        on_message=on_message,
+        message_filter=lambda message: bool(message.text),
+    )
+
+    await dispatcher.dispatch_message(signer.app, make_route_message(-100, text=None))
+    await dispatcher.dispatch_message(signer.app, make_route_message(-100, text="ok"))
+    await dispatcher.dispatch_edited_message(
+        signer.app, make_route_message(-100, text="edited")
+    )
+    await get_update_pool().join()
+
+    assert calls == ["ok"]
+
+
+def test_get_client_uses_single_handler_worker(tmp_path):
+    client = get_client(name="acct", workdir=tmp_path)
+
+    assert client.workers == 1
+    # the thread pool keeps pyrogram's default size
+    assert client.executor._max_workers == BaseClient.WORKERS
+
+
+@pytest.mark.asyncio
+async def test_update_pool_keeps_order_per_chat_and_runs_chats_in_parallel():
+    pool = UpdateWorkerPool(size=4)
+    events = []
+    release = asyncio.Event()
+
+    def job(chat_id, seq, blocker=None):
+        async def run():
+            if blocker is not None:
+                await blocker.wait()
+            events.append((chat_id, seq))
+
+        return run
+
+    chat_a, chat_b = 1, 2
+
+    await pool.submit(chat_a, job(chat_a, 1, blocker=release))
+    await pool.submit(chat_a, job(chat_a, 2))
+    await pool.submit(chat_b, job(chat_b, 1))
+    await asyncio.sleep(0.01)
+
+    # chat_b is not blocked by the slow update of chat_a
+    assert events == [(chat_b, 1)]
+    stats = pool.stats()
+    assert stats["queued"] == 1
+    assert stats["queue_depths"] == {chat_a: 1}
+    assert stats["running"] == 1
+
+    release.set()
+    await pool.join()
+
+    assert events == [(chat_b, 1), (chat_a, 1), (chat_a, 2)]
+    stats = pool.stats()
+    assert stats["size"] == 4
+    assert stats["submitted"] == stats["processed"] == 3
+    assert stats["max_depth"] >= 1
+    await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_update_pool_is_shared_and_configurable():
+    import tg_signer.update_pool as update_pool
+
+    update_pool.configure_update_pool(3)
+
+    pool = get_update_pool()
+
+    assert pool is get_update_pool()
+    assert pool.size == 3
+
+
+@pytest.mark.asyncio
+async def test_update_pool_counts_failed_jobs():
+    pool = UpdateWorkerPool(size=1)
+
+    async def boom():
+        raise RuntimeError("boom")
+
+    await pool.submit(1, boom)
+    await pool.join()
+
+    assert pool.stats()["failed"] == 1
+    await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_update_pool_drops_drained_chats_and_logs_stats(monkeypatch, caplog):
+    import tg_signer.update_pool as update_pool
+
+    monkeypatch.setattr(update_pool, "STATS_LOG_INTERVAL", 0.01)
+    pool = UpdateWorkerPool(size=2)
+
+    async def noop():
+        pass
+
+    for chat_id in range(3):
+        await pool.submit(chat_id, noop)
+    await pool.join()
+    with caplog.at_level("INFO", logger="tg-signer"):
+        await asyncio.sleep(0.05)
+
+    assert pool.stats()["chats"] == 0
+    assert sum("更新处理池: 已提交3" in r.message for r in caplog.records) == 1
+    await pool.stop()
+
+
+def count_login_rpcs(monkeypatch, core):
+    monkeypatch.setattr(core, "_API_MIN_INTERVAL_SECONDS", 0.0)
+    calls = {"get_me": 0, "get_dialogs": 0, "start": 0}
+
+    async def fake_start(self):
+        calls["start"] += 1
+
+    async def fake_get_me(self):
+        calls["get_me"] += 1
+        return SimpleNamespace(id=123456, first_name="me", username="me")
+
+    async def fake_get_dialogs(self, limit):
+        del limit
+        calls["get_dialogs"] += 1
+        yield SimpleNamespace(
+            chat=SimpleNamespace(
+                id=10001,
+                title="test-chat",
+                type=ChatType.SUPERGROUP,
+                username=None,
+                first_name=None,
+                last_name=None,
+                is_forum=False,
+            )
+        )
+
+    patch_client_methods(
+        monkeypatch,
+        core,
+        start=fake_start,
+        get_me=fake_get_me,
+        get_dialogs=fake_get_dialogs,
+    )
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_login_uses_disk_cache_on_warm_restart(monkeypatch, signer_factory):
+    import tg_signer.core as core
+
+    calls = count_login_rpcs(monkeypatch, core)
+    outputs = collect_outputs(monkeypatch, core)
+
+    await signer_factory().login(num_of_dialogs=20, print_chat=False)
+    assert calls == {"get_me": 1, "get_dialogs": 1, "start": 1}
+
+    # simulate a new process
+    core._LOGIN_USERS.clear()
+    core._CLIENT_INSTANCES.clear()
+    signer = signer_factory()
+    await signer.login(num_of_dialogs=20, print_chat=True)
+
+    assert calls == {"get_me": 1, "get_dialogs": 1, "start": 1}
+    assert signer.user.id == 123456
+    assert any("test-chat" in str(message) for message in outputs)
+    assert any("超级群组" in str(message) for message in outputs)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "kwargs, num_of_dialogs",
+    [
+        pytest.param({"refresh": True}, 20, id="refresh"),
+        pytest.param({}, 50, id="more-dialogs"),
+    ],
+)
+async def test_login_cache_is_bypassed(
+    monkeypatch, signer_factory, kwargs, num_of_dialogs
+):
+    import tg_signer.core as core
+
+    calls = count_login_rpcs(monkeypatch, core)
+    await signer_factory().login(num_of_dialogs=20, print_chat=False)
+
+    core._LOGIN_USERS.clear()
+    core._CLIENT_INSTANCES.clear()
+    await signer_factory().login(
+        num_of_dialogs=num_of_dialogs, print_chat=False, **kwargs
+    )
+
+    assert calls["get_me"] == 2
+    assert calls["get_dialogs"] == 2
+
+
+@pytest.mark.asyncio
+async def test_login_cache_expires(monkeypatch, signer_factory):
+    import tg_signer.core as core
+
+    calls = count_login_rpcs(monkeypatch, core)
+    monkeypatch.setenv(core.LOGIN_CACHE_TTL_ENV, "0.001")
+
+    await signer_factory().login(num_of_dialogs=20, print_chat=False)
+    core._LOGIN_USERS.clear()
+    core._CLIENT_INSTANCES.clear()
+    await asyncio.sleep(0.01)
+    await signer_factory().login(num_of_dialogs=20, print_chat=False)
+
+    assert calls["get_me"] == 2
+
+
+@pytest.mark.asyncio
+async def test_login_discovers_forum_topics_concurrently_with_a_bound(
+    monkeypatch, signer_factory
+):
+    import tg_signer.core as core
+
+    monkeypatch.setattr(core, "_API_MIN_INTERVAL_SECONDS", 0.0)
+    chats = [
+        SimpleNamespace(
+            id=-2000 - i,
+            title=f"forum-{i}",
+            type=ChatType.FORUM,
+            username=None,
+            first_name=None,
+            last_name=None,
+            is_forum=True,
+        )
+        for i in range(10)
+    ]
+    outputs = setup_login_test(monkeypatch, core, chats)
+    active = 0
+    max_active = 0
+
+    async def fake_get_forum_topics(self, chat_id, limit=20):
+        nonlocal active, max_active
+        active += 1
+        max_active = max(max_active, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        yield SimpleNamespace(id=abs(chat_id), title="General")
+
+    monkeypatch.setattr(core.Client, "get_forum_topics", fake_get_forum_topics)
+
+    signer = signer_factory()
+    await signer.login(num_of_dialogs=20, print_chat=True)
+
+    assert 1 < max_active <= core._TOPIC_DISCOVERY_CONCURRENCY
+    assert any("message_thread_id: 2009" in str(message) for message in outputs)
+    cached = signer.load_cached_topics(-2009)
+    assert [topic.id for topic in cached] == [2009]
+
+
+@pytest.mark.asyncio
+async def test_list_topics_reads_from_cache(monkeypatch, signer_factory):
+    import tg_signer.core as core
+
+    outputs = collect_outputs(monkeypatch, core)
+    signer = signer_factory()
+    signer.user = SimpleNamespace(id=1)
+    signer.save_cached_topics(
+        signer.get_forum_topics_cache(),
+        {-1001: [SimpleNamespace(id=7, title="cached")]},
+        limit=20,
+    )
+    signer.get_forum_topics = AsyncMock(
+        return_value=[SimpleNamespace(id=8, title="fresh")]
+    )
+
+    topics = await signer.list_topics(-1001, limit=20)
+
+    signer.get_forum_topics.assert_not_awaited()
+    assert [topic.id for topic in topics] == [7]
+    assert any("title: cached" in str(message) for message in outputs)
+
+    monkeypatch.setattr(core.Client, "start", AsyncMock())
+    monkeypatch.setattr(core.Client, "stop", AsyncMock())
+    topics = await signer.list_topics(-1001, limit=20, refresh=True)
+
+    assert [topic.id for topic in topics] == [8]
+    assert [topic.id for topic in signer.load_cached_topics(-1001)] == [8]
+
+
+def test_load_cached_topics_misses_when_cached_page_was_smaller(signer_factory):
+    signer = signer_factory()
+    signer.user = SimpleNamespace(id=1)
+    cache = signer.get_forum_topics_cache()
+    topics = [SimpleNamespace(id=i, title=str(i)) for i in range(5)]
+    signer.save_cached_topics(cache, {-1: topics, -2: topics[:2]}, limit=5)
+
+    assert signer.load_cached_topics(-1, limit=50, cache=cache) is None
+    assert len(signer.load_cached_topics(-1, limit=3, cache=cache)) == 3
+    # fewer topics than the limit: the chat has no more topics
+    assert len(signer.load_cached_topics(-2, limit=50, cache=cache)) == 2
+
+
+@pytest.mark.asyncio
+async def test_in_memory_client_persists_peers_across_restarts(monkeypatch, tmp_path):
+    import tg_signer.core as core
+
+    async def fake_load_session(self):
+        await self.storage.open()
+
+    monkeypatch.setattr(core.BaseClient, "load_session", fake_load_session)
+
+    client = get_client("acct", workdir=tmp_path, in_memory=True)
+    assert client.persists_peers
+    await client.load_session()
+    await client.storage.update_peers([(-1000000010001, 42, "supergroup", None)])
+    await client.storage.update_usernames([(-1000000010001, ["forum"])])
+    assert await client.save_peer_cache() == 1
+
+    core._CLIENT_INSTANCES.clear()
+    client = get_client("acct", workdir=tmp_path, in_memory=True)
+    await client.load_session()
+
+    peer = await client.storage.get_peer_by_id(-1000000010001)
+    assert peer.access_hash == 42
+    peer = await client.storage.get_peer_by_username("forum")
+    assert peer.channel_id == 10001
+
+
+def test_file_session_client_does_not_persist_peers(tmp_path):
+    client = get_client("acct", workdir=tmp_path)
+
+    assert not client.persists_peers
+
+
+def make_username_monitor(monkeypatch, signer_factory, usernames):
+    import tg_signer.core as core
+    from tg_signer.config import MatchConfig, MonitorConfig
+
+    monkeypatch.setattr(core, "_API_MIN_INTERVAL_SECONDS", 0.0)
+    calls = []
+
+    async def fake_get_chat(self, chat_id):
+        calls.append(chat_id)
+        return SimpleNamespace(id=usernames[chat_id])
+
+    monkeypatch.setattr(core.Client, "get_chat", fake_get_chat)
+    monitor = signer_factory(cls=core.UserMonitor)
+    monitor.set_me(SimpleNamespace(id=123456))
+    config = MonitorConfig(
+        match_cfgs=[
+            MatchConfig(chat_id="@group", rule="all", from_user_ids=["@alice"]),
+            MatchConfig(chat_id=-100888, rule="contains", rule_value="hi"),
+        ]
+    )
+    return monitor, config, calls
+
+
+@pytest.mark.asyncio
+async def test_monitor_resolves_usernames_once_and_indexes_ids(
+    monkeypatch, signer_factory
+):
+    usernames = {"group": -100777, "alice": 42}
+    monitor, config, calls = make_username_monitor(
+        monkeypatch, signer_factory, usernames
+    )
+
+    resolved = await monitor.resolve_usernames(config.usernames)
+    assert resolved == usernames
+    assert sorted(calls) == ["alice", "group"]
+
+    # cached on disk
+    assert await monitor.resolve_usernames(config.usernames) == usernames
+    assert len(calls) == 2
+
+    monitor.apply_match_index(monitor.build_match_index(config, resolved))
+    assert set(monitor.match_index) == {-100777, -100888}
+    assert monitor.app.route_dispatcher.is_subscribed(monitor)
+    [match_cfg] = monitor.matchers_for(SimpleNamespace(id=-100777, username="group"))
+    assert match_cfg.from_user_ids == [42]
+    assert monitor.matchers_for(SimpleNamespace(id=1, username="group")) == []
+
+
+@pytest.mark.asyncio
+async def test_monitor_background_refresh_picks_up_username_changes(
+    monkeypatch, signer_factory
+):
+    usernames = {"group": -100777, "alice": 42}
+    monitor, config, calls = make_username_monitor(
+        monkeypatch, signer_factory, usernames
+    )
+    resolved = await monitor.resolve_usernames(config.usernames)
+    monitor.apply_match_index(monitor.build_match_index(config, resolved))
+
+    usernames["group"] = -100999
+    monitor.config = config
+    task = asyncio.create_task(monitor.refresh_usernames(interval=0))
+    for _ in range(20):
+        await asyncio.sleep(0)
+        if -100999 in monitor.match_index:
+            break
+    task.cancel()
+
+    assert set(monitor.match_index) == {-100999, -100888}
+    assert monitor.get_username_cache().get("group") == -100999
+
+
+@pytest.mark.asyncio
+async def test_monitor_keeps_matching_unresolved_usernames(monkeypatch, signer_factory):
+    monitor, config, _ = make_username_monitor(monkeypatch, signer_factory, {})
+
+    import tg_signer.core as core
+
+    async def fail_get_chat(self, chat_id):
+        raise KeyError(chat_id)
+
+    monkeypatch.setattr(core.Client, "get_chat", fail_get_chat)
+    resolved = await monitor.resolve_usernames(config.usernames)
+    monitor.apply_match_index(monitor.build_match_index(config, resolved))
+
+    assert resolved == {}
+    [match_cfg] = monitor.matchers_for(SimpleNamespace(id=-100777, username="Group"))
+    assert match_cfg.chat_id == "@group"
+
+
+@pytest.mark.asyncio
+async def test_monitor_hot_reloads_config_without_reconnecting(
+    monkeypatch, signer_factory
+):
+    from tg_signer.config import MatchConfig, MonitorConfig
+
+    monitor, config, _ = make_username_monitor(
+        monkeypatch, signer_factory, {"group": -100777, "alice": 42}
+    )
+    monitor.write_config(config)
+    monitor.load_config()
+    await monitor.apply_config(config)
+    start = AsyncMock()
+    monkeypatch.setattr(monitor.app, "start", start)
+
+    watcher = asyncio.create_task(
+        monitor.watch_config(monitor.apply_config, interval=0)
+    )
+    try:
+        monitor.import_(
+            MonitorConfig(
+                match_cfgs=[MatchConfig(chat_id=-100555, rule="all")]
+            ).model_dump_json()
+        )
+        for _ in range(20):
+            await asyncio.sleep(0)
+            if -100555 in monitor.match_index:
+                break
+    finally:
+        watcher.cancel()
+
+    assert set(monitor.match_index) == {-100555}
+    assert monitor.app.route_dispatcher.routes == {(-100555, None)}
+    start.assert_not_called()
+
+
+def test_resume_index_replays_the_send_that_triggers_a_reply():
+    from tg_signer.config import ClickKeyboardByTextAction
+    from tg_signer.core import UserSigner
+
+    chat = SignChatV3(
+        chat_id=1,
+        actions=[
+            SendTextAction(text="a"),
+            ClickKeyboardByTextAction(text="ok"),
+            SendTextAction(text="b"),
+        ],
+    )
+
+    assert [UserSigner.get_resume_index(chat, done) for done in range(5)] == [
+        0,
+        0,
+        2,
+        3,
+        3,
+    ]
+
+
+def make_checkpoint_signer(monkeypatch, signer_factory, fail_times):
+    """`fail_times`: 每个(chat_id, text)在成功前失败的次数"""
+    import tg_signer.core as core
+    from tg_signer.config import SignConfigV3
+
+    monkeypatch.setattr(core.Client, "__aenter__", AsyncMock())
+    monkeypatch.setattr(core.Client, "__aexit__", AsyncMock(return_value=False))
+    monkeypatch.setattr(core, "_RETRY_BACKOFF_SECONDS", 0)
+    signer = signer_factory()
+    signer.user = SimpleNamespace(id=1)
+    signer.write_config(
+        SignConfigV3(
+            chats=[
+                SignChatV3(
+                    chat_id=chat_id,
+                    actions=[SendTextAction(text="a"), SendTextAction(text="b")],
+                    action_interval=0,
+                )
+                for chat_id in (1, 2, 3)
+            ],
+            sign_at="0 6 * * *",
+            sign_interval=0,
+        )
+    )
+    sent = []
+    remaining = dict(fail_times)
+
+    async def fake_wait_for(chat, action, **kwargs):
+        key = (chat.chat_id, action.text)
+        if remaining.get(key):
+            remaining[key] -= 1
+            raise core.SignActionTimeout("等待超时")
+        sent.append(key)
+
+    monkeypatch.setattr(signer, "wait_for", fake_wait_for)
+    return signer, sent
+
+
+@pytest.mark.asyncio
+async def test_rerun_skips_completed_chats_and_resumes_failed_action(
+    monkeypatch, signer_factory
+):
+    signer, sent = make_checkpoint_signer(monkeypatch, signer_factory, {(2, "b"): 1})
+
+    await signer.run_once(20)
+    assert sent == [(1, "a"), (1, "b"), (2, "a"), (3, "a"), (3, "b")]
+    checkpoints = signer.get_sign_record().load_checkpoints(
+        signer.get_sign_slot(signer.config, get_now())
+    )
+    assert checkpoints["2"] == {
+        "status": "failed",
+        "actions_done": 1,
+        "error": "等待超时",
+    }
+    assert checkpoints["3"]["status"] == "success"
+
+    sent.clear()
+    await signer.run_once(20)
+    assert sent == [(2, "b")]
+
+    sent.clear()
+    await signer.run_once(20)
+    assert sent == []
+
+    await signer.run_once(20, ignore_checkpoints=True)
+    assert len(sent) == 6
+
+
+@pytest.mark.asyncio
+async def test_retry_failed_retries_only_failures(monkeypatch, signer_factory):
+    from tg_signer.store import migrate_workdir
+
+    migrate_workdir(signer_factory().workdir)[0].close()
+    signer, sent = make_checkpoint_signer(
+        monkeypatch, signer_factory, {(1, "a"): 1, (3, "b"): 2}
+    )
+
+    await signer.run_once(20, retry_failed=1)
+    assert sent == [(2, "a"), (2, "b"), (3, "a"), (1, "a"), (1, "b")]
+    store = signer.get_sign_record().store
+    assert store.query_runs()[0]["status"] == "failed"
+
+    sent.clear()
+    await signer.run_once(20, retry_failed=1)
+    assert sent == [(3, "b")]
+    assert store.query_runs()[0]["status"] == "success"
+
+
+def make_reply(message_id, text, chat_id=1):
+    return SimpleNamespace(
+        id=message_id,
+        chat=SimpleNamespace(id=chat_id),
+        message_thread_id=None,
+        text=text,
+        caption=None,
+        photo=None,
+        reply_markup=None,
+        from_user=SimpleNamespace(username="bot", id=2),
+    )
+
+
+def make_flow_signer(signer_factory, chat):
+    signer = signer_factory()
+    signer.context = signer.ensure_ctx()
+    signer.context.sign_chats[(chat.chat_id, None)].append(chat)
+    sent = []
+
+    async def fake_send_message(chat_id, text, delete_after=None, **kwargs):
+        sent.append(text)
+
+    signer.send_message = fake_send_message
+    return signer, sent
+
+
+@pytest.mark.asyncio
+async def test_action_moves_on_as_soon_as_the_reply_arrives(signer_factory):
+    from tg_signer.config import ClickKeyboardByTextAction
+
+    chat = SignChatV3(
+        chat_id=1,
+        actions=[
+            SendTextAction(text="/checkin"),
+            ClickKeyboardByTextAction(text="签到"),
+        ],
+        action_interval=0,
+    )
+    signer, sent = make_flow_signer(signer_factory, chat)
+    clicked = []
+
+    async def fake_click(action, message):
+        clicked.append(message.id)
+        return message.text == "keyboard"
+
+    signer._click_keyboard_by_text = fake_click
+
+    async def bot_replies():
+        await asyncio.sleep(0.05)
+        await signer._on_message(None, make_reply(10, "hello"))
+        await asyncio.sleep(0.05)
+        await signer._on_message(None, make_reply(11, "keyboard"))
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await asyncio.gather(signer.sign_a_chat(chat), bot_replies())
+
+    assert loop.time() - started < 1
+    assert sent == ["/checkin"]
+    assert clicked[-1] == 11
+    assert signer.context.chat_messages[(1, None)][11] is None
+
+
+@pytest.mark.asyncio
+async def test_action_interval_is_a_minimum_gap(signer_factory):
+    chat = SignChatV3(
+        chat_id=1,
+        actions=[SendTextAction(text="a"), SendTextAction(text="b")],
+        action_interval=0.2,
+    )
+    signer, sent = make_flow_signer(signer_factory, chat)
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await signer.sign_a_chat(chat)
+    elapsed = loop.time() - started
+
+    assert sent == ["a", "b"]
+    # no trailing sleep after the last action
+    assert 0.2 <= elapsed < 0.35
+
+
+@pytest.mark.asyncio
+async def test_success_pattern_stops_the_flow_early(signer_factory):
+    from tg_signer.config import ClickKeyboardByTextAction
+
+    chat = SignChatV3(
+        chat_id=1,
+        actions=[
+            SendTextAction(text="/checkin", success_pattern="已经?签到"),
+            ClickKeyboardByTextAction(text="签到"),
+            SendTextAction(text="/balance"),
+        ],
+        action_interval=0,
+    )
+    signer, sent = make_flow_signer(signer_factory, chat)
+    done = []
+
+    async def bot_replies():
+        await asyncio.sleep(0.05)
+        await signer._on_message(None, make_reply(10, "你今天已经签到过了"))
+
+    await asyncio.gather(
+        signer.sign_a_chat(chat, on_action_done=done.append), bot_replies()
+    )
+
+    assert sent == ["/checkin"]
+    assert done == [1]
+    assert signer.context.chat_messages[(1, None)][10] is None
+
+
+def test_success_pattern_must_be_a_valid_regex():
+    from pydantic import ValidationError
+
+    with pytest.raises(ValidationError):
+        SendTextAction(text="a", success_pattern="(")
+    assert SendTextAction(text="a", success_pattern="").success_pattern is None
+
+
+@pytest.mark.asyncio
+async def test_reply_latency_is_reported_and_timeout_applied(signer_factory):
+    from tg_signer.config import ClickKeyboardByTextAction
+    from tg_signer.core import SignActionTimeout
+
+    chat = SignChatV3(
+        chat_id=1,
+        actions=[
+            SendTextAction(text="/checkin"),
+            ClickKeyboardByTextAction(text="签到"),
+        ],
+        action_interval=0,
+    )
+    signer, _ = make_flow_signer(signer_factory, chat)
+
+    async def fake_click(action, message):
+        return True
+
+    signer._click_keyboard_by_text = fake_click
+    latencies = []
+
+    async def bot_replies():
+        await asyncio.sleep(0.1)
+        await signer._on_message(None, make_reply(10, "keyboard"))
+
+    await asyncio.gather(
+        signer.sign_a_chat(chat, on_reply=latencies.append), bot_replies()
+    )
+    assert len(latencies) == 1
+    assert 0.1 <= latencies[0] < 0.5
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    with pytest.raises(SignActionTimeout):
+        await signer.sign_a_chat(chat, reply_timeout=0.1)
+    assert loop.time() - started < 1
+
+
+@pytest.mark.asyncio
+async def test_reply_latency_counts_from_arrival_not_from_handling(signer_factory):
+    from tg_signer.config import ClickKeyboardByTextAction
+
+    chat = SignChatV3(
+        chat_id=1,
+        actions=[
+            SendTextAction(text="/checkin"),
+            ClickKeyboardByTextAction(text="签到"),
+        ],
+        action_interval=0.5,
+    )
+    signer, _ = make_flow_signer(signer_factory, chat)
+
+    async def fake_click(action, message):
+        return True
+
+    signer._click_keyboard_by_text = fake_click
+    latencies = []
+
+    async def bot_replies():
+        # arrives while sign_a_chat still sleeps the action interval
+        await asyncio.sleep(0.05)
+        await signer._on_message(None, make_reply(10, "keyboard"))
+
+    await asyncio.gather(
+        signer.sign_a_chat(chat, on_reply=latencies.append), bot_replies()
+    )
+    assert len(latencies) == 1
+    assert latencies[0] < 0.3
+
+
+@pytest.mark.asyncio
+async def test_next_action_answer_is_prefetched_while_current_action_runs(
+    signer_factory,
+):
+    from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+    from tg_signer.config import (
+        ClickKeyboardByTextAction,
+        ReplyByCalculationProblemAction,
+    )
+
+    chat = SignChatV3(
+        chat_id=1,
+        actions=[
+            ClickKeyboardByTextAction(text="签到"),
+            ReplyByCalculationProblemAction(),
+        ],
+        action_interval=0,
+    )
+    signer, sent = make_flow_signer(signer_factory, chat)
+    loop = asyncio.get_running_loop()
+    events = []
+
+    async def fake_click(action, message):
+        if not signer.may_consume(action, message):
+            return False
+        await asyncio.sleep(0.2)
+        events.append(("clicked", loop.time()))
+        return True
+
+    async def calculate_problem(text):
+        events.append(("llm", loop.time()))
+        await asyncio.sleep(0.1)
+        return "2"
+
+    signer._click_keyboard_by_text = fake_click
+    signer.get_ai_tools = lambda: SimpleNamespace(calculate_problem=calculate_problem)
+    keyboard = make_reply(10, "请点击")
+    keyboard.reply_markup = InlineKeyboardMarkup(
+        [[InlineKeyboardButton("签到", callback_data="sign")]]
+    )
+
+    async def bot_replies():
+        await asyncio.sleep(0.01)
+        await signer._on_message(None, keyboard)
+        await signer._on_message(None, make_reply(11, "1+1=?"))
+
+    await asyncio.gather(signer.sign_a_chat(chat), bot_replies())
+
+    # the keyboard message belongs to the click, only the question hits the LLM
+    assert [name for name, _ in events] == ["llm", "clicked"]
+    assert sent == ["2"]
+    assert signer.context.solutions == {}
+
+
+@pytest.mark.asyncio
+async def test_prefetched_solution_is_reused_not_recomputed(signer_factory):
+    from tg_signer.config import ReplyByCalculationProblemAction
+
+    chat = SignChatV3(
+        chat_id=1,
+        actions=[SendTextAction(text="/checkin"), ReplyByCalculationProblemAction()],
+        action_interval=0,
+    )
+    signer, sent = make_flow_signer(signer_factory, chat)
+    calls = []
+
+    async def calculate_problem(text):
+        calls.append(text)
+        return "2"
+
+    signer.get_ai_tools = lambda: SimpleNamespace(calculate_problem=calculate_problem)
+    signer.context.pending_actions[(1, None)] = chat.actions[1:]
+    question = make_reply(11, "1+1=?")
+    await signer._on_message(None, question)
+    assert len(signer.context.solutions) == 1
+
+    await signer.sign_a_chat(chat)
+
+    assert calls == ["1+1=?"]
+    assert sent == ["/checkin", "2"]
+
+
+def make_concurrent_monitor(signer_factory, match_cfgs):
+    import tg_signer.core as core
+    from tg_signer.config import MonitorConfig
+
+    monitor = signer_factory(cls=core.UserMonitor)
+    monitor.set_me(SimpleNamespace(id=123456))
+    config = MonitorConfig(match_cfgs=match_cfgs)
+    monitor.apply_match_index(monitor.build_match_index(config, {}))
+    sent = []
+
+    async def fake_send_message(chat_id, text, **kwargs):
+        sent.append((chat_id, text))
+        return SimpleNamespace(text=text, chat=SimpleNamespace(id=chat_id))
+
+    monitor.send_message = fake_send_message
+    return monitor, sent
+
+
+def make_monitored_message(message_id, text, chat_id=-100):
+    return SimpleNamespace(
+        id=message_id,
+        text=text,
+        chat=SimpleNamespace(id=chat_id, username=None),
+        from_user=SimpleNamespace(id=1, username=None, is_self=False),
+    )
+
+
+@pytest.mark.asyncio
+async def test_monitor_slow_rule_does_not_block_other_chats(signer_factory):
+    from tg_signer.config import MatchConfig
+
+    monitor, sent = make_concurrent_monitor(
+        signer_factory,
+        [
+            MatchConfig(chat_id=-100, rule="all", default_send_text="slow"),
+            MatchConfig(chat_id=-200, rule="all", default_send_text="fast"),
+        ],
+    )
+    release = asyncio.Event()
+    get_send_text = monitor.get_send_text
+
+    async def slow_get_send_text(match_cfg, message):
+        if match_cfg.chat_id == -100:
+            await release.wait()
+        return await get_send_text(match_cfg, message)
+
+    monitor.get_send_text = slow_get_send_text
+
+    await asyncio.wait_for(
+        monitor.on_message(None, make_monitored_message(1, "a", chat_id=-100)), 1
+    )
+    await monitor.on_message(None, make_monitored_message(2, "b", chat_id=-200))
+    for _ in range(10):
+        await asyncio.sleep(0)
+    assert sent == [(-200, "fast")]
+
+    release.set()
+    await asyncio.gather(*monitor._rule_tasks)
+    assert sent == [(-200, "fast"), (-100, "slow")]
+
+
+@pytest.mark.asyncio
+async def test_monitor_keeps_reply_order_within_a_chat(signer_factory):
+    from tg_signer.config import MatchConfig
+
+    monitor, sent = make_concurrent_monitor(
+        signer_factory,
+        [
+            MatchConfig(
+                chat_id=-100,
+                rule="all",
+                send_text_search_regex=r"(.+)",
+            )
+        ],
+    )
+    delays = {"first": 0.05, "second": 0}
+    get_send_text = monitor.get_send_text
+
+    async def uneven_get_send_text(match_cfg, message):
+        await asyncio.sleep(delays[message.text])
+        return await get_send_text(match_cfg, message)
+
+    monitor.get_send_text = uneven_get_send_text
+
+    await monitor.on_message(None, make_monitored_message(1, "first"))
+    await monitor.on_message(None, make_monitored_message(2, "second"))
+    await asyncio.gather(*monitor._rule_tasks)
+
+    assert sent == [(-100, "first"), (-100, "second")]
+    assert monitor._chat_tails == {}
+
+
+@pytest.mark.asyncio
+async def test_monitor_rule_timeout_and_concurrency_limit(signer_factory):
+    from tg_signer.config import MatchConfig
+
+    monitor, sent = make_concurrent_monitor(
+        signer_factory,
+        [
+            MatchConfig(chat_id=-100, rule="all", default_send_text="stuck"),
+            MatchConfig(chat_id=-100, rule="all", default_send_text="ok"),
+        ],
+    )
+    monitor.rule_timeout = 0.05
+    monitor.max_concurrency = 1
+    running = []
+    max_running = 0
+    get_send_text = monitor.get_send_text
+
+    async def get_send_text_or_hang(match_cfg, message):
+        nonlocal max_running
+        running.append(match_cfg)
+        max_running = max(max_running, len(running))
+        try:
+            if match_cfg.default_send_text == "stuck":
+                await asyncio.Event().wait()
+            return await get_send_text(match_cfg, message)
+        finally:
+            running.remove(match_cfg)
+
+    monitor.get_send_text = get_send_text_or_hang
+
+    await monitor.on_message(None, make_monitored_message(1, "x"))
+    await asyncio.wait_for(asyncio.gather(*monitor._rule_tasks), 1)
+
+    assert sent == [(-100, "ok")]
+    assert max_running == 1
+
+
+@pytest.mark.asyncio
+async def test_monitor_suppresses_replies_but_still_forwards(signer_factory):
+    from tg_signer.config import MatchConfig, MonitorConfig
+
+    match_cfg = MatchConfig(
+        chat_id=-100,
+        rule="all",
+        default_send_text="hi",
+        sender_cooldown_seconds=60,
+        external_forwards=[{"host": "127.0.0.1", "port": 9999}],
+    )
+    monitor, sent = make_concurrent_monitor(signer_factory, [match_cfg])
+    forwarded = []
+
+    async def fake_forward_to_external(match_cfg, message):
+        forwarded.append(message.id)
+
+    monitor.forward_to_external = fake_forward_to_external
+    outputs = []
+    monitor.log = lambda msg, level="INFO", **kwargs: outputs.append(msg)
+
+    for message_id in range(3):
+        await monitor.on_message(None, make_monitored_message(message_id, "x"))
+    await asyncio.gather(*monitor._rule_tasks)
+
+    assert forwarded == [0, 1, 2]
+    assert sent == [(-100, "hi")]
+
+    # reloading an unchanged rule keeps its state
+    monitor.apply_match_index(
+        monitor.build_match_index(MonitorConfig(match_cfgs=[match_cfg]), {})
+    )
+    await monitor.on_message(None, make_monitored_message(3, "x"))
+    assert sent == [(-100, "hi")]
+
+    monitor.report_suppressed()
+    assert any("有3次回复被限制（同一发送者: 3）" in line for line in outputs)
+
+
+@pytest.mark.asyncio
+async def test_monitor_digest_batches_matches_and_survives_restart(signer_factory):
+    from tg_signer.config import MatchConfig
+
+    match_cfg = MatchConfig(
+        chat_id=-100,
+        rule="all",
+        send_text_search_regex=r"(.+)",
+        push_via_server_chan=True,
+        server_chan_send_key="key",
+        digest={"interval": 60, "max_items": 3},
+    )
+    monitor, sent = make_concurrent_monitor(signer_factory, [match_cfg])
+    for message_id, text in enumerate(["a", "b"]):
+        await monitor.on_message(None, make_monitored_message(message_id, text))
+    await asyncio.gather(*monitor._rule_tasks)
+    assert sent == []
+    assert monitor.outbox.outbox.list_deliveries() == []
+
+    # pending matches are reloaded after a restart
+    monitor, sent = make_concurrent_monitor(signer_factory, [match_cfg])
+    await monitor.on_message(None, make_monitored_message(2, "c"))
+    while monitor._rule_tasks:
+        await asyncio.gather(*monitor._rule_tasks)
+
+    assert sent == [(-100, "a\nb\nc")]
+    [push] = monitor.outbox.outbox.list_deliveries()
+    assert json.loads(push["payload"]) == {
+        "send_key": "key",
+        "title": "匹配到监控项：-100（3条）",
+        "desp": "- a\n\n- b\n\n- c",
+    }
+    assert list(monitor.get_digest_dir().iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_monitor_digest_flushes_after_interval(monkeypatch, signer_factory):
+    import tg_signer.core as core
+    from tg_signer.config import MatchConfig
+
+    match_cfg = MatchConfig(
+        chat_id=-100,
+        rule="all",
+        default_send_text="hit",
+        digest={"interval": 30},
+    )
+    monitor, sent = make_concurrent_monitor(signer_factory, [match_cfg])
+    await monitor.on_message(None, make_monitored_message(1, "x"))
+    await asyncio.gather(*monitor._rule_tasks)
+
+    now = core.time.time()
+    monkeypatch.setattr(core.time, "time", lambda: now + 31)
+    task = asyncio.create_task(monitor.flush_digests_periodically(0))
+    for _ in range(20):
+        await asyncio.sleep(0)
+        if sent:
+            break
+    task.cancel()
+
+    assert sent == [(-100, "hit")]
+
+
+@pytest.mark.asyncio
+async def test_monitor_http_callbacks_go_through_the_outbox(signer_factory):
+    from tg_signer.config import MatchConfig
+
+    match_cfg = MatchConfig(
+        chat_id=-100,
+        rule="all",
+        external_forwards=[
+            {"url": "http://127.0.0.1:8000/hook", "headers": {"X-Token": "t"}}
+        ],
+    )
+    monitor, _ = make_concurrent_monitor(signer_factory, [match_cfg])
+
+    await monitor.forward_to_external(match_cfg, make_monitored_message(1, "x"))
+
+    [row] = monitor.outbox.outbox.list_deliveries()
+    assert row["destination"] == "http://127.0.0.1:8000/hook"
+    assert json.loads(row["payload"])["headers"] == {
+        "X-Token": "t",
+        "Content-Type": "application/json",
+    }
+
+
+@pytest.mark.asyncio
+async def test_monitor_file_forward_appends_json_lines(signer_factory, tmp_path):
+    from tg_signer.config import MatchConfig
+    from tg_signer.filesink import close_file_sinks
+
+    archive = tmp_path / "archive"
+    match_cfg = MatchConfig(
+        chat_id=-100,
+        rule="all",
+        external_forwards=[{"type": "file", "path": str(archive)}],
+    )
+    monitor, _ = make_concurrent_monitor(signer_factory, [match_cfg])
+
+    await monitor.forward_to_external(match_cfg, make_monitored_message(1, "x"))
+    close_file_sinks()
+
+    [segment] = archive.iterdir()
+    [line] = segment.read_text(encoding="utf-8").splitlines()
+    assert json.loads(line)["text"] == "x"
+
+
+@pytest.mark.asyncio
+async def test_monitor_archives_every_message_when_enabled(signer_factory):
+    from tg_signer.archive import MessageArchive, close_archive_writers
+    from tg_signer.config import MatchConfig, MonitorConfig
+
+    match_cfg = MatchConfig(chat_id=-100, rule="contains", rule_value="抽奖")
+    monitor, _ = make_concurrent_monitor(signer_factory, [match_cfg])
+    await monitor.apply_config(MonitorConfig(match_cfgs=[match_cfg], archive=True))
+
+    await monitor.on_message(None, make_monitored_message(1, "闲聊"))
+    await monitor.on_message(None, make_monitored_message(2, "参与抽奖"))
+    await monitor.cancel_rule_tasks()
+    close_archive_writers()
+
+    archive = MessageArchive(monitor.workdir / "archive.db")
+    assert [row["message_id"] for row in archive.search(chat="-100")] == [2, 1]
+
+
+@pytest.mark.asyncio
+async def test_monitor_catch_up_replays_missed_messages_before_live_ones(
+    signer_factory,
+):
+    from tg_signer.catchup import LastMessageIds
+    from tg_signer.config import MatchConfig
+
+    monitor, sent = make_concurrent_monitor(
+        signer_factory,
+        [MatchConfig(chat_id=-100, rule="all", default_send_text="ok")],
+    )
+
+    async def echo_text(match_cfg, message):
+        return message.text
+
+    monitor.get_send_text = echo_text
+    monitor._last_message_ids = LastMessageIds(monitor.get_last_message_ids_file())
+    monitor._last_message_ids.update(-100, 10)
+    monitor._last_message_ids.update(-300, 5)
+    monitor._live_backlog = []
+    history_calls = []
+
+    async def fake_get_chat_history(chat_id, limit=0, min_id=0):
+        history_calls.append((chat_id, limit, min_id))
+        # newest first, as Telegram returns them
+        for message_id in (13, 12, 11):
+            yield make_monitored_message(message_id, f"missed {message_id}", chat_id)
+
+    monitor.app.get_chat_history = fake_get_chat_history
+
+    # live updates arriving while catching up, one of them also in the history
+    await monitor.on_message(None, make_monitored_message(13, "missed 13"))
+    await monitor.on_message(None, make_monitored_message(14, "live 14"))
+    await monitor.catch_up()
+    await monitor.on_message(None, make_monitored_message(14, "live 14"))
+    await asyncio.gather(*monitor._rule_tasks)
+
+    # chats no longer monitored are not fetched
+    assert history_calls == [(-100, 500, 11)]
+    assert [text for _, text in sent] == [
+        "missed 11",
+        "missed 12",
+        "missed 13",
+        "live 14",
+    ]
+    assert monitor._live_backlog is None
+    assert monitor._last_message_ids.get(-100) == 14
+    assert monitor._processed.hits == 2
+
+
+@pytest.mark.asyncio
+async def test_monitor_edits_are_coalesced_and_rules_fire_once(signer_factory):
+    from tg_signer.config import MatchConfig, MonitorConfig
+
+    match_cfgs = [
+        MatchConfig(
+            chat_id=-100, rule="contains", rule_value="抽奖", default_send_text="a"
+        ),
+        MatchConfig(
+            chat_id=-100, rule="contains", rule_value="红包", default_send_text="b"
+        ),
+    ]
+    monitor, sent = make_concurrent_monitor(signer_factory, match_cfgs)
+    await monitor.apply_config(MonitorConfig(match_cfgs=match_cfgs, edit_window=0.05))
+    subscription = monitor.app.route_dispatcher._subscriptions[id(monitor)]
+    assert subscription.on_edited_message == monitor.on_edited_message
+    evaluated = []
+
+    async def record_final(message):
+        evaluated.append(message.text)
+        await monitor.process_edited_message(message)
+
+    monitor._edits.on_final = record_final
+
+    await monitor.on_message(None, make_monitored_message(1, "闲聊"))
+    await monitor.on_message(None, make_monitored_message(2, "抽奖"))
+    for text in ("闲", "闲聊 抽", "闲聊 抽奖"):
+        await monitor.on_edited_message(None, make_monitored_message(1, text))
+    for text in ("抽奖 红", "抽奖 红包"):
+        await monitor.on_edited_message(None, make_monitored_message(2, text))
+    await asyncio.sleep(0.1)
+    await monitor.on_edited_message(None, make_monitored_message(2, "抽奖 红包!"))
+    await asyncio.sleep(0.1)
+    await asyncio.gather(*monitor._rule_tasks)
+
+    # only the last version of a burst of edits is evaluated
+    assert sorted(evaluated) == ["抽奖 红包", "抽奖 红包!", "闲聊 抽奖"]
+    # message 1 fires once for its final text, message 2 only adds the new rule
+    assert sorted(text for _, text in sent) == ["a", "a", "b"]
+
+    await monitor.apply_config(MonitorConfig(match_cfgs=match_cfgs))
+    subscription = monitor.app.route_dispatcher._subscriptions[id(monitor)]
+    assert subscription.on_edited_message is None
@@ -0,0 +1,121 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from tg_signer.daemon import DaemonError, SignerDaemon, call_daemon, ping_daemon
+from tg_signer.utils import print_to_user
+
+
+class FakeApp:
+    def __init__(self, key):
+        self.key = key
+        self.refs = 0
+
+    async def __aenter__(self):
+        self.refs += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.refs -= 1
+
+
+class FakeSigner:
+    def __init__(self, key):
+        self.app = FakeApp(key)
+        self.user = None
+        self.calls = []
+
+    async def login(self, num_of_dialogs=20, print_chat=True):
+        self.user = SimpleNamespace(id=1)
+
+    def log(self, message, level="INFO"):
+        pass
+
+    async def send_text(self, chat_id, text, delete_after=None, **kwargs):
+        self.calls.append((chat_id, text, delete_after, kwargs))
+        print_to_user("sent", text)
+
+    async def list_topics(self, chat_id, limit=20, refresh=False):
+        raise ValueError("boom")
+
+
+@pytest.mark.asyncio
+async def test_daemon_serves_requests_over_unix_socket(tmp_path):
+    socket_path = tmp_path / "daemon.sock"
+    signer = FakeSigner("/sessions/acct")
+    daemon = SignerDaemon([signer], socket_path)
+    await daemon.start()
+    try:
+        assert signer.app.refs == 1
+        assert await asyncio.to_thread(ping_daemon, socket_path) == ["/sessions/acct"]
+
+        output = await asyncio.to_thread(
+            call_daemon,
+            socket_path,
+            "/sessions/acct",
+            "send_text",
+            {"chat_id": 1, "text": "hi", "message_thread_id": 3},
+        )
+        assert output == ["sent hi"]
+        assert signer.calls == [(1, "hi", None, {"message_thread_id": 3})]
+
+        # other accounts are handled by the calling process
+        assert (
+            await asyncio.to_thread(
+                call_daemon, socket_path, "/sessions/other", "send_text", {}
+            )
+            is None
+        )
+
+        with pytest.raises(DaemonError, match="boom"):
+            await asyncio.to_thread(
+                call_daemon,
+                socket_path,
+                "/sessions/acct",
+                "list_topics",
+                {"chat_id": 1},
+            )
+    finally:
+        await daemon.stop()
+
+    assert signer.app.refs == 0
+    assert not socket_path.exists()
+
+
+@pytest.mark.asyncio
+async def test_daemon_checks_socket_before_logging_in(tmp_path):
+    socket_path = tmp_path / "daemon.sock"
+    running = SignerDaemon([FakeSigner("/sessions/acct")], socket_path)
+    await running.start()
+    try:
+        signer = FakeSigner("/sessions/acct")
+        with pytest.raises(DaemonError, match="已在运行"):
+            await SignerDaemon([signer], socket_path).serve_forever()
+
+        assert signer.user is None
+        assert signer.app.refs == 0
+        assert socket_path.exists()
+    finally:
+        await running.stop()
+
+
+@pytest.mark.asyncio
+async def test_failed_start_releases_clients_and_socket(tmp_path):
+    socket_path = tmp_path / "daemon.sock"
+    ok, broken = FakeSigner("/sessions/ok"), FakeSigner("/sessions/broken")
+
+    async def fail_login(num_of_dialogs=20, print_chat=True):
+        raise ConnectionError("offline")
+
+    broken.login = fail_login
+    with pytest.raises(ConnectionError):
+        await SignerDaemon([ok, broken], socket_path).serve_forever()
+
+    assert ok.app.refs == broken.app.refs == 0
+    assert not socket_path.exists()
+
+
+def test_call_daemon_returns_none_without_daemon(tmp_path):
+    assert call_daemon(tmp_path / "daemon.sock", "acct", "send_text", {}) is None
+    assert ping_daemon(tmp_path / "daemon.sock") is None
@@ -0,0 +1,45 @@
+from tg_signer.digest import DigestBuffer, digest_file_name, split_digest
+
+
+def make_entry(at, text="x"):
+    return {"at": at, "text": text, "send_text": text, "target": 1}
+
+
+def test_digest_buffer_survives_restart(tmp_path):
+    path = tmp_path / digest_file_name("rule")
+    buffer = DigestBuffer(path)
+    buffer.append(make_entry(1, "a"))
+    buffer.append(make_entry(2, "b"))
+
+    buffer = DigestBuffer(path)
+    assert len(buffer) == 2
+    assert buffer.first_at == 1
+    assert [e["text"] for e in buffer.take()] == ["a", "b"]
+    assert not buffer
+    buffer.done()
+    assert len(DigestBuffer(path)) == 0
+
+
+def test_digest_buffer_restores_failed_and_interrupted_sends(tmp_path):
+    path = tmp_path / "rule.jsonl"
+    buffer = DigestBuffer(path)
+    buffer.append(make_entry(1, "a"))
+    entries = buffer.take()
+    buffer.append(make_entry(2, "b"))
+    buffer.restore(entries)
+    assert len(buffer) == 2
+    assert buffer.first_at == 1
+
+    # a crash while sending leaves the taken entries aside
+    buffer.take()
+    buffer.append(make_entry(3, "c"))
+    with open(path, "a", encoding="utf-8") as fp:
+        fp.write('{"at": 4, "te')
+    buffer = DigestBuffer(path)
+    assert [e["text"] for e in buffer.take()] == ["a", "b", "c"]
+
+
+def test_split_digest_respects_message_length():
+    assert split_digest(["a", "b"], limit=10) == ["a\nb"]
+    assert split_digest(["aaaa", "bbbb", "cc"], limit=9) == ["aaaa\nbbbb", "cc"]
+    assert split_digest(["x" * 12, "y"], limit=5) == ["xxxxx", "xxxxx", "xx\ny"]
@@ -0,0 +1,64 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from tg_signer.edits import MAX_WAIT_FACTOR, EditCoalescer
+
+
+def make_edit(text, message_id=1, chat_id=-100):
+    return SimpleNamespace(id=message_id, text=text, chat=SimpleNamespace(id=chat_id))
+
+
+@pytest.mark.asyncio
+async def test_rapid_edits_are_coalesced_into_the_last_version():
+    finals = []
+
+    async def on_final(message):
+        finals.append(message.text)
+
+    coalescer = EditCoalescer(0.05, on_final)
+    for text in ("a", "ab", "abc"):
+        coalescer.submit(make_edit(text))
+        await asyncio.sleep(0.01)
+    coalescer.submit(make_edit("other", message_id=2))
+    await asyncio.sleep(0.1)
+
+    assert sorted(finals) == ["abc", "other"]
+    assert len(coalescer) == 0
+
+
+@pytest.mark.asyncio
+async def test_continuous_edits_are_flushed_after_the_max_wait():
+    finals = []
+
+    async def on_final(message):
+        finals.append(message.text)
+
+    window = 0.01
+    coalescer = EditCoalescer(window, on_final)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + window * MAX_WAIT_FACTOR * 2
+    i = 0
+    while loop.time() < deadline:
+        i += 1
+        coalescer.submit(make_edit(str(i)))
+        await asyncio.sleep(window / 4)
+    await asyncio.sleep(window * 2)
+
+    assert 1 <= len(finals) < i
+    assert finals[-1] == str(i)
+
+
+@pytest.mark.asyncio
+async def test_cancel_drops_pending_edits():
+    finals = []
+
+    async def on_final(message):
+        finals.append(message.text)
+
+    coalescer = EditCoalescer(0.01, on_final)
+    coalescer.submit(make_edit("a"))
+    await coalescer.cancel()
+    await asyncio.sleep(0.03)
+    assert finals == []
@@ -0,0 +1,89 @@
+import gzip
+import json
+import sys
+import time
+
+from pyrogram.types import User
+
+from tg_signer.filesink import JsonlFileSink, compress_segment, get_file_sink
+
+
+def read_lines(directory):
+    lines = []
+    for path in sorted(directory.iterdir()):
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rt", encoding="utf-8") as fp:
+            lines.extend(fp.read().splitlines())
+    return lines
+
+
+def test_file_sink_writes_compact_json_lines(tmp_path):
+    sink = JsonlFileSink(tmp_path)
+    sink.start()
+    assert sink.write({"text": "你好"})
+    sink.write(User(id=1, first_name="neo"))
+    sink.close()
+
+    assert read_lines(tmp_path) == [
+        '{"text":"你好"}',
+        '{"_":"User","id":1,"first_name":"neo"}',
+    ]
+    assert not sink.write({"late": True})
+
+
+def test_file_sink_rotates_by_size_and_compresses_segments(tmp_path):
+    sink = JsonlFileSink(tmp_path, max_bytes=100, compress="gzip")
+    sink.start()
+    for n in range(50):
+        sink.write({"n": n})
+    sink.close()
+
+    assert len(list(tmp_path.iterdir())) > 1
+    assert all(path.name.endswith(".jsonl.gz") for path in tmp_path.iterdir())
+    assert [json.loads(line)["n"] for line in read_lines(tmp_path)] == list(range(50))
+
+
+def test_file_sink_rotates_by_time(tmp_path):
+    sink = JsonlFileSink(tmp_path, rotate_seconds=0.05)
+    sink.start()
+    sink.write({"n": 0})
+    time.sleep(0.5)
+    sink.write({"n": 1})
+    sink.close()
+
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_file_sink_compresses_segments_left_by_a_previous_run(tmp_path):
+    (tmp_path / "messages-20250101-000000-000000.jsonl").write_text('{"n":0}\n')
+
+    sink = get_file_sink(tmp_path, compress="gzip")
+    sink.close()
+
+    assert [path.name for path in tmp_path.iterdir()] == [
+        "messages-20250101-000000-000000.jsonl.gz"
+    ]
+
+
+def test_zstd_falls_back_to_gzip_when_not_installed(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "zstandard", None)
+    path = tmp_path / "messages-1.jsonl"
+    path.write_text("{}\n")
+
+    assert compress_segment(path, "zstd").name == "messages-1.jsonl.gz"
+
+
+def test_file_sink_write_does_not_wait_for_disk(tmp_path):
+    sink = JsonlFileSink(tmp_path)
+    sink.start()
+    record = {"text": "x" * 200}
+    start = time.perf_counter()
+    for _ in range(10000):
+        sink.write(record)
+    elapsed = time.perf_counter() - start
+    sink.close()
+
+    # 10k messages must be queued well within a second
+    assert elapsed < 0.5
+    assert sink.written == 10000
+    assert len(read_lines(tmp_path)) == 10000
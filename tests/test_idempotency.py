@@ -0,0 +1,76 @@
+from tg_signer.idempotency import (
+    MAX_CACHED_CHATS,
+    WINDOW_BITS,
+    ChatBitmap,
+    FiredRules,
+    ProcessedMessages,
+)
+
+
+def test_bitmap_records_each_message_once():
+    bitmap = ChatBitmap()
+    assert bitmap.add(7)
+    assert not bitmap.add(7)
+    assert bitmap.add(8)
+
+
+def test_bitmap_window_slides_forward_and_forgets_old_ids():
+    bitmap = ChatBitmap()
+    bitmap.add(10)
+    newest = 10 + WINDOW_BITS * 3
+    bitmap.add(newest - 1)
+    assert bitmap.add(newest)
+    assert bitmap.base % 8 == 0
+    assert not bitmap.add(newest - 1)
+    # ids before the window are treated as unseen, never remembered
+    assert bitmap.add(10)
+    assert bitmap.add(10)
+
+
+def test_processed_messages_persist_per_chat(tmp_path):
+    store = ProcessedMessages(tmp_path)
+    assert store.add(-100, 1)
+    assert store.add(-200, 1)
+    assert not store.add(-100, 1)
+    store.save()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["-100.bin", "-200.bin"]
+
+    reloaded = ProcessedMessages(tmp_path)
+    assert not reloaded.add(-100, 1)
+    assert reloaded.add(-100, 2)
+    assert (reloaded.hits, reloaded.misses) == (1, 1)
+    assert (store.hits, store.misses) == (1, 2)
+
+
+def test_processed_messages_write_back_evicted_chats(tmp_path):
+    store = ProcessedMessages(tmp_path, max_chats=2)
+    for chat_id in (1, 2, 3):
+        store.add(chat_id, 5)
+    assert (tmp_path / "1.bin").is_file()
+    assert not store.add(1, 5)
+
+
+def test_processed_messages_in_memory_only():
+    store = ProcessedMessages()
+    for chat_id in range(MAX_CACHED_CHATS + 1):
+        store.add(chat_id, 1)
+    # the least recently used chat was dropped
+    assert store.add(0, 1)
+    assert not store.add(MAX_CACHED_CHATS, 1)
+
+
+def test_processed_messages_ignores_a_corrupt_file(tmp_path):
+    (tmp_path / "-100.bin").write_bytes(b"broken")
+    store = ProcessedMessages(tmp_path)
+    assert store.add(-100, 1)
+
+
+def test_fired_rules_fire_once_per_message_and_rule():
+    fired = FiredRules(maxsize=2)
+    assert fired.fire(-100, 1, "a")
+    assert not fired.fire(-100, 1, "a")
+    assert fired.fire(-100, 1, "b")
+    assert fired.fire(-100, 2, "a")
+    assert fired.fire(-100, 3, "a")
+    # the oldest message was forgotten
+    assert fired.fire(-100, 1, "a")
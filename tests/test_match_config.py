@@ -165,3 +165,27 @@ class TestMatchConfig:
         message = make_message(chat_id=123, text=None, from_user=None)
 
         assert config.match(message) is True
+
+    def test_match_chat_accepts_at_prefixed_username(self):
+        config = MatchConfig(chat_id="@Target_Chat", rule="all")
+
+        assert config.match(make_message(chat_username="target_chat")) is True
+        assert config.match(make_message(chat_username="other")) is False
+
+    def test_resolve_usernames_replaces_known_usernames_with_ids(self):
+        config = MatchConfig(
+            chat_id="@target",
+            rule="all",
+            from_user_ids=["@Alice", "me", 7, "@bob"],
+            forward_to_chat_id="@target",
+        )
+        assert config.usernames == {"target", "alice", "bob"}
+
+        resolved = config.resolve_usernames({"target": -100123, "alice": 5})
+
+        assert resolved.chat_id == -100123
+        assert resolved.forward_to_chat_id == -100123
+        assert resolved.from_user_ids == [5, "me", 7, "@bob"]
+        assert config.chat_id == "@target"
+        message = make_message(chat_id=-100123, from_user={"id": 5})
+        assert resolved.match(message) is True
@@ -0,0 +1,228 @@
+import asyncio
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from tg_signer.cli import signer as signer_cli
+from tg_signer.outbox import Outbox, OutboxDispatcher, get_outbox_file
+
+
+def make_dispatcher(tmp_path, monkeypatch, handler, **kwargs):
+    import tg_signer.outbox as outbox_module
+
+    monkeypatch.setattr(outbox_module, "backoff_delay", lambda attempts: 0)
+    return OutboxDispatcher(
+        Outbox(get_outbox_file(tmp_path)), handlers={"http": handler}, **kwargs
+    )
+
+
+async def run_until(dispatcher: OutboxDispatcher, predicate, timeout=5):
+    async def wait():
+        while not predicate():
+            await asyncio.sleep(0.01)
+
+    dispatcher.start()
+    try:
+        await asyncio.wait_for(wait(), timeout)
+    finally:
+        await dispatcher.release()
+
+
+@pytest.mark.asyncio
+async def test_outbox_retries_in_order_per_destination(tmp_path, monkeypatch):
+    delivered = []
+    failures = {("a", 0): 2}
+
+    async def handler(payload):
+        key = (payload["dest"], payload["n"])
+        if failures.get(key):
+            failures[key] -= 1
+            raise ConnectionError("down")
+        delivered.append(key)
+
+    dispatcher = make_dispatcher(tmp_path, monkeypatch, handler)
+    for n in range(3):
+        for dest in ["a", "b"]:
+            dispatcher.submit("http", dest, {"dest": dest, "n": n})
+
+    await run_until(dispatcher, lambda: len(delivered) == 6)
+
+    assert [n for dest, n in delivered if dest == "a"] == [0, 1, 2]
+    assert [n for dest, n in delivered if dest == "b"] == [0, 1, 2]
+    assert dispatcher.failed == 2
+    assert dispatcher.outbox.stats() == []
+
+
+@pytest.mark.asyncio
+async def test_outbox_dead_letters_and_replay(tmp_path, monkeypatch):
+    healthy = False
+    delivered = []
+
+    async def handler(payload):
+        if not healthy:
+            raise ConnectionError("down")
+        delivered.append(payload["n"])
+
+    dispatcher = make_dispatcher(tmp_path, monkeypatch, handler, max_attempts=3)
+    dispatcher.submit("http", "a", {"n": 1})
+    dispatcher.submit("http", "a", {"n": 2})
+    outbox = dispatcher.outbox
+
+    await run_until(dispatcher, lambda: not outbox.list_deliveries())
+    dead = outbox.list_deliveries(dead=True)
+    assert [row["attempts"] for row in dead] == [3, 3]
+    assert dead[0]["last_error"] == "ConnectionError: down"
+
+    healthy = True
+    assert outbox.replay(destination="a") == 2
+    assert outbox.stats() == [{"destination": "a", "pending": 2, "dead": 0}]
+    await run_until(dispatcher, lambda: len(delivered) == 2)
+    assert delivered == [1, 2]
+
+
+def test_outbox_claims_keep_other_processes_off_a_destination(tmp_path):
+    outbox = Outbox(tmp_path / "outbox.db")
+    outbox.enqueue("http", "a", {})
+
+    row = outbox.claim_head("a", "p1", now=outbox.next_attempt_at())
+    assert row is not None
+    assert outbox.claim_head("a", "p2", now=row["created_at"] + 1) is None
+    assert outbox.due_destinations(row["created_at"] + 1) == []
+    # the claim expires when its owner dies
+    assert outbox.claim_head("a", "p2", now=row["created_at"] + 120) is not None
+
+
+@pytest.mark.asyncio
+async def test_outbox_delivers_every_event_under_load(tmp_path, monkeypatch):
+    delivered = []
+
+    async def handler(payload):
+        await asyncio.sleep(0)
+        delivered.append((payload["dest"], payload["n"]))
+
+    dispatcher = make_dispatcher(tmp_path, monkeypatch, handler, workers=4)
+    dispatcher.start()
+    for n in range(500):
+        for dest in range(4):
+            dispatcher.submit("http", str(dest), {"dest": dest, "n": n})
+        if n % 50 == 0:
+            await asyncio.sleep(0)
+    await run_until(dispatcher, lambda: len(delivered) >= 2000, timeout=30)
+    await dispatcher.release()
+
+    assert len(delivered) == 2000
+    for dest in range(4):
+        assert [n for d, n in delivered if d == dest] == list(range(500))
+
+
+def test_cli_outbox_commands(tmp_path):
+    outbox = Outbox(get_outbox_file(tmp_path))
+    delivery_id = outbox.enqueue("http", "http://127.0.0.1/hook", {"content": "x"})
+    outbox.bury(delivery_id, 8, "HTTPStatusError: 500")
+    outbox.close()
+
+    runner = CliRunner()
+    result = runner.invoke(
+        signer_cli.tg_signer, ["-w", str(tmp_path), "outbox", "status"]
+    )
+    assert result.exit_code == 0, result.output
+    assert "http://127.0.0.1/hook  待投递: 0  死信: 1" in result.output
+
+    result = runner.invoke(
+        signer_cli.tg_signer, ["-w", str(tmp_path), "outbox", "list", "--dead"]
+    )
+    assert "尝试8次  HTTPStatusError: 500" in result.output
+
+    result = runner.invoke(
+        signer_cli.tg_signer,
+        ["-w", str(tmp_path), "outbox", "replay", "--id", str(delivery_id)],
+    )
+    assert "已重新加入队列1条" in result.output
+    [row] = Outbox(get_outbox_file(tmp_path)).list_deliveries()
+    assert json.loads(row["payload"]) == {"content": "x"}
+
+
+@pytest.mark.asyncio
+async def test_outbox_batches_up_to_max_batch_size(tmp_path, monkeypatch):
+    batches = []
+
+    async def handler(payloads):
+        batches.append([p["n"] for p in payloads])
+
+    dispatcher = make_dispatcher(tmp_path, monkeypatch, None)
+    dispatcher.handlers = {"http_batch": handler}
+    for n in range(7):
+        dispatcher.submit(
+            "http_batch", "a", {"n": n, "max_batch_size": 3, "linger_ms": 20}
+        )
+
+    await run_until(dispatcher, lambda: sum(map(len, batches)) == 7)
+
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+    assert dispatcher.batches == 2
+
+
+@pytest.mark.asyncio
+async def test_outbox_failed_batch_falls_back_to_single_items(tmp_path, monkeypatch):
+    delivered = []
+    failures = {2: 1}
+
+    async def handler(payloads):
+        if len(payloads) > 1:
+            raise ConnectionError("payload too large")
+        [payload] = payloads
+        if failures.get(payload["n"]):
+            failures[payload["n"]] -= 1
+            raise ConnectionError("down")
+        delivered.append(payload["n"])
+
+    dispatcher = make_dispatcher(tmp_path, monkeypatch, None)
+    dispatcher.handlers = {"http_batch": handler}
+    for n in range(4):
+        dispatcher.submit(
+            "http_batch", "a", {"n": n, "max_batch_size": 4, "linger_ms": 0}
+        )
+
+    await run_until(dispatcher, lambda: len(delivered) == 4)
+
+    assert delivered == [0, 1, 2, 3]
+    assert dispatcher.outbox.stats() == []
+
+
+@pytest.mark.asyncio
+async def test_deliver_http_batch_posts_a_gzipped_json_array(monkeypatch):
+    import gzip
+
+    import httpx
+
+    import tg_signer.outbox as outbox_module
+
+    requests = []
+
+    def handle(request: httpx.Request):
+        requests.append(request)
+        return httpx.Response(200)
+
+    async_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        outbox_module.httpx,
+        "AsyncClient",
+        lambda: async_client(transport=httpx.MockTransport(handle)),
+    )
+    payloads = [
+        {
+            "url": "http://127.0.0.1/hook",
+            "headers": {"Content-Type": "application/json"},
+            "content": json.dumps({"id": n}),
+            "gzip": True,
+        }
+        for n in range(2)
+    ]
+
+    await outbox_module.deliver_http_batch(payloads)
+    await outbox_module.close_http_client()
+
+    [request] = requests
+    assert request.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(request.content)) == [{"id": 0}, {"id": 1}]
@@ -0,0 +1,60 @@
+from tg_signer.ratelimit import (
+    SUPPRESSED_BY_COOLDOWN,
+    SUPPRESSED_BY_RATE,
+    SUPPRESSED_BY_SENDER,
+    ReplyLimiter,
+    TokenBucket,
+)
+
+
+def test_token_bucket_refills_up_to_capacity():
+    bucket = TokenBucket(2, 1, now=0)
+    assert bucket.available(0)
+    bucket.consume()
+    bucket.consume()
+    assert not bucket.available(0.5)
+    assert bucket.available(1)
+    assert bucket.available(100)
+    assert bucket.tokens == 2
+
+
+def test_cooldown_allows_one_reply_per_window():
+    limiter = ReplyLimiter(cooldown_seconds=10)
+    limiter.buckets[0][1].updated_at = 0
+
+    assert limiter.acquire(1, now=0) is None
+    assert limiter.acquire(2, now=5) == SUPPRESSED_BY_COOLDOWN
+    assert limiter.acquire(2, now=10) is None
+
+
+def test_max_replies_per_minute_allows_bursts_then_throttles():
+    limiter = ReplyLimiter(max_replies_per_minute=3)
+    limiter.buckets[0][1].updated_at = 0
+
+    assert [limiter.acquire(now=0) for _ in range(4)] == [
+        None,
+        None,
+        None,
+        SUPPRESSED_BY_RATE,
+    ]
+    assert limiter.acquire(now=20) is None
+    assert limiter.acquire(now=20) == SUPPRESSED_BY_RATE
+
+
+def test_sender_dedup_does_not_consume_the_rule_budget():
+    limiter = ReplyLimiter(max_replies_per_minute=2, sender_cooldown_seconds=10)
+    limiter.buckets[0][1].updated_at = 0
+
+    assert limiter.acquire("alice", now=0) is None
+    for _ in range(5):
+        assert limiter.acquire("alice", now=1) == SUPPRESSED_BY_SENDER
+    assert limiter.acquire("bob", now=1) is None
+    assert limiter.acquire("alice", now=10) == SUPPRESSED_BY_RATE
+    # expired senders are pruned
+    assert list(limiter._senders) == ["bob"]
+
+    assert limiter.pop_suppressed() == {
+        SUPPRESSED_BY_SENDER: 5,
+        SUPPRESSED_BY_RATE: 1,
+    }
+    assert not limiter.suppressed
@@ -0,0 +1,173 @@
+import json
+from datetime import datetime
+
+import pytest
+from click.testing import CliRunner
+
+import tg_signer.cli.signer as signer_cli
+from tg_signer.store import (
+    FileSignRecord,
+    SignStore,
+    StoreSignRecord,
+    get_store_file,
+    migrate_workdir,
+    open_store,
+)
+
+
+def write_sign_record(workdir, task, user_id, records):
+    record_file = workdir / "signs" / task / str(user_id) / "sign_record.json"
+    record_file.parent.mkdir(parents=True)
+    record_file.write_text(json.dumps(records), encoding="utf-8")
+    return record_file
+
+
+def test_store_uses_wal_and_records_runs(tmp_path):
+    store = SignStore(tmp_path / "tg-signer.db")
+    assert store.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    started_at = datetime(2025, 1, 2, 6, 0)
+    run_id = store.start_run("task", 1, started_at)
+    store.add_chat_result(run_id, 100, None, "success")
+    store.add_chat_result(run_id, 200, 5, "failed", "FLOOD_WAIT")
+    assert store.last_run_at("task", 1, "2025-01-02") is None
+
+    store.finish_run(run_id, datetime(2025, 1, 2, 6, 1))
+    assert store.last_run_at("task", 1, "2025-01-02") == started_at.isoformat()
+    assert store.list_tasks() == ["task"]
+    assert [r["status"] for r in store.chat_results(run_id)] == ["success", "failed"]
+    assert store.chat_results(run_id)[1]["error"] == "FLOOD_WAIT"
+
+
+def test_query_runs_is_paged_newest_first(tmp_path):
+    store = SignStore(tmp_path / "tg-signer.db")
+    for day in range(1, 6):
+        store.start_run("task", 1, datetime(2025, 1, day, 6, 0))
+    store.start_run("other", 2, datetime(2025, 1, 3, 6, 0))
+
+    assert store.count_runs(task="task") == 5
+    page = store.query_runs(task="task", limit=2, offset=2)
+    assert [r["run_date"] for r in page] == ["2025-01-03", "2025-01-02"]
+    assert store.count_runs(keyword="oth") == 1
+    assert store.run_groups() == [
+        {"task": "other", "user_id": "2", "runs": 1},
+        {"task": "task", "user_id": "1", "runs": 5},
+    ]
+
+
+def test_migrate_imports_existing_records_once(tmp_path):
+    write_sign_record(
+        tmp_path,
+        "task",
+        1,
+        {"2025-01-01": "2025-01-01T06:00:00", "2025-01-02": "2025-01-02T06:00:00"},
+    )
+    (tmp_path / "signs" / "empty").mkdir()
+    (tmp_path / "monitors" / "watch").mkdir(parents=True)
+    broken = write_sign_record(tmp_path, "broken", 1, {})
+    broken.write_text("{", encoding="utf-8")
+
+    assert open_store(tmp_path) is None
+    store, imported = migrate_workdir(tmp_path)
+    assert imported == 2
+    assert store.list_tasks() == ["broken", "empty", "task"]
+    assert store.list_tasks(kind="monitor") == ["watch"]
+    assert store.last_run_at("task", 1, "2025-01-02") == "2025-01-02T06:00:00"
+    store.close()
+
+    store, imported = migrate_workdir(tmp_path)
+    assert imported == 0
+    assert store.count_runs() == 2
+    assert open_store(tmp_path) is not None
+
+
+def test_sign_record_backends_share_interface(tmp_path):
+    started_at = datetime(2025, 1, 2, 6, 0)
+    file_record = FileSignRecord(tmp_path / "signs" / "task" / "1" / "sign_record.json")
+    store_record = StoreSignRecord(SignStore(get_store_file(tmp_path)), "task", 1)
+    for record in (file_record, store_record):
+        assert record.last_sign_at("2025-01-02") is None
+        record.start_run(started_at)
+        record.add_chat_result(100, None, "success")
+        record.finish_run(datetime(2025, 1, 2, 6, 1))
+        assert record.last_sign_at("2025-01-02") == started_at.isoformat()
+
+    assert json.loads(file_record.path.read_text(encoding="utf-8")) == {
+        "2025-01-02": started_at.isoformat()
+    }
+
+
+def test_webui_reads_records_from_store_when_enabled(tmp_path):
+    pytest.importorskip("nicegui")
+    from tg_signer.webui.data import load_sign_records
+
+    write_sign_record(
+        tmp_path,
+        "task",
+        1,
+        {f"2025-01-0{day}": f"2025-01-0{day}T06:00:00" for day in range(1, 4)},
+    )
+    from_files = load_sign_records(tmp_path, page=1, page_size=2)
+    assert from_files[0].records == [("2025-01-01", "2025-01-01T06:00:00")]
+    assert from_files[0].total == 3
+
+    migrate_workdir(tmp_path)[0].close()
+    from_store = load_sign_records(tmp_path, page=1, page_size=2)
+    assert from_store[0].path == get_store_file(tmp_path)
+    assert from_store[0].records == [("2025-01-01", "2025-01-01T06:00:00")]
+    assert from_store[0].total == 3
+    assert load_sign_records(tmp_path, keyword="missing") == []
+
+
+def test_cli_store_commands(tmp_path):
+    write_sign_record(tmp_path, "task", 1, {"2025-01-01": "2025-01-01T06:00:00"})
+    runner = CliRunner()
+    result = runner.invoke(
+        signer_cli.tg_signer, ["-w", str(tmp_path), "store", "records"]
+    )
+    assert result.exit_code != 0
+    assert "store migrate" in result.output
+
+    result = runner.invoke(
+        signer_cli.tg_signer, ["-w", str(tmp_path), "store", "migrate"]
+    )
+    assert result.exit_code == 0, result.output
+    assert "已导入1条签到记录" in result.output
+
+    result = runner.invoke(
+        signer_cli.tg_signer,
+        ["-w", str(tmp_path), "store", "records", "--task", "task"],
+    )
+    assert result.exit_code == 0, result.output
+    assert "共1条记录" in result.output
+    assert "2025-01-01T06:00:00  task  1  success" in result.output
+
+
+def test_reply_timeout_follows_latency_percentile():
+    from tg_signer.store import (
+        REPLY_TIMEOUT_DEFAULT,
+        REPLY_TIMEOUT_MAX,
+        REPLY_TIMEOUT_MIN,
+        reply_timeout,
+    )
+
+    assert reply_timeout([0.3] * 4) == REPLY_TIMEOUT_DEFAULT
+    assert reply_timeout([0.3] * 20) == REPLY_TIMEOUT_MIN
+    assert reply_timeout([10.0] * 19 + [15.0]) == 15.0
+    assert reply_timeout([10.0] * 18 + [15.0] * 2) == 22.5
+    assert reply_timeout([100.0] * 10) == REPLY_TIMEOUT_MAX
+
+
+def test_latency_history_is_bounded(tmp_path):
+    from tg_signer.store import LATENCY_HISTORY_SIZE
+
+    file_record = FileSignRecord(tmp_path / "signs" / "task" / "1" / "sign_record.json")
+    store_record = StoreSignRecord(SignStore(get_store_file(tmp_path)), "task", 1)
+    for record in (file_record, store_record):
+        for i in range(LATENCY_HISTORY_SIZE + 5):
+            record.add_latency("100", i / 10)
+        record.add_latency("200:3", 1.5)
+        latencies = record.get_latencies("100")
+        assert len(latencies) == LATENCY_HISTORY_SIZE
+        assert latencies[0] == 0.5
+        assert record.latency_history()["200:3"] == [1.5]
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from tg_signer.config import MatchConfig, MonitorConfig
+from tg_signer.tasks import MonitorTaskManager, SignerTaskManager
+
+
+def write_monitor_config(manager, *chat_ids, mtime=None):
+    config = MonitorConfig(
+        match_cfgs=[MatchConfig(chat_id=chat_id, rule="all") for chat_id in chat_ids]
+    )
+    manager.config_file.write_text(json.dumps(config.to_jsonable()), encoding="utf-8")
+    if mtime is not None:
+        os.utime(manager.config_file, ns=(mtime, mtime))
+
+
+def test_config_is_parsed_once_per_file_version(tmp_path):
+    first = MonitorTaskManager("task", workdir=tmp_path)
+    second = MonitorTaskManager("task", workdir=tmp_path)
+    write_monitor_config(first, 1, mtime=1_000_000_000)
+
+    config = first.load_config()
+    assert second.load_config() is config
+
+    write_monitor_config(first, 1, 2, mtime=2_000_000_000)
+    reloaded = second.load_config()
+    assert reloaded is not config
+    assert reloaded.chat_ids == [1, 2]
+
+
+def test_write_config_updates_the_cache(tmp_path):
+    manager = SignerTaskManager("task", workdir=tmp_path)
+    manager.import_('{"chats": [], "sign_at": "0 6 * * *"}')
+    config = manager.load_config()
+
+    manager.write_config(config.model_copy(update={"sign_at": "0 7 * * *"}))
+
+    assert not manager.config_changed()
+    assert SignerTaskManager("task", workdir=tmp_path).load_config().sign_at == (
+        "0 7 * * *"
+    )
+
+
+@pytest.mark.asyncio
+async def test_watch_config_applies_edits_and_skips_invalid_files(tmp_path):
+    manager = MonitorTaskManager("task", workdir=tmp_path)
+    write_monitor_config(manager, 1, mtime=1_000_000_000)
+    manager.load_config()
+    applied = []
+
+    async def on_change(config):
+        applied.append(config.chat_ids)
+
+    watcher = asyncio.create_task(manager.watch_config(on_change, interval=0))
+    try:
+        manager.config_file.write_text("{not json", encoding="utf-8")
+        os.utime(manager.config_file, ns=(2_000_000_000, 2_000_000_000))
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert applied == []
+        assert manager.config.chat_ids == [1]
+
+        write_monitor_config(manager, 1, 2, mtime=3_000_000_000)
+        for _ in range(5):
+            await asyncio.sleep(0)
+    finally:
+        watcher.cancel()
+
+    assert applied == [[1, 2]]
+    assert manager.config.chat_ids == [1, 2]
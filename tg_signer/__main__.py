@@ -7,3 +7,7 @@ def signer():
     from tg_signer import cli
 
     sys.exit(cli.tg_signer())
+
+
+if __name__ == "__main__":
+    signer()
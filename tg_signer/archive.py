@@ -0,0 +1,354 @@
+import collections
+import logging
+import pathlib
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Optional, Union
+
+logger = logging.getLogger("tg-signer")
+
+ARCHIVE_FILE_NAME = "archive.db"
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages
+(
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    owner_id        INTEGER NOT NULL,
+    chat_id         INTEGER NOT NULL,
+    message_id      INTEGER NOT NULL,
+    chat_title      TEXT,
+    chat_username   TEXT,
+    sender_id       INTEGER,
+    sender_username TEXT,
+    sender_name     TEXT,
+    date            REAL    NOT NULL,
+    text            TEXT    NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_key ON messages (owner_id, chat_id, message_id);
+CREATE INDEX IF NOT EXISTS idx_messages_chat_date ON messages (chat_id, date);
+CREATE INDEX IF NOT EXISTS idx_messages_date ON messages (date);
+"""
+
+# 中文没有空格分词，优先使用trigram分词器（SQLite 3.34+），不可用时退回unicode61
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5
+(
+    text,
+    content='messages',
+    content_rowid='id',
+    tokenize='{tokenize}'
+)
+"""
+
+FTS_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE OF text ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+# 同一条消息（如被编辑后）再次写入时更新文本
+UPSERT_SQL = """
+INSERT INTO messages (owner_id, chat_id, message_id, chat_title, chat_username,
+                      sender_id, sender_username, sender_name, date, text)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (owner_id, chat_id, message_id) DO UPDATE SET text = excluded.text
+WHERE text != excluded.text
+"""
+
+# trigram分词器只能匹配不少于3个字符的查询，更短的查询使用LIKE
+MIN_MATCH_LENGTH = 3
+
+DEFAULT_MAX_PENDING = 100_000
+FLUSH_INTERVAL_SECONDS = 0.5
+# 每个事务最多写入的记录数，待写入的记录达到该数量时立即唤醒写入线程
+BATCH_SIZE = 500
+
+ArchiveRecord = tuple
+
+
+def get_archive_file(workdir: Union[str, pathlib.Path]) -> pathlib.Path:
+    return pathlib.Path(workdir) / ARCHIVE_FILE_NAME
+
+
+def _full_name(obj) -> Optional[str]:
+    name = " ".join(
+        part
+        for part in (
+            getattr(obj, "first_name", None),
+            getattr(obj, "last_name", None),
+        )
+        if part
+    )
+    return name or None
+
+
+def archive_record(owner_id: int, message) -> ArchiveRecord:
+    """从消息中取出存档需要的字段，在事件循环中调用，开销很小"""
+    chat = message.chat
+    sender = getattr(message, "from_user", None) or getattr(
+        message, "sender_chat", None
+    )
+    date = getattr(message, "date", None)
+    return (
+        owner_id,
+        chat.id,
+        message.id,
+        getattr(chat, "title", None) or _full_name(chat),
+        getattr(chat, "username", None),
+        sender.id if sender else None,
+        getattr(sender, "username", None),
+        (getattr(sender, "title", None) or _full_name(sender)) if sender else None,
+        date.timestamp() if date else time.time(),
+        message.text or getattr(message, "caption", None) or "",
+    )
+
+
+def _timestamp(value: Union[datetime, float, None]) -> Optional[float]:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return value
+
+
+class MessageArchive:
+    """
+    SQLite（WAL模式）存储的监控消息存档，带FTS5全文索引，
+    可按文本、聊天、发送者和时间范围分页查询。
+    """
+
+    def __init__(self, path: Union[str, pathlib.Path]):
+        self.path = pathlib.Path(path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.trigram = False
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return self.connect()
+
+    def connect(self) -> sqlite3.Connection:
+        """打开数据库并按需创建表"""
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                with conn:
+                    conn.executescript(SCHEMA)
+                    try:
+                        conn.execute(FTS_SCHEMA.format(tokenize="trigram"))
+                    except sqlite3.OperationalError:
+                        conn.execute(FTS_SCHEMA.format(tokenize="unicode61"))
+                    conn.executescript(FTS_TRIGGERS)
+                    conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+            fts_sql = conn.execute(
+                "SELECT sql FROM sqlite_master WHERE name = 'messages_fts'"
+            ).fetchone()[0]
+            self.trigram = "trigram" in fts_sql
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def add_many(self, records: list[ArchiveRecord]):
+        """在一个事务中写入多条记录"""
+        with self._lock, self.conn:
+            self.conn.executemany(UPSERT_SQL, records)
+
+    def _filters(
+        self,
+        query: str = None,
+        chat: str = None,
+        sender: str = None,
+        since: Union[datetime, float] = None,
+        until: Union[datetime, float] = None,
+    ) -> tuple[str, list]:
+        """
+        :param chat: 聊天id、username或标题
+        :param sender: 发送者id、username或名称
+        """
+        clauses, params = [], []
+        query = (query or "").strip()
+        if query:
+            if self.trigram and len(query) < MIN_MATCH_LENGTH:
+                clauses.append("text LIKE ? ESCAPE '\\'")
+                escaped = (
+                    query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                )
+                params.append(f"%{escaped}%")
+            else:
+                # 作为短语整体匹配，不解析FTS5查询语法
+                clauses.append(
+                    "id IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)"
+                )
+                params.append('"' + query.replace('"', '""') + '"')
+        for value, id_column, name_columns in (
+            (chat, "chat_id", ("chat_username", "chat_title")),
+            (sender, "sender_id", ("sender_username", "sender_name")),
+        ):
+            value = str(value or "").strip()
+            if not value:
+                continue
+            if value.lstrip("-").isdigit():
+                clauses.append(f"{id_column} = ?")
+                params.append(int(value))
+                continue
+            value = value.removeprefix("@")
+            clauses.append(
+                "("
+                + " OR ".join(f"{column} = ? COLLATE NOCASE" for column in name_columns)
+                + ")"
+            )
+            params.extend([value] * len(name_columns))
+        if since is not None:
+            clauses.append("date >= ?")
+            params.append(_timestamp(since))
+        if until is not None:
+            clauses.append("date < ?")
+            params.append(_timestamp(until))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def search(
+        self,
+        query: str = None,
+        chat: str = None,
+        sender: str = None,
+        since: Union[datetime, float] = None,
+        until: Union[datetime, float] = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> list[dict[str, Any]]:
+        """按时间倒序返回匹配的消息"""
+        where, params = self._filters(query, chat, sender, since, until)
+        rows = self.conn.execute(
+            f"SELECT * FROM messages{where} ORDER BY date DESC, id DESC"
+            " LIMIT ? OFFSET ?",
+            (*params, limit, offset),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(
+        self,
+        query: str = None,
+        chat: str = None,
+        sender: str = None,
+        since: Union[datetime, float] = None,
+        until: Union[datetime, float] = None,
+    ) -> int:
+        where, params = self._filters(query, chat, sender, since, until)
+        return self.conn.execute(
+            f"SELECT COUNT(*) FROM messages{where}", params
+        ).fetchone()[0]
+
+
+class ArchiveWriter:
+    """
+    `write`只把记录放入内存队列，由单独的线程按批在一个事务中写入存档，
+    不阻塞更新的处理。
+    """
+
+    def __init__(self, archive: MessageArchive, max_pending: int = DEFAULT_MAX_PENDING):
+        self.archive = archive
+        self.max_pending = max_pending
+        self.written = 0
+        self.dropped = 0
+        self._pending: collections.deque = collections.deque()
+        self._wakeup = threading.Condition()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.archive.connect()
+        self._thread = threading.Thread(
+            target=self._run, name="tg-signer-archive", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, record: ArchiveRecord) -> bool:
+        """放入待写入队列，不等待写入；队列已满时丢弃并返回``False``"""
+        if self._closed or len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return False
+        self._pending.append(record)
+        if len(self._pending) >= BATCH_SIZE:
+            with self._wakeup:
+                self._wakeup.notify()
+        return True
+
+    def close(self):
+        """写完队列中剩余的记录后关闭存档"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            with self._wakeup:
+                self._wakeup.notify()
+            self._thread.join()
+        self.archive.close()
+        if self.dropped:
+            logger.warning(f"写入消息存档时共丢弃{self.dropped}条记录")
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                if not self._closed and len(self._pending) < BATCH_SIZE:
+                    self._wakeup.wait(FLUSH_INTERVAL_SECONDS)
+            closed = self._closed
+            self._drain()
+            if closed:
+                return
+
+    def _drain(self):
+        pending = self._pending
+        while pending:
+            batch = [pending.popleft() for _ in range(min(BATCH_SIZE, len(pending)))]
+            try:
+                self.archive.add_many(batch)
+            except sqlite3.Error as e:
+                self.dropped += len(batch)
+                logger.error(f"写入消息存档失败: {e}")
+                continue
+            self.written += len(batch)
+
+
+_ARCHIVE_WRITERS: dict[pathlib.Path, ArchiveWriter] = {}
+
+
+def get_archive_writer(workdir: Union[str, pathlib.Path]) -> ArchiveWriter:
+    """同一工作目录共用一个写入器"""
+    path = get_archive_file(workdir).resolve()
+    writer = _ARCHIVE_WRITERS.get(path)
+    if writer is None or writer.closed:
+        writer = _ARCHIVE_WRITERS[path] = ArchiveWriter(MessageArchive(path))
+        writer.start()
+    return writer
+
+
+def close_archive_writers():
+    while _ARCHIVE_WRITERS:
+        _, writer = _ARCHIVE_WRITERS.popitem()
+        writer.close()
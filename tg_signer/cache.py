@@ -0,0 +1,89 @@
+import json
+import os
+import pathlib
+import time
+from typing import Any, Iterator, Optional, Union
+
+
+class JSONFileCache:
+    """
+    A small on-disk key/value cache stored as one JSON file.
+
+    Every entry remembers when it was saved and expires after `ttl` seconds.
+    Writes go to a temporary file first and are then atomically moved into
+    place, so a crash never leaves a half-written cache behind.
+    """
+
+    def __init__(self, path: Union[str, pathlib.Path], ttl: float):
+        self.path = pathlib.Path(path)
+        self.ttl = ttl
+        self._data: Optional[dict[str, dict]] = None
+
+    @property
+    def data(self) -> dict[str, dict]:
+        if self._data is None:
+            self._data = self._read()
+        return self._data
+
+    def _read(self) -> dict[str, dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as fp:
+                data = json.load(fp)
+        except (OSError, json.JSONDecodeError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _write(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as fp:
+            json.dump(self.data, fp, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def is_fresh(self, entry: dict, ttl: float = None) -> bool:
+        ttl = self.ttl if ttl is None else ttl
+        saved_at = entry.get("saved_at")
+        if not isinstance(saved_at, (int, float)):
+            return False
+        return ttl is None or ttl < 0 or time.time() - saved_at <= ttl
+
+    def get(self, key: str, default: Any = None, *, ttl: float = None) -> Any:
+        """Return the value of `key`, or `default` if it is missing or expired."""
+        entry = self.data.get(str(key))
+        if not isinstance(entry, dict) or not self.is_fresh(entry, ttl):
+            return default
+        return entry.get("value", default)
+
+    def saved_at(self, key: str) -> Optional[float]:
+        entry = self.data.get(str(key))
+        if not isinstance(entry, dict):
+            return None
+        return entry.get("saved_at")
+
+    def set(self, key: str, value: Any):
+        self.data[str(key)] = {"saved_at": time.time(), "value": value}
+        self._write()
+
+    def update(self, values: dict[str, Any]):
+        now = time.time()
+        for key, value in values.items():
+            self.data[str(key)] = {"saved_at": now, "value": value}
+        self._write()
+
+    def delete(self, key: str):
+        if self.data.pop(str(key), None) is not None:
+            self._write()
+
+    def clear(self):
+        self._data = {}
+        if self.path.is_file():
+            self.path.unlink()
+
+    def reload(self):
+        self._data = None
+
+    def keys(self) -> Iterator[str]:
+        return iter(list(self.data))
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
@@ -0,0 +1,56 @@
+import json
+import logging
+import pathlib
+from typing import Optional, Union
+
+from .utils import write_text_atomic
+
+logger = logging.getLogger("tg-signer")
+
+LAST_MESSAGE_IDS_FILE_NAME = "last_message_ids.json"
+
+
+class LastMessageIds:
+    """
+    每个监控聊天最后处理的消息id，重启后从这里开始补发离线期间的消息。
+
+    更新只修改内存，由`save`定期写入磁盘。
+    """
+
+    def __init__(self, path: Union[str, pathlib.Path]):
+        self.path = pathlib.Path(path)
+        self._ids: dict[int, int] = {}
+        self._dirty = False
+        try:
+            with open(self.path, encoding="utf-8") as fp:
+                data = json.load(fp)
+            self._ids = {
+                int(chat_id): int(message_id) for chat_id, message_id in data.items()
+            }
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning(f"读取{self.path}失败，不补发离线期间的消息: {e}")
+
+    def __len__(self):
+        return len(self._ids)
+
+    def chat_ids(self) -> list[int]:
+        return list(self._ids)
+
+    def get(self, chat_id: int) -> Optional[int]:
+        return self._ids.get(chat_id)
+
+    def update(self, chat_id: int, message_id: int):
+        if message_id > self._ids.get(chat_id, 0):
+            self._ids[chat_id] = message_id
+            self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_text_atomic(
+            self.path, json.dumps({str(k): v for k, v in self._ids.items()})
+        )
+        self._dirty = False
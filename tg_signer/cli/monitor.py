@@ -1,18 +1,22 @@
-import asyncio
 import logging
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
 import click
 from click import Group
 
-from tg_signer.core import UserMonitor
-
 from .signer import tg_signer
 
+if TYPE_CHECKING:
+    import asyncio
+
+DATETIME_FORMATS = ["%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S"]
+
 
 def get_monitor(
-    task_name, ctx_obj: dict, loop: Optional[asyncio.AbstractEventLoop] = None
+    task_name, ctx_obj: dict, loop: Optional["asyncio.AbstractEventLoop"] = None
 ):
+    from tg_signer.core import UserMonitor
+
     monitor = UserMonitor(
         task_name=task_name,
         account=ctx_obj["account"],
@@ -22,6 +26,7 @@ def get_monitor(
         session_string=ctx_obj["session_string"],
         in_memory=ctx_obj["in_memory"],
         loop=loop,
+        refresh_login_cache=ctx_obj.get("refresh_login_cache", False),
     )
     return monitor
 
@@ -47,7 +52,9 @@ tg_monitor: Group
 @tg_monitor.command(name="list", help="列出已有配置")
 @click.pass_obj
 def list_(obj):
-    return UserMonitor(workdir=obj["workdir"]).list_()
+    from tg_signer.tasks import MonitorTaskManager
+
+    return MonitorTaskManager(workdir=obj["workdir"]).list_()
 
 
 @tg_monitor.command(help="根据配置运行监控")
@@ -60,18 +67,109 @@ def list_(obj):
     type=int,
     help="获取最近N个对话, 请确保想要监控的对话在最近N个对话内",
 )
+@click.option(
+    "--max-concurrency",
+    "-c",
+    default=8,
+    show_default=True,
+    type=click.IntRange(min=1),
+    envvar="TG_SIGNER_MONITOR_CONCURRENCY",
+    help="同时处理的监控项数量上限（如AI回复、发送消息、推送），同一聊天的回复仍按顺序发送",
+)
+@click.option(
+    "--rule-timeout",
+    default=60.0,
+    show_default=True,
+    type=click.FloatRange(min=0),
+    envvar="TG_SIGNER_MONITOR_RULE_TIMEOUT",
+    help="单个监控项每一步（生成回复、发送、推送）的超时秒数，0表示不限制",
+)
+@click.option(
+    "--catch-up-limit",
+    default=500,
+    show_default=True,
+    type=click.IntRange(min=0),
+    envvar="TG_SIGNER_MONITOR_CATCH_UP_LIMIT",
+    help="启动时每个聊天最多补发的离线期间消息数量（从上次处理的消息之后开始），0表示不补发",
+)
 @click.pass_obj
-def run(obj, task_name, num_of_dialogs):
+def run(obj, task_name, num_of_dialogs, max_concurrency, rule_timeout, catch_up_limit):
     monitor = get_monitor(task_name, obj)
-    monitor.app_run(monitor.run(num_of_dialogs))
+    monitor.app_run(
+        monitor.run(
+            num_of_dialogs,
+            max_concurrency=max_concurrency,
+            rule_timeout=rule_timeout,
+            catch_up_limit=catch_up_limit,
+        )
+    )
+
+
+@tg_monitor.command(
+    help="""搜索监控消息存档（<workdir>/archive.db，需在监控配置中设置`"archive": true`）\n\n e.g.\n\n  tg-signer monitor search 抽奖 --chat @channel --since 2024-01-01"""
+)
+@click.argument("query", required=False, default=None)
+@click.option("--chat", default=None, help="聊天id、username或标题")
+@click.option("--sender", default=None, help="发送者id、username或名称")
+@click.option(
+    "--since",
+    type=click.DateTime(DATETIME_FORMATS),
+    default=None,
+    help="开始时间（含）",
+)
+@click.option(
+    "--until",
+    type=click.DateTime(DATETIME_FORMATS),
+    default=None,
+    help="结束时间（不含）",
+)
+@click.option("--page", "-p", default=1, show_default=True, type=click.IntRange(min=1))
+@click.option(
+    "--limit", "-l", default=20, show_default=True, type=click.IntRange(min=1)
+)
+@click.pass_obj
+def search(obj, query, chat, sender, since, until, page, limit):
+    from datetime import datetime
+
+    from tg_signer.archive import MessageArchive, get_archive_file
+
+    archive_file = get_archive_file(obj["workdir"])
+    if not archive_file.is_file():
+        click.echo(f"存档不存在: {archive_file}")
+        return
+    archive = MessageArchive(archive_file)
+    filters = {
+        "query": query,
+        "chat": chat,
+        "sender": sender,
+        "since": since,
+        "until": until,
+    }
+    total = archive.count(**filters)
+    rows = archive.search(**filters, limit=limit, offset=(page - 1) * limit)
+    archive.close()
+    for row in rows:
+        date = datetime.fromtimestamp(row["date"]).isoformat(timespec="seconds")
+        chat_text = row["chat_title"] or row["chat_username"] or ""
+        sender_text = row["sender_name"] or ""
+        if row["sender_username"]:
+            sender_text += f"(@{row['sender_username']})"
+        click.echo(
+            f"{date}  {chat_text}[{row['chat_id']}]#{row['message_id']}"
+            f"  {sender_text}: {row['text']}"
+        )
+    pages = max(1, -(-total // limit))
+    click.echo(f"共{total}条，第{page}/{pages}页")
 
 
 @tg_monitor.command(help="重新配置")
 @click.argument("task_name", nargs=1, default="my_monitor")
 @click.pass_obj
 def reconfig(obj, task_name):
-    signer = UserMonitor(task_name=task_name, workdir=obj["workdir"])
-    return signer.reconfig()
+    from tg_signer.tasks import MonitorTaskManager
+
+    manager = MonitorTaskManager(task_name=task_name, workdir=obj["workdir"])
+    return manager.reconfig()
 
 
 @tg_monitor.command(
@@ -83,8 +181,9 @@ def reconfig(obj, task_name):
 )
 @click.pass_obj
 def export(obj, task_name: str, file: str = None):
-    monitor = get_monitor(task_name, obj)
-    data = monitor.export()
+    from tg_signer.tasks import MonitorTaskManager
+
+    data = MonitorTaskManager(task_name, workdir=obj["workdir"]).export()
     if not file:
         click.echo(data)
     else:
@@ -102,11 +201,13 @@ def export(obj, task_name: str, file: str = None):
 )
 @click.pass_obj
 def import_(obj, task_name: str, file: str = None):
-    monitor = get_monitor(task_name, obj)
+    from tg_signer.tasks import MonitorTaskManager
+
+    manager = MonitorTaskManager(task_name, workdir=obj["workdir"])
     if not file:
         stdin_text = click.get_text_stream("stdin")
         data = stdin_text.read()
     else:
         with click.open_file(file, "r", encoding="utf-8") as fp:
             data = fp.read()
-    monitor.import_(data)
+    manager.import_(data)
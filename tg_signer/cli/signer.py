@@ -1,12 +1,14 @@
-import asyncio
 import logging
 import os
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
 import click
 from click import Context, HelpFormatter
 
-from tg_signer.core import UserSigner, get_proxy
+from tg_signer.utils import get_proxy
+
+if TYPE_CHECKING:
+    import asyncio
 
 
 class AliasedGroup(click.Group):
@@ -42,8 +44,10 @@ class AliasedGroup(click.Group):
 
 
 def get_signer(
-    task_name, ctx_obj: dict, loop: Optional[asyncio.AbstractEventLoop] = None
+    task_name, ctx_obj: dict, loop: Optional["asyncio.AbstractEventLoop"] = None
 ):
+    from tg_signer.core import UserSigner
+
     signer = UserSigner(
         task_name=task_name,
         account=ctx_obj["account"],
@@ -53,10 +57,38 @@ def get_signer(
         session_string=ctx_obj["session_string"],
         in_memory=ctx_obj["in_memory"],
         loop=loop,
+        refresh_login_cache=ctx_obj.get("refresh_login_cache", False),
     )
     return signer
 
 
+def forward_to_daemon(obj: dict, method: str, **params) -> bool:
+    """
+    若守护进程（`tg-signer daemon`）正在运行且管理当前账号，则将请求转发给它执行。
+    返回``False``时由调用方在本进程中执行。
+    """
+    if obj.get("no_daemon"):
+        return False
+    from tg_signer.daemon import (
+        DaemonError,
+        call_daemon,
+        get_account_key,
+        get_daemon_socket,
+    )
+
+    socket_path = obj.get("daemon_socket") or get_daemon_socket(obj["workdir"])
+    account_key = get_account_key(obj["session_dir"], obj["account"])
+    try:
+        output = call_daemon(socket_path, account_key, method, params)
+    except (DaemonError, OSError, ValueError) as e:
+        raise click.ClickException(f"守护进程执行失败: {e}") from e
+    if output is None:
+        return False
+    for line in output:
+        click.echo(line)
+    return True
+
+
 @click.group(name="tg-signer", help="使用<子命令> --help查看使用说明", cls=AliasedGroup)
 @click.option(
     "--log-level",
@@ -136,6 +168,38 @@ def get_signer(
     is_flag=True,
     help="是否将session存储在内存中，默认为False，存储在文件",
 )
+@click.option(
+    "--refresh-login-cache",
+    "refresh_login_cache",
+    default=False,
+    is_flag=True,
+    help="忽略登录缓存，启动时重新获取用户信息和最近对话",
+)
+@click.option(
+    "--update-workers",
+    "update_workers",
+    default=None,
+    type=click.IntRange(min=1),
+    show_envvar=True,
+    envvar="TG_SIGNER_UPDATE_WORKERS",
+    help="同时处理的消息更新数量上限（所有账号共用，同一聊天按顺序处理），默认为16",
+)
+@click.option(
+    "--daemon-socket",
+    "daemon_socket",
+    default=None,
+    type=click.Path(),
+    show_envvar=True,
+    envvar="TG_SIGNER_DAEMON_SOCKET",
+    help="守护进程的socket路径，默认为<workdir>/daemon.sock",
+)
+@click.option(
+    "--no-daemon",
+    "no_daemon",
+    default=False,
+    is_flag=True,
+    help="不将send-text等命令转发给守护进程，总是在当前进程中执行",
+)
 @click.pass_context
 def tg_signer(
     ctx: click.Context,
@@ -148,10 +212,18 @@ def tg_signer(
     workdir: str,
     session_string: str,
     in_memory: bool,
+    refresh_login_cache: bool,
+    update_workers: Optional[int],
+    daemon_socket: Optional[str],
+    no_daemon: bool,
 ):
     from tg_signer.logger import configure_logger
 
     logger = configure_logger(log_level=log_level, log_dir=log_dir, log_file=log_file)
+    if update_workers:
+        from tg_signer.update_pool import configure_update_pool
+
+        configure_update_pool(update_workers)
     ctx.ensure_object(dict)
     proxy = get_proxy(proxy)
     if ctx.invoked_subcommand in [
@@ -160,6 +232,7 @@ def tg_signer(
         "run-once",
         "send-text",
         "logout",
+        "daemon",
     ]:
         if proxy:
             logger.info(
@@ -173,6 +246,9 @@ def tg_signer(
     ctx.obj["workdir"] = workdir
     ctx.obj["session_string"] = session_string
     ctx.obj["in_memory"] = in_memory
+    ctx.obj["refresh_login_cache"] = refresh_login_cache
+    ctx.obj["daemon_socket"] = daemon_socket
+    ctx.obj["no_daemon"] = no_daemon
 
 
 @tg_signer.command(help="Show version")
@@ -186,7 +262,9 @@ def version():
 @tg_signer.command(name="list", help="列出已有配置")
 @click.pass_obj
 def list_(obj):
-    return UserSigner(workdir=obj["workdir"]).list_()
+    from tg_signer.tasks import SignerTaskManager
+
+    return SignerTaskManager(workdir=obj["workdir"]).list_()
 
 
 @tg_signer.command(help="登录账号（用于获取session）")
@@ -201,7 +279,7 @@ def list_(obj):
 @click.pass_obj
 def login(obj, num_of_dialogs):
     signer = get_signer(None, obj)
-    signer.app_run(signer.login(num_of_dialogs))
+    signer.app_run(signer.login(num_of_dialogs, refresh=True))
 
 
 @tg_signer.command(help="登出账号并删除session文件")
@@ -221,20 +299,32 @@ def logout(obj):
     type=int,
     help="获取最近N个对话, 请确保想要签到的对话在最近N个对话内",
 )
+@click.option(
+    "--retry-failed",
+    "retry_failed",
+    default=0,
+    show_default=True,
+    type=int,
+    help="执行失败的聊天最多重试N次，重试间隔按指数退避（30秒、60秒、120秒…）",
+)
 @click.pass_obj
-def run(obj, task_names, num_of_dialogs):
+def run(obj, task_names, num_of_dialogs, retry_failed):
     if len(task_names) < 1:
         raise click.UsageError("At least one task name is required")
+    import asyncio
+
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     coros = []
     for task_name in task_names:
         signer = get_signer(task_name, obj, loop=loop)
-        coros.append(signer.run(num_of_dialogs))
+        coros.append(signer.run(num_of_dialogs, retry_failed=retry_failed))
     loop.run_until_complete(asyncio.gather(*coros))
 
 
-@tg_signer.command(help="运行一次签到任务，即使该签到任务今日已执行过")
+@tg_signer.command(
+    help="运行一次签到任务，即使该签到任务今日已执行过。本周期内已完成的聊天会被跳过，只执行未完成或失败的聊天"
+)
 @click.argument("task_name", default="my_sign")
 @click.option(
     "--num-of-dialogs",
@@ -245,10 +335,30 @@ def run(obj, task_names, num_of_dialogs):
     type=int,
     help="获取最近N个对话, 请确保想要签到的对话在最近N个对话内",
 )
+@click.option(
+    "--retry-failed",
+    "retry_failed",
+    default=0,
+    show_default=True,
+    type=int,
+    help="执行失败的聊天最多重试N次，重试间隔按指数退避（30秒、60秒、120秒…）",
+)
+@click.option(
+    "--all",
+    "ignore_checkpoints",
+    is_flag=True,
+    help="忽略检查点，重新执行所有聊天",
+)
 @click.pass_obj
-def run_once(obj, task_name, num_of_dialogs):
+def run_once(obj, task_name, num_of_dialogs, retry_failed, ignore_checkpoints):
     signer = get_signer(task_name, obj)
-    signer.app_run(signer.run_once(num_of_dialogs))
+    signer.app_run(
+        signer.run_once(
+            num_of_dialogs,
+            retry_failed=retry_failed,
+            ignore_checkpoints=ignore_checkpoints,
+        )
+    )
 
 
 @tg_signer.command(help='发送一次文本消息, 请确保当前会话已经"见过"该`chat_id`')
@@ -273,8 +383,17 @@ def run_once(obj, task_name, num_of_dialogs):
 )
 @click.pass_obj
 def send_text(obj, chat_id, text, delete_after=None, message_thread_id=None):
-    singer = get_signer(None, obj)
     click.echo("将发送单次消息")
+    if forward_to_daemon(
+        obj,
+        "send_text",
+        chat_id=chat_id,
+        text=text,
+        delete_after=delete_after,
+        message_thread_id=message_thread_id,
+    ):
+        return
+    singer = get_signer(None, obj)
     singer.app_run(
         singer.send_text(
             chat_id,
@@ -309,8 +428,17 @@ def send_text(obj, chat_id, text, delete_after=None, message_thread_id=None):
 )
 @click.pass_obj
 def send_dice(obj, chat_id, emoji, delete_after=None, message_thread_id=None):
-    singer = get_signer(None, obj)
     click.echo("将发送单次DICE消息")
+    if forward_to_daemon(
+        obj,
+        "send_dice_cli",
+        chat_id=chat_id,
+        emoji=emoji,
+        delete_after=delete_after,
+        message_thread_id=message_thread_id,
+    ):
+        return
+    singer = get_signer(None, obj)
     singer.app_run(
         singer.send_dice_cli(
             chat_id,
@@ -325,8 +453,10 @@ def send_dice(obj, chat_id, emoji, delete_after=None, message_thread_id=None):
 @click.argument("task_name", nargs=1, default="my_sign")
 @click.pass_obj
 def reconfig(obj, task_name):
-    signer = UserSigner(task_name=task_name, workdir=obj["workdir"])
-    return signer.reconfig()
+    from tg_signer.tasks import SignerTaskManager
+
+    manager = SignerTaskManager(task_name=task_name, workdir=obj["workdir"])
+    return manager.reconfig()
 
 
 def parse_chat_id(chat_id: str):
@@ -378,11 +508,22 @@ def list_members(obj, chat_id: str, query: str, admin, limit):
     type=int,
     help="最多返回的话题数量",
 )
+@click.option(
+    "--refresh",
+    "refresh",
+    default=False,
+    is_flag=True,
+    help="忽略本地话题缓存，重新从Telegram获取",
+)
 @click.pass_obj
-def list_topics(obj, chat_id: str, limit: int):
-    signer = get_signer(None, obj)
+def list_topics(obj, chat_id: str, limit: int, refresh: bool):
     chat_id = parse_chat_id(chat_id)
-    signer.app_run(signer.list_topics(chat_id, limit=limit))
+    if forward_to_daemon(
+        obj, "list_topics", chat_id=chat_id, limit=limit, refresh=refresh
+    ):
+        return
+    signer = get_signer(None, obj)
+    signer.app_run(signer.list_topics(chat_id, limit=limit, refresh=refresh))
 
 
 @tg_signer.command(
@@ -394,8 +535,9 @@ def list_topics(obj, chat_id: str, limit: int):
 )
 @click.pass_obj
 def export(obj, task_name: str, file: str = None):
-    signer = get_signer(task_name, obj)
-    data = signer.export()
+    from tg_signer.tasks import SignerTaskManager
+
+    data = SignerTaskManager(task_name, workdir=obj["workdir"]).export()
     if not file:
         click.echo(data)
     else:
@@ -413,14 +555,16 @@ def export(obj, task_name: str, file: str = None):
 )
 @click.pass_obj
 def import_(obj, task_name: str, file: str = None):
-    signer = get_signer(task_name, obj)
+    from tg_signer.tasks import SignerTaskManager
+
+    manager = SignerTaskManager(task_name, workdir=obj["workdir"])
     if not file:
         stdin_text = click.get_text_stream("stdin")
         data = stdin_text.read()
     else:
         with click.open_file(file, "r", encoding="utf-8") as fp:
             data = fp.read()
-    signer.import_(data)
+    manager.import_(data)
 
 
 @tg_signer.command(help="批量配置Telegram自带的定时发送消息功能")
@@ -466,6 +610,17 @@ def import_(obj, task_name: str, file: str = None):
 def schedule_messages(
     obj, chat_id, text, crontab, next_times, random_seconds, message_thread_id
 ):
+    if forward_to_daemon(
+        obj,
+        "schedule_messages",
+        chat_id=chat_id,
+        text=text,
+        crontab=crontab,
+        next_times=next_times,
+        random_seconds=random_seconds,
+        message_thread_id=message_thread_id,
+    ):
+        return
     signer = get_signer(None, obj)
     signer.app_run(
         signer.schedule_messages(
@@ -486,6 +641,8 @@ def list_schedule_messages(obj, chat_id):
     logging.root.setLevel(
         level=logging.WARNING,
     )
+    if forward_to_daemon(obj, "get_schedule_messages", chat_id=chat_id):
+        return
     signer = get_signer(None, obj)
     signer.app_run(signer.get_schedule_messages(chat_id))
 
@@ -512,6 +669,8 @@ def list_schedule_messages(obj, chat_id):
 def multi_run(obj, accounts, task_name, num_of_dialogs):
     logger = logging.getLogger("tg-signer")
     logger.info(f"开始使用一套配置({task_name})同时运行多个账号..")
+    import asyncio
+
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     coros = []
@@ -522,6 +681,157 @@ def multi_run(obj, accounts, task_name, num_of_dialogs):
     loop.run_until_complete(asyncio.gather(*coros))
 
 
+@tg_signer.command(
+    help="启动守护进程，保持账号连接，send-text、send-dice、schedule-messages、list-topics等命令会自动转发给它执行"
+)
+@click.option(
+    "--account",
+    "-a",
+    "accounts",
+    multiple=True,
+    help="需要保持连接的账号，可指定多个，默认为全局选项`--account`的值",
+)
+@click.option(
+    "--num-of-dialogs",
+    "-n",
+    default=50,
+    show_default=True,
+    type=int,
+    help="获取最近N个对话, 请确保想要操作的对话在最近N个对话内",
+)
+@click.pass_obj
+def daemon(obj, accounts, num_of_dialogs):
+    import asyncio
+
+    from tg_signer.daemon import DaemonError, SignerDaemon, get_daemon_socket
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    signers = [
+        get_signer(None, {**obj, "account": account}, loop=loop)
+        for account in accounts or [obj["account"]]
+    ]
+    signer_daemon = SignerDaemon(
+        signers, obj["daemon_socket"] or get_daemon_socket(obj["workdir"])
+    )
+    try:
+        loop.run_until_complete(signer_daemon.serve_forever(num_of_dialogs))
+    except DaemonError as e:
+        raise click.ClickException(str(e)) from e
+    except KeyboardInterrupt:
+        loop.run_until_complete(signer_daemon.stop())
+
+
+@tg_signer.group(
+    name="store",
+    help="SQLite存储（<workdir>/tg-signer.db），启用后签到记录将写入数据库",
+)
+def tg_store():
+    pass
+
+
+@tg_store.command(
+    name="migrate", help="创建数据库并导入已有的签到记录，可重复执行，原文件保持不变"
+)
+@click.pass_obj
+def store_migrate(obj):
+    from tg_signer.store import migrate_workdir
+
+    store, imported = migrate_workdir(obj["workdir"])
+    click.echo(f"已导入{imported}条签到记录: {store.path}")
+    store.close()
+
+
+@tg_store.command(name="records", help="分页查询签到记录（按开始时间倒序）")
+@click.option("--task", "-t", "task", default=None, help="任务名")
+@click.option("--user", "-u", "user_id", default=None, help="用户ID")
+@click.option("--limit", "-l", default=20, show_default=True, type=int)
+@click.option("--page", "-p", default=1, show_default=True, type=int)
+@click.option("--details", "-d", is_flag=True, help="显示每个聊天的执行结果")
+@click.pass_obj
+def store_records(obj, task, user_id, limit, page, details):
+    from tg_signer.store import open_store
+
+    store = open_store(obj["workdir"])
+    if store is None:
+        raise click.ClickException("未启用存储，请先执行`tg-signer store migrate`")
+    total = store.count_runs(task=task, user_id=user_id)
+    runs = store.query_runs(
+        task=task, user_id=user_id, limit=limit, offset=(page - 1) * limit
+    )
+    click.echo(f"共{total}条记录，第{page}页")
+    for run in runs:
+        click.echo(
+            f"{run['started_at']}  {run['task']}  {run['user_id']}  {run['status']}"
+        )
+        if details:
+            for result in store.chat_results(run["id"]):
+                thread = result["message_thread_id"]
+                target = f"{result['chat_id']}" + (f"/{thread}" if thread else "")
+                error = f"  {result['error']}" if result["error"] else ""
+                click.echo(f"    {target}  {result['status']}{error}")
+    store.close()
+
+
+@tg_signer.group(
+    name="outbox",
+    help="监控的外发队列（<workdir>/outbox.db）：Http回调和Server酱推送失败后在此重试",
+)
+def tg_outbox():
+    pass
+
+
+@tg_outbox.command(name="status", help="各目的地待投递和死信的数量")
+@click.pass_obj
+def outbox_status(obj):
+    from tg_signer.outbox import Outbox, get_outbox_file
+
+    outbox = Outbox(get_outbox_file(obj["workdir"]))
+    stats = outbox.stats()
+    if not stats:
+        click.echo("队列为空")
+    for row in stats:
+        click.echo(
+            f"{row['destination']}  待投递: {row['pending']}  死信: {row['dead']}"
+        )
+    outbox.close()
+
+
+@tg_outbox.command(name="list", help="列出待投递（或死信）记录，按加入顺序")
+@click.option("--dead", "-d", is_flag=True, help="列出死信")
+@click.option("--limit", "-l", default=20, show_default=True, type=int)
+@click.pass_obj
+def outbox_list(obj, dead, limit):
+    from datetime import datetime
+
+    from tg_signer.outbox import Outbox, get_outbox_file
+
+    outbox = Outbox(get_outbox_file(obj["workdir"]))
+    for row in outbox.list_deliveries(dead=dead, limit=limit):
+        created_at = datetime.fromtimestamp(row["created_at"]).isoformat(
+            timespec="seconds"
+        )
+        error = f"  {row['last_error']}" if row["last_error"] else ""
+        click.echo(
+            f"{row['id']}  {created_at}  {row['kind']}  {row['destination']}"
+            f"  尝试{row['attempts']}次{error}"
+        )
+    outbox.close()
+
+
+@tg_outbox.command(name="replay", help="将死信重新加入队列，默认为全部死信")
+@click.option("--id", "ids", multiple=True, type=int, help="死信ID，可指定多个")
+@click.option("--destination", default=None, help="只重新投递该目的地的死信")
+@click.pass_obj
+def outbox_replay(obj, ids, destination):
+    from tg_signer.outbox import Outbox, get_outbox_file
+
+    outbox = Outbox(get_outbox_file(obj["workdir"]))
+    count = outbox.replay(ids=list(ids), destination=destination)
+    click.echo(f"已重新加入队列{count}条，将由运行中的监控投递")
+    outbox.close()
+
+
 @tg_signer.command(name="llm-config", help="配置大模型API")
 @click.pass_obj
 def llm_config(obj):
@@ -3,6 +3,7 @@ from datetime import time
 from enum import Enum
 from functools import cached_property
 from typing import (
+    TYPE_CHECKING,
     ClassVar,
     Dict,
     List,
@@ -13,10 +14,21 @@ from typing import (
     Union,
 )
 
-from pydantic import AnyHttpUrl, BaseModel, ValidationError
-from pyrogram.types import Chat, Message
+from pydantic import (
+    AnyHttpUrl,
+    BaseModel,
+    NonNegativeInt,
+    PositiveFloat,
+    PositiveInt,
+    PrivateAttr,
+    ValidationError,
+    field_validator,
+)
 from typing_extensions import Self, TypeAlias
 
+if TYPE_CHECKING:
+    from pyrogram.types import Chat, Message
+
 
 def get_display_width(text: str) -> int:
     """计算文本在终端中的显示宽度（考虑中文字符占2个字符位）"""
@@ -184,6 +196,24 @@ class SupportAction(int, Enum):
 
 class SignAction(BaseModel):
     action: SupportAction
+    # 正则表达式，动作完成后收到匹配的回复即视为签到成功，跳过剩余动作
+    success_pattern: Optional[str] = None
+
+    @field_validator("success_pattern")
+    @classmethod
+    def _check_success_pattern(cls, value: Optional[str]) -> Optional[str]:
+        if value:
+            try:
+                re.compile(value)
+            except re.error as e:
+                raise ValueError(f"无效的正则表达式: {value}, {e}") from e
+        return value or None
+
+    def is_success_reply(self, message: "Message") -> bool:
+        if not self.success_pattern or message is None:
+            return False
+        text = message.text or message.caption
+        return bool(text and re.search(self.success_pattern, text))
 
 
 class SendTextAction(SignAction):
@@ -231,7 +261,7 @@ class SignChatV3(BaseJSONConfig):
     name: Optional[str] = None
     delete_after: Optional[int] = None
     actions: List[ActionT]
-    action_interval: float = 1  # actions的间隔时间，单位秒
+    action_interval: float = 1  # 相邻两个动作开始的最小间隔，单位秒
 
     def __repr__(self) -> str:
         return (
@@ -342,6 +372,16 @@ class SignConfigV3(BaseJSONConfig):
 MatchRuleT: TypeAlias = Literal["exact", "contains", "regex", "all"]
 
 
+def normalize_username(value: Union[int, str, None]) -> Optional[str]:
+    """返回``@username``对应的小写username，不是username时返回``None``"""
+    if not isinstance(value, str):
+        return None
+    username = value.strip().lstrip("@").lower()
+    if not username or username in ("me", "self") or username.lstrip("-").isdigit():
+        return None
+    return username
+
+
 class UDPForward(BaseModel):
     type: Literal["udp"] = "udp"
     host: str
@@ -353,6 +393,28 @@ class HttpCallback(BaseModel):
     url: AnyHttpUrl
     headers: Optional[Dict[str, str]] = None
     method: Literal["post"] = "post"
+    # 设置后批量发送：每次POST一个消息数组，最多包含`max_batch_size`条
+    max_batch_size: Optional[PositiveInt] = None
+    linger_ms: NonNegativeInt = 200  # 批量发送时，第一条消息最多等待多久以凑够一批
+    gzip: bool = False  # 批量发送时使用gzip压缩请求体
+
+
+class FileForward(BaseModel):
+    """追加写入本地JSONL文件，按大小或时间轮转"""
+
+    type: Literal["file"] = "file"
+    path: str  # 目录
+    prefix: str = "messages"  # 文件名前缀
+    max_bytes: PositiveInt = 64 * 1024 * 1024  # 单个文件的最大字节数
+    rotate_seconds: Optional[PositiveFloat] = None  # 单个文件最多写入多久
+    compress: Optional[Literal["gzip", "zstd"]] = None  # 压缩写完的文件
+
+
+class DigestConfig(BaseModel):
+    """将一段时间内的多次匹配合并为一条消息和一次推送"""
+
+    interval: PositiveFloat = 300  # 秒, 第一条匹配最多等待多久后发送
+    max_items: PositiveInt = 50  # 累计达到该数量时立即发送
 
 
 class MatchConfig(BaseJSONConfig):
@@ -372,11 +434,19 @@ class MatchConfig(BaseJSONConfig):
     forward_to_chat_id: Optional[Union[int, str]] = (
         None  # 转发消息到该聊天，默认为消息来源
     )
-    external_forwards: Optional[List[Union[UDPForward, HttpCallback]]] = (
+    external_forwards: Optional[List[Union[UDPForward, HttpCallback, FileForward]]] = (
         None  # 转发到外部
     )
     push_via_server_chan: bool = False  # 将消息通过server酱推送
     server_chan_send_key: Optional[str] = None  # server酱的sendkey
+    cooldown_seconds: Optional[PositiveFloat] = None  # 两次回复之间的最小间隔
+    max_replies_per_minute: Optional[PositiveInt] = None  # 每分钟最多回复次数
+    sender_cooldown_seconds: Optional[PositiveFloat] = (
+        None  # 同一发送者在该时间内只触发一次回复
+    )
+
+    digest: Optional[DigestConfig] = None  # 汇总发送，为空时每次匹配都单独发送
+    _source_key: Optional[str] = PrivateAttr(default=None)
 
     def __str__(self):
         return (
@@ -436,7 +506,10 @@ class MatchConfig(BaseJSONConfig):
     def match_chat(self, chat: "Chat"):
         if isinstance(self.chat_id, int):
             return self.chat_id == chat.id
-        return self.chat_id == chat.username
+        username = normalize_username(self.chat_id)
+        if username is None:
+            return str(chat.id) == str(self.chat_id).strip()
+        return bool(chat.username) and username == chat.username.lower()
 
     def match(self, message: "Message"):
         return self.match_chat(message.chat) and bool(
@@ -461,6 +534,47 @@ class MatchConfig(BaseJSONConfig):
     def requires_ai(self) -> bool:
         return bool(self.ai_reply and self.ai_prompt)
 
+    @cached_property
+    def rule_key(self) -> str:
+        """监控项的标识，配置重载后未修改的监控项保持原有的运行状态"""
+        return self._source_key or self.model_dump_json()
+
+    @property
+    def limits_replies(self) -> bool:
+        return bool(
+            self.cooldown_seconds
+            or self.max_replies_per_minute
+            or self.sender_cooldown_seconds
+        )
+
+    @property
+    def usernames(self) -> set[str]:
+        """chat_id、forward_to_chat_id和from_user_ids中的username"""
+        values = [self.chat_id, self.forward_to_chat_id, *(self.from_user_ids or [])]
+        return {u for u in map(normalize_username, values) if u is not None}
+
+    def resolve_usernames(self, resolved: Dict[str, int]) -> "MatchConfig":
+        """
+        返回将username替换为数字id后的配置副本，未能解析的username保持不变
+        :param resolved: username（小写，不含@）到id的映射
+        """
+
+        def resolve(value):
+            username = normalize_username(value)
+            if username is None:
+                return value
+            return resolved.get(username, value)
+
+        data = self.model_dump()
+        data["chat_id"] = resolve(self.chat_id)
+        data["forward_to_chat_id"] = resolve(self.forward_to_chat_id)
+        if self.from_user_ids:
+            data["from_user_ids"] = [resolve(u) for u in self.from_user_ids]
+        resolved_cfg = self.__class__.model_validate(data)
+        # 解析username不改变监控项的标识
+        resolved_cfg._source_key = self.rule_key
+        return resolved_cfg
+
 
 class MonitorConfig(BaseJSONConfig):
     """监控配置"""
@@ -468,11 +582,20 @@ class MonitorConfig(BaseJSONConfig):
     version: ClassVar = 1
     is_current: ClassVar = True
     match_cfgs: List[MatchConfig]
+    # 将监控到的所有消息写入工作目录下的全文检索存档（archive.db）
+    archive: bool = False
+    # 监控被编辑的消息：同一条消息的连续编辑在停止该秒数后合并处理，只检查最后的文本；
+    # 为空时不监控编辑
+    edit_window: Optional[float] = None
 
     @property
     def chat_ids(self):
         return [cfg.chat_id for cfg in self.match_cfgs]
 
+    @property
+    def usernames(self) -> set[str]:
+        return set().union(*(cfg.usernames for cfg in self.match_cfgs))
+
     @property
     def requires_ai(self) -> bool:
         return any(cfg.requires_ai for cfg in self.match_cfgs)
@@ -1,32 +1,31 @@
 import asyncio
+import functools
 import json
 import logging
 import os
 import pathlib
 import random
+import sqlite3
 import time
 from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from datetime import time as dt_time
+from types import SimpleNamespace
 from typing import (
     Annotated,
     Awaitable,
     BinaryIO,
     Callable,
-    Generic,
-    List,
+    Iterable,
     Optional,
-    Type,
     TypeVar,
     Union,
 )
-from urllib import parse
 
-import httpx
-from croniter import CroniterBadCronError, croniter
-from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from croniter import croniter
+from pydantic import BaseModel, ConfigDict, Field
 from pyrogram import Client as BaseClient
-from pyrogram import errors, filters
+from pyrogram import errors
 from pyrogram.enums import ChatMembersFilter, ChatType
 from pyrogram.handlers import EditedMessageHandler, MessageHandler
 from pyrogram.methods.utilities.idle import idle
@@ -43,9 +42,9 @@ from pyrogram.types import (
 
 from tg_signer.config import (
     ActionT,
-    BaseJSONConfig,
     ChooseOptionByImageAction,
     ClickKeyboardByTextAction,
+    FileForward,
     HttpCallback,
     MatchConfig,
     MonitorConfig,
@@ -54,14 +53,51 @@ from tg_signer.config import (
     SendTextAction,
     SignChatV3,
     SignConfigV3,
-    SupportAction,
     UDPForward,
 )
 
 from ._kurigram import SafeGetForumTopics
 from .ai_tools import AITools, OpenAIConfigManager
-from .notification.server_chan import sc_send
-from .utils import UserInput, print_to_user
+from .archive import (
+    ArchiveWriter,
+    archive_record,
+    close_archive_writers,
+    get_archive_writer,
+)
+from .cache import JSONFileCache
+from .catchup import LAST_MESSAGE_IDS_FILE_NAME, LastMessageIds
+from .digest import DIGEST_DIR_NAME, DigestBuffer, digest_file_name, split_digest
+from .edits import EditCoalescer
+from .filesink import close_file_sinks, get_file_sink
+from .idempotency import PROCESSED_DIR_NAME, FiredRules, ProcessedMessages
+from .outbox import (
+    OutboxDispatcher,
+    deliver_http,
+    get_outbox_dispatcher,
+    server_chan_destination,
+)
+from .ratelimit import (
+    SUPPRESSED_BY_COOLDOWN,
+    SUPPRESSED_BY_RATE,
+    SUPPRESSED_BY_SENDER,
+    ReplyLimiter,
+)
+from .store import (
+    REPLY_TIMEOUT_DEFAULT,
+    FileSignRecord,
+    StoreSignRecord,
+    open_store,
+    reply_timeout,
+)
+from .tasks import (
+    OPENAI_USE_PROMPT,  # noqa: F401
+    ConfigT,
+    MonitorTaskManager,
+    SignerTaskManager,
+    TaskManager,
+)
+from .update_pool import get_update_pool
+from .utils import get_proxy, make_dirs, print_to_user
 
 logger = logging.getLogger("tg-signer")
 
@@ -69,8 +105,6 @@ DICE_EMOJIS = ("🎲", "🎯", "🏀", "⚽", "🎳", "🎰")
 
 Session.START_TIMEOUT = 5  # 原始超时时间为2秒，但一些代理访问会超时，所以这里调大一点
 
-OPENAI_USE_PROMPT = "当前任务需要配置大模型，请确保运行前正确设置`OPENAI_API_KEY`, `OPENAI_BASE_URL`, `OPENAI_MODEL`等环境变量，或通过`tg-signer llm-config`持久化配置。"
-
 CHAT_TYPE_LABELS = {
     ChatType.BOT: "BOT",
     ChatType.GROUP: "群组",
@@ -132,13 +166,202 @@ _CLIENT_ASYNC_LOCKS: dict[str, asyncio.Lock] = {}
 _LOGIN_ASYNC_LOCKS: dict[str, asyncio.Lock] = {}
 _LOGIN_USERS: dict[str, User] = {}
 
+LOGIN_CACHE_TTL_ENV = "TG_SIGNER_LOGIN_CACHE_TTL"
+# fields of the logged in user kept in the on-disk login cache
+_LOGIN_CACHE_USER_FIELDS = (
+    "id",
+    "is_self",
+    "is_bot",
+    "is_premium",
+    "first_name",
+    "last_name",
+    "username",
+    "language_code",
+)
+
+TOPICS_CACHE_TTL_ENV = "TG_SIGNER_TOPICS_CACHE_TTL"
+_TOPIC_DISCOVERY_CONCURRENCY = 4
+_TOPIC_DISCOVERY_TIMEOUT = 5
+USERNAME_CACHE_TTL_ENV = "TG_SIGNER_USERNAME_CACHE_TTL"
+_USERNAME_REFRESH_INTERVAL = 3600
+_SUPPRESSION_REPORT_INTERVAL = 600
+_DIGEST_CHECK_INTERVAL = 1
+_SUPPRESSION_REASONS = {
+    SUPPRESSED_BY_COOLDOWN: "冷却中",
+    SUPPRESSED_BY_RATE: "超过每分钟回复次数",
+    SUPPRESSED_BY_SENDER: "同一发送者",
+}
+_MONITOR_CONCURRENCY = 8
+_MONITOR_RULE_TIMEOUT = 60.0
+# 重启后每个聊天最多补发的离线消息数量，以及同时拉取历史消息的聊天数量
+_MONITOR_CATCH_UP_LIMIT = 500
+_CATCH_UP_CONCURRENCY = 4
+_PROGRESS_SAVE_INTERVAL = 5
+
 _API_ASYNC_LOCKS: dict[str, asyncio.Lock] = {}
 _API_LAST_CALL_AT: dict[str, float] = {}
 _API_MIN_INTERVAL_SECONDS = 0.35
 _API_FLOODWAIT_PADDING_SECONDS = 0.5
 _API_MAX_FLOODWAIT_RETRIES = 2
 
-RouteKey = tuple[int, Optional[int]]
+# Updates are handed over to the process-wide update pool right after parsing,
+# so each client only needs a single pyrogram handler worker. A single worker
+# also hands the updates of one chat to the pool in the order they arrived,
+# which the pool relies on to keep them in order.
+_CLIENT_HANDLER_WORKERS = 1
+
+_RETRY_BACKOFF_SECONDS = 30
+
+RouteKey = tuple[Union[int, str], Optional[int]]
+RouteCallback = Callable[["Client", Message], Awaitable[None]]
+
+# handler group used by the shared route dispatcher of every client
+_ROUTE_DISPATCHER_GROUP = 0
+
+
+def normalize_route_key(
+    chat_id: Union[int, str], message_thread_id: Optional[int] = None
+) -> RouteKey:
+    if isinstance(chat_id, str):
+        chat_id = chat_id.strip().lstrip("@").lower()
+    return chat_id, message_thread_id
+
+
+def message_route_keys(message: Message) -> list[RouteKey]:
+    """Route keys a message can be delivered to, most specific first."""
+    chat = message.chat
+    message_thread_id = getattr(message, "message_thread_id", None)
+    keys = [normalize_route_key(chat.id, message_thread_id)]
+    if message_thread_id is not None:
+        keys.append(normalize_route_key(chat.id, None))
+    username = getattr(chat, "username", None)
+    if username:
+        keys.append(normalize_route_key(username, None))
+    return keys
+
+
+class RouteSubscription(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True, frozen=True)
+
+    owner_id: int
+    routes: frozenset
+    on_message: Optional[RouteCallback] = None
+    on_edited_message: Optional[RouteCallback] = None
+    message_filter: Optional[Callable[[Message], bool]] = None
+
+
+class RouteDispatcher:
+    """
+    One update dispatcher per Client.
+
+    Workers sharing a client subscribe to the routes (chat id, message_thread_id)
+    they care about instead of adding their own pyrogram handlers, so every
+    update is evaluated once and only delivered to interested workers.
+    """
+
+    def __init__(self, client: "Client"):
+        self.client = client
+        self._routes: defaultdict[RouteKey, dict[int, RouteSubscription]] = defaultdict(
+            dict
+        )
+        self._subscriptions: dict[int, RouteSubscription] = {}
+        self._handlers: Optional[tuple[MessageHandler, EditedMessageHandler]] = None
+
+    def subscribe(
+        self,
+        owner: object,
+        routes: list[RouteKey],
+        on_message: Optional[RouteCallback] = None,
+        on_edited_message: Optional[RouteCallback] = None,
+        message_filter: Optional[Callable[[Message], bool]] = None,
+    ) -> RouteSubscription:
+        """Subscribe or re-subscribe `owner`, replacing its previous routes."""
+        self.unsubscribe(owner)
+        subscription = RouteSubscription(
+            owner_id=id(owner),
+            routes=frozenset(normalize_route_key(*route) for route in routes),
+            on_message=on_message,
+            on_edited_message=on_edited_message,
+            message_filter=message_filter,
+        )
+        self._subscriptions[subscription.owner_id] = subscription
+        for route in subscription.routes:
+            self._routes[route][subscription.owner_id] = subscription
+        self._install_handlers()
+        return subscription
+
+    def unsubscribe(self, owner: object):
+        subscription = self._subscriptions.pop(id(owner), None)
+        if subscription is None:
+            return
+        for route in subscription.routes:
+            subscribers = self._routes.get(route)
+            if subscribers is None:
+                continue
+            subscribers.pop(subscription.owner_id, None)
+            if not subscribers:
+                self._routes.pop(route, None)
+
+    def is_subscribed(self, owner: object) -> bool:
+        return id(owner) in self._subscriptions
+
+    @property
+    def routes(self) -> set[RouteKey]:
+        return set(self._routes)
+
+    def _install_handlers(self):
+        if self._handlers is not None:
+            return
+        self._handlers = (
+            MessageHandler(self.dispatch_message),
+            EditedMessageHandler(self.dispatch_edited_message),
+        )
+        for handler in self._handlers:
+            self.client.add_handler(handler, _ROUTE_DISPATCHER_GROUP)
+
+    def subscribers_for(self, message: Message) -> list[RouteSubscription]:
+        subscriptions = {}
+        for route in message_route_keys(message):
+            for owner_id, subscription in self._routes.get(route, {}).items():
+                subscriptions.setdefault(owner_id, subscription)
+        return [
+            s
+            for s in subscriptions.values()
+            if s.message_filter is None or s.message_filter(message)
+        ]
+
+    async def _dispatch(self, client: "Client", message: Message, edited: bool):
+        callbacks = []
+        for subscription in self.subscribers_for(message):
+            callback = (
+                subscription.on_edited_message if edited else subscription.on_message
+            )
+            if callback is not None:
+                callbacks.append(callback)
+        if not callbacks:
+            return
+
+        async def deliver():
+            results = await asyncio.gather(
+                *(callback(client, message) for callback in callbacks),
+                return_exceptions=True,
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(
+                        f"处理消息时发生错误: {result}",
+                        exc_info=(type(result), result, result.__traceback__),
+                    )
+
+        # hand the update over to the process-wide pool, keyed by chat so that
+        # updates of one chat keep their order
+        await get_update_pool().submit(message.chat.id, deliver)
+
+    async def dispatch_message(self, client: "Client", message: Message):
+        await self._dispatch(client, message, edited=False)
+
+    async def dispatch_edited_message(self, client: "Client", message: Message):
+        await self._dispatch(client, message, edited=True)
 
 
 class Client(SafeGetForumTopics, BaseClient):
@@ -146,6 +369,7 @@ class Client(SafeGetForumTopics, BaseClient):
         key = kwargs.pop("key", None)
         super().__init__(name, *args, **kwargs)
         self.key = key or str(pathlib.Path(self.workdir).joinpath(self.name).resolve())
+        self.route_dispatcher = RouteDispatcher(self)
         if self.in_memory and not self.session_string:
             self.load_session_string()
             self.storage = SQLiteStorage(
@@ -186,6 +410,73 @@ class Client(SafeGetForumTopics, BaseClient):
     def session_string_file(self):
         return self.workdir / (self.name + ".session_string")
 
+    @property
+    def login_cache_file(self):
+        return self.workdir / (self.name + ".login_cache.json")
+
+    @property
+    def peer_cache_file(self):
+        return self.workdir / (self.name + ".peers.json")
+
+    @property
+    def persists_peers(self) -> bool:
+        """In-memory storages lose their peers on exit, keep them in a sidecar."""
+        return bool(getattr(self.storage, "in_memory", False))
+
+    @property
+    def peer_cache(self) -> JSONFileCache:
+        return JSONFileCache(self.peer_cache_file, ttl=None)
+
+    async def load_peer_cache(self) -> int:
+        """Load the peers saved by `save_peer_cache` into storage."""
+        cache = self.peer_cache
+        peers = cache.get("peers") or []
+        usernames = cache.get("usernames") or []
+        if not peers:
+            return 0
+        try:
+            await self.storage.update_peers(tuple(peer) for peer in peers)
+            await self.storage.update_usernames(
+                (peer_id, names) for peer_id, names in usernames
+            )
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"加载peer缓存失败: {e}")
+            return 0
+        logger.info(f"已从本地加载{len(peers)}个peer缓存")
+        return len(peers)
+
+    async def save_peer_cache(self) -> int:
+        """Dump the peers of the storage next to the session string."""
+        conn = self.storage.conn
+        peers = conn.execute(
+            "SELECT id, access_hash, type, phone_number FROM peers"
+        ).fetchall()
+        if not peers:
+            return 0
+        usernames = defaultdict(list)
+        for peer_id, username in conn.execute("SELECT id, username FROM usernames"):
+            usernames[peer_id].append(username)
+        self.peer_cache.update(
+            {
+                "peers": [list(peer) for peer in peers],
+                "usernames": [list(item) for item in usernames.items()],
+            }
+        )
+        return len(peers)
+
+    async def load_session(self):
+        await super().load_session()
+        if self.persists_peers:
+            await self.load_peer_cache()
+
+    async def disconnect(self):
+        if self.persists_peers and self.is_connected:
+            try:
+                await self.save_peer_cache()
+            except (sqlite3.Error, RuntimeError, OSError) as e:
+                logger.warning(f"保存peer缓存失败: {e}")
+        return await super().disconnect()
+
     async def save_session_string(self):
         with open(self.session_string_file, "w") as fp:
             fp.write(await self.export_session_string())
@@ -202,6 +493,23 @@ class Client(SafeGetForumTopics, BaseClient):
         await super().log_out()
         if self.session_string_file.is_file():
             os.remove(self.session_string_file)
+        self.peer_cache.clear()
+
+
+def chat_from_dict(data: dict) -> SimpleNamespace:
+    """Rebuild a chat-like object from an entry of ``latest_chats.json``."""
+    chat_type = data.get("type")
+    if isinstance(chat_type, str):
+        chat_type = ChatType.__members__.get(chat_type.rsplit(".", 1)[-1])
+    return SimpleNamespace(
+        id=data.get("id"),
+        title=data.get("title"),
+        type=chat_type,
+        username=data.get("username"),
+        first_name=data.get("first_name"),
+        last_name=data.get("last_name"),
+        is_forum=data.get("is_forum", False),
+    )
 
 
 def get_api_config():
@@ -210,20 +518,6 @@ def get_api_config():
     return api_id, api_hash
 
 
-def get_proxy(proxy: str = None):
-    proxy = proxy or os.environ.get("TG_PROXY")
-    if proxy:
-        r = parse.urlparse(proxy)
-        return {
-            "scheme": r.scheme,
-            "hostname": r.hostname,
-            "port": r.port,
-            "username": r.username,
-            "password": r.password,
-        }
-    return None
-
-
 def get_client(
     name: str = "my_account",
     proxy: dict = None,
@@ -237,6 +531,8 @@ def get_client(
     key = str(pathlib.Path(workdir).joinpath(name).resolve())
     if key in _CLIENT_INSTANCES:
         return _CLIENT_INSTANCES[key]
+    default_workers = "workers" not in kwargs
+    kwargs.setdefault("workers", _CLIENT_HANDLER_WORKERS)
     client = Client(
         name,
         api_id=api_id,
@@ -248,6 +544,13 @@ def get_client(
         key=key,
         **kwargs,
     )
+    if default_workers:
+        # pyrogram sizes its thread pool (downloads, sync handlers) by `workers`
+        # too; keep its default size so only the handler workers are reduced
+        client.executor.shutdown(wait=False)
+        client.executor = ThreadPoolExecutor(
+            BaseClient.WORKERS, thread_name_prefix="Handler"
+        )
     _CLIENT_INSTANCES[key] = client
     return client
 
@@ -256,22 +559,10 @@ def get_now():
     return datetime.now(tz=timezone(timedelta(hours=8)))
 
 
-def make_dirs(path: pathlib.Path, exist_ok=True):
-    path = pathlib.Path(path)
-    if not path.is_dir():
-        os.makedirs(path, exist_ok=exist_ok)
-    return path
-
-
-ConfigT = TypeVar("ConfigT", bound=BaseJSONConfig)
 ApiCallResultT = TypeVar("ApiCallResultT")
 
 
-class BaseUserWorker(Generic[ConfigT]):
-    _workdir = "."
-    _tasks_dir = "tasks"
-    cfg_cls: Type["ConfigT"] = BaseJSONConfig
-
+class BaseUserWorker(TaskManager[ConfigT]):
     def __init__(
         self,
         task_name: str = None,
@@ -283,13 +574,13 @@ class BaseUserWorker(Generic[ConfigT]):
         in_memory: bool = False,
         *,
         loop: Optional[asyncio.AbstractEventLoop] = None,
+        refresh_login_cache: bool = False,
     ):
-        self.task_name = task_name or "my_task"
+        super().__init__(task_name, workdir=workdir)
         self._session_dir = pathlib.Path(session_dir)
         self._account = account
         self._proxy = proxy
-        if workdir:
-            self._workdir = pathlib.Path(workdir)
+        self.refresh_login_cache = refresh_login_cache
         self.app = get_client(
             account,
             proxy,
@@ -300,7 +591,6 @@ class BaseUserWorker(Generic[ConfigT]):
         )
         self.loop = self.app.loop
         self.user: Optional[User] = None
-        self._config = None
         self.context = self.ensure_ctx()
 
     def ensure_ctx(self):
@@ -313,53 +603,14 @@ class BaseUserWorker(Generic[ConfigT]):
         else:
             self.app.run()
 
-    @property
-    def workdir(self) -> pathlib.Path:
-        workdir = self._workdir
-        make_dirs(workdir)
-        return pathlib.Path(workdir)
-
-    @property
-    def tasks_dir(self):
-        tasks_dir = self.workdir / self._tasks_dir
-        make_dirs(tasks_dir)
-        return pathlib.Path(tasks_dir)
-
-    @property
-    def task_dir(self):
-        task_dir = self.tasks_dir / self.task_name
-        make_dirs(task_dir)
-        return task_dir
-
     def get_user_dir(self, user: User):
         user_dir = self.workdir / "users" / str(user.id)
         make_dirs(user_dir)
         return user_dir
 
     @property
-    def config_file(self):
-        return self.task_dir.joinpath("config.json")
-
-    @property
-    def config(self) -> ConfigT:
-        return self._config or self.load_config()
-
-    @config.setter
-    def config(self, value):
-        self._config = value
-
-    def log(self, msg, level: str = "INFO", **kwargs):
-        msg = f"账户「{self._account}」- 任务「{self.task_name}」: {msg}"
-        if level.upper() == "INFO":
-            logger.info(msg, **kwargs)
-        elif level.upper() == "WARNING":
-            logger.warning(msg, **kwargs)
-        elif level.upper() == "ERROR":
-            logger.error(msg, **kwargs)
-        elif level.upper() == "CRITICAL":
-            logger.critical(msg, **kwargs)
-        else:
-            logger.debug(msg, **kwargs)
+    def log_prefix(self) -> str:
+        return f"账户「{self._account}」- 任务「{self.task_name}」"
 
     async def _call_telegram_api(
         self,
@@ -367,7 +618,12 @@ class BaseUserWorker(Generic[ConfigT]):
         call: Callable[[], Awaitable[ApiCallResultT]],
         *,
         retry_on_floodwait: bool = True,
+        exclusive: bool = True,
     ) -> ApiCallResultT:
+        """
+        :param exclusive: 为``True``时同一账号的请求串行执行；为``False``时仅按最小间隔
+            错开请求的开始时间，请求本身可以并发执行（用于只读的批量请求）。
+        """
         key = self.app.key
         lock = _API_ASYNC_LOCKS.get(key)
         if lock is None:
@@ -385,59 +641,50 @@ class BaseUserWorker(Generic[ConfigT]):
                     )
                     if wait_for > 0:
                         await asyncio.sleep(wait_for)
-                try:
-                    result = await call()
-                    _API_LAST_CALL_AT[key] = loop.time()
-                    return result
-                except errors.FloodWait as e:
+                if exclusive:
+                    try:
+                        result = await call()
+                        _API_LAST_CALL_AT[key] = loop.time()
+                        return result
+                    except errors.FloodWait as e:
+                        _API_LAST_CALL_AT[key] = loop.time()
+                        retries_left = await self._wait_floodwait(
+                            e, operation, retries_left, retry_on_floodwait
+                        )
+                        continue
+                # reserve the slot, then run the call outside the lock
+                _API_LAST_CALL_AT[key] = loop.time()
+            try:
+                return await call()
+            except errors.FloodWait as e:
+                async with lock:
                     _API_LAST_CALL_AT[key] = loop.time()
-                    if not retry_on_floodwait or retries_left <= 0:
-                        raise
-                    retries_left -= 1
-                    wait_seconds = (
-                        max(float(getattr(e, "value", 0) or 0), 0)
-                        + _API_FLOODWAIT_PADDING_SECONDS
-                    )
-                    self.log(
-                        f"{operation} 触发 FloodWait，等待 {wait_seconds:.1f}s 后重试（剩余重试 {retries_left} 次）",
-                        level="WARNING",
+                    retries_left = await self._wait_floodwait(
+                        e, operation, retries_left, retry_on_floodwait
                     )
-                    await asyncio.sleep(wait_seconds)
-
-    def ask_for_config(self):
-        raise NotImplementedError
 
-    def write_config(self, config: BaseJSONConfig):
-        with open(self.config_file, "w", encoding="utf-8") as fp:
-            json.dump(config.to_jsonable(), fp, ensure_ascii=False)
-
-    def reconfig(self):
-        config = self.ask_for_config()
-        self.write_config(config)
-        return config
+    async def _wait_floodwait(
+        self,
+        e: errors.FloodWait,
+        operation: str,
+        retries_left: int,
+        retry_on_floodwait: bool = True,
+    ) -> int:
+        if not retry_on_floodwait or retries_left <= 0:
+            raise e
+        retries_left -= 1
+        wait_seconds = (
+            max(float(getattr(e, "value", 0) or 0), 0) + _API_FLOODWAIT_PADDING_SECONDS
+        )
+        self.log(
+            f"{operation} 触发 FloodWait，等待 {wait_seconds:.1f}s 后重试（剩余重试 {retries_left} 次）",
+            level="WARNING",
+        )
+        await asyncio.sleep(wait_seconds)
+        return retries_left
 
-    def load_config(self, cfg_cls: Type[ConfigT] = None) -> ConfigT:
-        cfg_cls = cfg_cls or self.cfg_cls
-        if not self.config_file.exists():
-            config = self.reconfig()
-        else:
-            with open(self.config_file, "r", encoding="utf-8") as fp:
-                config, from_old = cfg_cls.load(json.load(fp))
-                if from_old:
-                    self.write_config(config)
-        self.config = config
-        return config
-
-    def get_task_list(self):
-        signs = []
-        for d in os.listdir(self.tasks_dir):
-            if self.tasks_dir.joinpath(d).is_dir():
-                signs.append(d)
-        return signs
-
-    def list_(self):
-        for d in self.get_task_list():
-            print_to_user(d)
+    def unsubscribe_routes(self):
+        self.app.route_dispatcher.unsubscribe(self)
 
     def set_me(self, user: User):
         self.user = user
@@ -446,10 +693,73 @@ class BaseUserWorker(Generic[ConfigT]):
         ) as fp:
             fp.write(str(user))
 
-    async def login(self, num_of_dialogs=20, print_chat=True):
+    @property
+    def login_cache(self) -> JSONFileCache:
+        ttl = float(os.environ.get(LOGIN_CACHE_TTL_ENV, 12 * 3600))
+        return JSONFileCache(self.app.login_cache_file, ttl=ttl)
+
+    def write_latest_chats(self, user: User, latest_chats: list[dict]):
+        with open(
+            self.get_user_dir(user).joinpath("latest_chats.json"),
+            "w",
+            encoding="utf-8",
+        ) as fp:
+            json.dump(
+                latest_chats,
+                fp,
+                indent=4,
+                default=Object.default,
+                ensure_ascii=False,
+            )
+
+    def save_login_cache(self, me: User, latest_chats: list[dict], num_of_dialogs):
+        self.login_cache.set(
+            "bootstrap",
+            {
+                "me": {f: getattr(me, f, None) for f in _LOGIN_CACHE_USER_FIELDS},
+                "latest_chats": json.loads(
+                    json.dumps(latest_chats, default=Object.default)
+                ),
+                "num_of_dialogs": num_of_dialogs,
+            },
+        )
+
+    def load_login_cache(self, num_of_dialogs=20, print_chat=True) -> Optional[User]:
+        """
+        Load the bootstrap result (me and latest chats) saved by a previous
+        login, so warm restarts don't need get_me/get_dialogs.
+        """
+        if self.app.persists_peers and not self.app.peer_cache_file.is_file():
+            # in-memory sessions without a saved peer cache start with an empty
+            # peer cache which is only filled by get_dialogs
+            return None
+        cached = self.login_cache.get("bootstrap")
+        if not cached or (cached.get("num_of_dialogs") or 0) < num_of_dialogs:
+            return None
+        me = User(**cached["me"])
+        latest_chats = cached.get("latest_chats") or []
+        self.log("使用登录缓存，跳过获取用户信息和最近对话")
+        if print_chat:
+            topics_cache = self.get_forum_topics_cache(me)
+            for chat in map(chat_from_dict, latest_chats):
+                print_to_user(readable_chat(chat))
+                if not chat_has_forum_topics(chat):
+                    continue
+                for topic in self.load_cached_topics(chat.id, cache=topics_cache):
+                    print_to_user(f"  {readable_topic(topic)}")
+        if not self.get_user_dir(me).joinpath("latest_chats.json").is_file():
+            self.write_latest_chats(me, latest_chats)
+        return me
+
+    async def login(self, num_of_dialogs=20, print_chat=True, refresh: bool = None):
+        """
+        :param refresh: 忽略登录缓存，重新获取用户信息和最近对话，默认为``refresh_login_cache``
+        """
         self.log("开始登录...")
         app = self.app
         key = app.key
+        if refresh is None:
+            refresh = self.refresh_login_cache
         lock = _LOGIN_ASYNC_LOCKS.get(key)
         if lock is None:
             lock = asyncio.Lock()
@@ -457,6 +767,10 @@ class BaseUserWorker(Generic[ConfigT]):
 
         async with lock:
             me = _LOGIN_USERS.get(key)
+            if me is None and not refresh:
+                me = self.load_login_cache(num_of_dialogs, print_chat=print_chat)
+                if me is not None:
+                    _LOGIN_USERS[key] = me
             if me is None:
                 async with app:
                     me = await self._call_telegram_api("users.GetFullUser", app.get_me)
@@ -475,6 +789,7 @@ class BaseUserWorker(Generic[ConfigT]):
                                     "username": chat.username,
                                     "first_name": chat.first_name,
                                     "last_name": chat.last_name,
+                                    "is_forum": getattr(chat, "is_forum", None),
                                 }
                             )
                         return chats, latest_chats
@@ -484,37 +799,19 @@ class BaseUserWorker(Generic[ConfigT]):
                     )
 
                     if print_chat:
+                        topics_by_chat = await self.discover_forum_topics(
+                            me, [chat for chat in chats if chat_has_forum_topics(chat)]
+                        )
                         for chat in chats:
                             print_to_user(readable_chat(chat))
-                            if chat_has_forum_topics(chat):
-                                try:
-                                    topics = await asyncio.wait_for(
-                                        self.get_forum_topics(chat.id, limit=20),
-                                        timeout=5,
-                                    )
-                                    for topic in topics:
-                                        print_to_user(f"  {readable_topic(topic)}")
-                                except (asyncio.TimeoutError, errors.RPCError):
-                                    # Keep login robust: many chats don't support
-                                    # forum topics or the current account may not
-                                    # have permissions to read them.
-                                    pass
-
-                    with open(
-                        self.get_user_dir(me).joinpath("latest_chats.json"),
-                        "w",
-                        encoding="utf-8",
-                    ) as fp:
-                        json.dump(
-                            latest_chats,
-                            fp,
-                            indent=4,
-                            default=Object.default,
-                            ensure_ascii=False,
-                        )
+                            for topic in topics_by_chat.get(chat.id) or []:
+                                print_to_user(f"  {readable_topic(topic)}")
+
+                    self.write_latest_chats(me, latest_chats)
                     await self._call_telegram_api(
                         "auth.ExportAuthorization", self.app.save_session_string
                     )
+                self.save_login_cache(me, latest_chats, num_of_dialogs)
                 _LOGIN_USERS[key] = me
             else:
                 self.log("检测到同账号已完成登录初始化，复用已有会话信息")
@@ -522,6 +819,7 @@ class BaseUserWorker(Generic[ConfigT]):
 
     async def logout(self):
         self.log("开始登出...")
+        self.login_cache.clear()
         is_authorized = await self.app.connect()
         if not is_authorized:
             await self.app.storage.delete()
@@ -640,35 +938,126 @@ class BaseUserWorker(Generic[ConfigT]):
                 topics.append(topic)
             return topics
 
-        return await self._call_telegram_api("channels.GetForumTopics", _collect_topics)
+        return await self._call_telegram_api(
+            "channels.GetForumTopics", _collect_topics, exclusive=False
+        )
 
-    async def list_topics(self, chat_id: Union[int, str], limit: int = 20):
-        if self.user is None:
-            await self.login(print_chat=False)
-        async with self.app:
-            try:
-                topics = await self.get_forum_topics(chat_id, limit=limit)
-            except errors.RPCError as e:
-                print_to_user(f"获取话题失败: {e}")
-                return []
-            if not topics:
-                print_to_user("未获取到话题，可能该聊天未开启话题或无权限。")
-                return []
-            for topic in topics:
-                print_to_user(readable_topic(topic))
-            return topics
+    def get_forum_topics_cache(self, user: User = None) -> JSONFileCache:
+        user = user or self.user
+        ttl = float(os.environ.get(TOPICS_CACHE_TTL_ENV, 24 * 3600))
+        return JSONFileCache(self.get_user_dir(user) / "forum_topics.json", ttl=ttl)
+
+    def load_cached_topics(
+        self,
+        chat_id: Union[int, str],
+        limit: int = 20,
+        cache: JSONFileCache = None,
+    ) -> Optional[list[SimpleNamespace]]:
+        """Topics of `chat_id` from the on-disk cache, ``None`` if missing or stale."""
+        cache = cache or self.get_forum_topics_cache()
+        cached = cache.get(chat_id)
+        if not cached:
+            return None
+        topics = cached.get("topics") or []
+        # a cached page smaller than its limit holds every topic of the chat
+        if cached.get("limit", 0) < limit and len(topics) >= cached.get("limit", 0):
+            return None
+        return [SimpleNamespace(**topic) for topic in topics[:limit]]
+
+    def save_cached_topics(
+        self, cache: JSONFileCache, topics_by_chat: dict[Union[int, str], list], limit
+    ):
+        cache.update(
+            {
+                chat_id: {
+                    "limit": limit,
+                    "topics": [
+                        {
+                            "id": topic.id,
+                            "title": getattr(topic, "title", None),
+                            "is_closed": bool(getattr(topic, "is_closed", False)),
+                            "is_pinned": bool(getattr(topic, "is_pinned", False)),
+                        }
+                        for topic in topics
+                    ],
+                }
+                for chat_id, topics in topics_by_chat.items()
+            }
+        )
+
+    async def discover_forum_topics(
+        self,
+        user: User,
+        chats: list[Chat],
+        limit: int = 20,
+        concurrency: int = _TOPIC_DISCOVERY_CONCURRENCY,
+    ) -> dict[int, list]:
+        """
+        Fetch forum topics of `chats` with at most `concurrency` requests in
+        flight (still spaced by the per-account rate limiter). Fresh topics are
+        taken from the cache and new results are written back to it.
+        """
+        cache = self.get_forum_topics_cache(user)
+        topics_by_chat = {}
+        pending = []
+        for chat in chats:
+            cached = self.load_cached_topics(chat.id, limit, cache=cache)
+            if cached is None:
+                pending.append(chat)
+            else:
+                topics_by_chat[chat.id] = cached
+        if not pending:
+            return topics_by_chat
 
-    def export(self):
-        with open(self.config_file, "r", encoding="utf-8") as fp:
-            data = fp.read()
-        return data
+        semaphore = asyncio.Semaphore(concurrency)
 
-    def import_(self, config_str: str):
-        with open(self.config_file, "w", encoding="utf-8") as fp:
-            fp.write(config_str)
+        async def fetch(chat: Chat):
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(
+                        self.get_forum_topics(chat.id, limit=limit),
+                        timeout=_TOPIC_DISCOVERY_TIMEOUT,
+                    )
+                except (asyncio.TimeoutError, errors.RPCError):
+                    # Keep login robust: many chats don't support forum topics
+                    # or the current account may not have permissions to read them.
+                    return None
+
+        results = await asyncio.gather(*(fetch(chat) for chat in pending))
+        fetched = {
+            chat.id: topics
+            for chat, topics in zip(pending, results, strict=True)
+            if topics is not None
+        }
+        if fetched:
+            self.save_cached_topics(cache, fetched, limit)
+        topics_by_chat.update(fetched)
+        return topics_by_chat
 
-    def ask_one(self):
-        raise NotImplementedError
+    async def list_topics(
+        self, chat_id: Union[int, str], limit: int = 20, refresh: bool = False
+    ):
+        """
+        :param refresh: 忽略话题缓存，重新从Telegram获取
+        """
+        if self.user is None:
+            await self.login(print_chat=False)
+        cache = self.get_forum_topics_cache()
+        topics = None if refresh else self.load_cached_topics(chat_id, limit, cache)
+        if topics is None:
+            async with self.app:
+                try:
+                    topics = await self.get_forum_topics(chat_id, limit=limit)
+                except errors.RPCError as e:
+                    print_to_user(f"获取话题失败: {e}")
+                    return []
+            self.save_cached_topics(cache, {chat_id: topics}, limit)
+        if not topics:
+            print_to_user("未获取到话题，可能该聊天未开启话题或无权限。")
+            return []
+        for topic in topics:
+            print_to_user(readable_topic(topic))
+        return topics
 
     def ensure_ai_cfg(self):
         cfg_manager = OpenAIConfigManager(self.workdir)
@@ -681,6 +1070,24 @@ class BaseUserWorker(Generic[ConfigT]):
         return AITools(self.ensure_ai_cfg())
 
 
+def _retrieve_exception(task: asyncio.Task):
+    # 预先开始的任务可能不会被用到，避免"Task exception was never retrieved"告警
+    if not task.cancelled():
+        task.exception()
+
+
+class SignActionTimeout(Exception):
+    """等待回复超时，动作未完成"""
+
+
+class SignSucceeded(Exception):
+    """收到匹配成功标志的回复，无需执行剩余动作"""
+
+    def __init__(self, message: Message):
+        super().__init__(readable_message(message))
+        self.message = message
+
+
 class Waiter:
     def __init__(self):
         self.waiting_ids = set()
@@ -722,13 +1129,19 @@ class UserSignerWorkerContext(BaseModel):
             Field(default_factory=dict),
         ],
     ]  # 收到的消息，key为(chat id, message_thread_id)
+    # 消息到达（或被编辑）时的`loop.time()`，key为(route key, message id)，用于计算回复延迟
+    message_arrivals: dict[tuple[RouteKey, int], float] = Field(default_factory=dict)
+    message_events: defaultdict[
+        RouteKey,
+        Annotated[asyncio.Event, Field(default_factory=asyncio.Event)],
+    ] = Field(default_factory=lambda: defaultdict(asyncio.Event))  # 收到消息时set
     waiting_message: Optional[Message]  # 正在处理的消息
+    # 每个聊天当前及之后的动作，收到消息时据此提前开始识别图片或计算
+    pending_actions: dict[RouteKey, list[ActionT]] = Field(default_factory=dict)
+    solutions: dict[tuple, asyncio.Task] = Field(default_factory=dict)
 
 
-class UserSigner(BaseUserWorker[SignConfigV3]):
-    _workdir = ".signer"
-    _tasks_dir = "signs"
-    cfg_cls = SignConfigV3
+class UserSigner(SignerTaskManager, BaseUserWorker[SignConfigV3]):
     context: UserSignerWorkerContext
 
     def ensure_ctx(self) -> UserSignerWorkerContext:
@@ -751,190 +1164,130 @@ class UserSigner(BaseUserWorker[SignConfigV3]):
         make_dirs(sign_record_dir)
         return sign_record_dir / "sign_record.json"
 
-    def _ask_actions(
-        self, input_: UserInput, available_actions: List[SupportAction] = None
-    ) -> List[ActionT]:
-        print_to_user(f"{input_.index_str}开始配置<动作>，请按照实际签到顺序配置。")
-        available_actions = available_actions or list(SupportAction)
-        actions = []
-        while True:
-            try:
-                local_input_ = UserInput()
-                print_to_user(f"第{len(actions) + 1}个动作: ")
-                for action in available_actions:
-                    print_to_user(f"  {action.value}: {action.desc}")
-                print_to_user()
-                action_str = local_input_("输入对应的数字选择动作: ").strip()
-                action = SupportAction(int(action_str))
-                if action not in available_actions:
-                    raise ValueError(f"不支持的动作: {action}")
-                if len(actions) == 0 and action not in [
-                    SupportAction.SEND_TEXT,
-                    SupportAction.SEND_DICE,
-                ]:
-                    raise ValueError(
-                        f"第一个动作必须为「{SupportAction.SEND_TEXT.desc}」或「{SupportAction.SEND_DICE.desc}」"
-                    )
-                if action == SupportAction.SEND_TEXT:
-                    text = local_input_("输入要发送的文本: ")
-                    actions.append(SendTextAction(text=text))
-                elif action == SupportAction.SEND_DICE:
-                    dice = local_input_("输入要发送的骰子（如 🎲, 🎯）: ")
-                    actions.append(SendDiceAction(dice=dice))
-                elif action == SupportAction.CLICK_KEYBOARD_BY_TEXT:
-                    text_of_btn_to_click = local_input_("键盘中需要点击的按钮文本: ")
-                    actions.append(ClickKeyboardByTextAction(text=text_of_btn_to_click))
-                elif action == SupportAction.CHOOSE_OPTION_BY_IMAGE:
-                    print_to_user(
-                        "图片识别将使用大模型回答，请确保大模型支持图片识别。"
-                    )
-                    actions.append(ChooseOptionByImageAction())
-                elif action == SupportAction.REPLY_BY_CALCULATION_PROBLEM:
-                    print_to_user("计算题将使用大模型回答。")
-                    actions.append(ReplyByCalculationProblemAction())
-                else:
-                    raise ValueError(f"不支持的动作: {action}")
-                if local_input_("是否继续添加动作？(y/N)：").strip().lower() != "y":
-                    break
-            except (ValueError, ValidationError) as e:
-                print_to_user("错误: ")
-                print_to_user(e)
-        input_.incr()
-        return actions
-
-    def ask_one(self) -> SignChatV3:
-        input_ = UserInput(numbering_lang="chinese_simple")
-        chat_id = int(input_("Chat ID（登录时最近对话输出中的ID）: "))
-        name = input_("Chat名称（可选）: ")
-        use_message_thread = (
-            input_("是否发送到话题（message_thread_id）？(y/N)：").strip().lower()
-            == "y"
-        )
-        message_thread_id = None
-        if use_message_thread:
-            message_thread_id = int(input_("message_thread_id: "))
-        actions = self._ask_actions(input_)
-        delete_after = (
-            input_(
-                "等待N秒后删除消息（发送消息后等待进行删除, '0'表示立即删除, 不需要删除直接回车）, N: "
-            )
-            or None
-        )
-        if delete_after:
-            delete_after = int(delete_after)
-        cfgs = {
-            "chat_id": chat_id,
-            "message_thread_id": message_thread_id,
-            "name": name,
-            "delete_after": delete_after,
-            "actions": actions,
-        }
-        return SignChatV3.model_validate(cfgs)
+    def get_sign_record(self) -> Union[FileSignRecord, StoreSignRecord]:
+        """已启用存储时写入数据库，否则写入`sign_record.json`"""
+        store = open_store(self.workdir)
+        if store is not None:
+            return StoreSignRecord(store, self.task_name, self.user.id)
+        return FileSignRecord(self.sign_record_file)
 
-    def ask_for_config(self) -> "SignConfigV3":
-        chats = []
-        i = 1
-        print_to_user(f"开始配置任务<{self.task_name}>\n")
-        while True:
-            print_to_user(f"第{i}个任务: ")
-            try:
-                chat = self.ask_one()
-                print_to_user(chat)
-                print_to_user(f"第{i}个任务配置成功\n")
-                chats.append(chat)
-            except Exception as e:
-                print_to_user(e)
-                print_to_user("配置失败")
-                i -= 1
-            continue_ = input("继续配置任务？(y/N)：")
-            if continue_.strip().lower() != "y":
-                break
-            i += 1
-        sign_at_prompt = "签到时间（time或crontab表达式，如'06:00:00'或'0 6 * * *'）: "
-        sign_at_str = input(sign_at_prompt) or "06:00:00"
-        while not (sign_at := self._validate_sign_at(sign_at_str)):
-            print_to_user("请输入正确的时间格式")
-            sign_at_str = input(sign_at_prompt) or "06:00:00"
-
-        random_seconds_str = input("签到时间误差随机秒数（默认为0）: ") or "0"
-        random_seconds = int(float(random_seconds_str))
-        config = SignConfigV3.model_validate(
-            {
-                "chats": chats,
-                "sign_at": sign_at,
-                "random_seconds": random_seconds,
-            }
+    @staticmethod
+    def get_chat_key(chat: SignChatV3) -> str:
+        if chat.message_thread_id is None:
+            return str(chat.chat_id)
+        return f"{chat.chat_id}:{chat.message_thread_id}"
+
+    def get_sign_slot(self, config: SignConfigV3, now: datetime) -> str:
+        """当前所处的执行周期（最近一次cron触发时间），检查点按周期记录"""
+        cron_it = croniter(
+            self._validate_sign_at(config.sign_at), now + timedelta(seconds=1)
         )
-        if config.requires_ai:
-            print_to_user(OPENAI_USE_PROMPT)
-        return config
-
-    def _validate_sign_at(
-        self,
-        sign_at_str: str,
-    ) -> Optional[str]:
-        sign_at_str = sign_at_str.replace("：", ":").strip()
-
-        try:
-            sign_at = dt_time.fromisoformat(sign_at_str)
-            crontab_expr = self._time_to_crontab(sign_at)
-        except ValueError:
-            try:
-                croniter(sign_at_str)
-                crontab_expr = sign_at_str
-            except CroniterBadCronError:
-                self.log(f"时间格式错误: {sign_at_str}", level="error")
-                return None
-        return crontab_expr
+        return cron_it.get_prev(datetime).isoformat()
 
     @staticmethod
-    def _time_to_crontab(sign_at: dt_time) -> str:
-        return f"{sign_at.minute} {sign_at.hour} * * *"
-
-    def load_sign_record(self):
-        sign_record = {}
-        if not self.sign_record_file.is_file():
-            with open(self.sign_record_file, "w", encoding="utf-8") as fp:
-                json.dump(sign_record, fp)
-        else:
-            with open(self.sign_record_file, "r", encoding="utf-8") as fp:
-                sign_record = json.load(fp)
-        return sign_record
+    def get_resume_index(chat: SignChatV3, actions_done: int) -> int:
+        """
+        从第一个未完成的动作继续。若该动作需要等待回复（点击按钮、计算题等），
+        回复是由前面的发送动作触发的，需从最近的发送动作重新开始。
+        """
+        index = min(max(actions_done, 0), len(chat.actions))
+        while 0 < index < len(chat.actions) and not isinstance(
+            chat.actions[index], (SendTextAction, SendDiceAction)
+        ):
+            index -= 1
+        return index
 
     async def sign_a_chat(
         self,
         chat: SignChatV3,
+        start: int = 0,
+        on_action_done: Callable[[int], None] = None,
+        reply_timeout: float = REPLY_TIMEOUT_DEFAULT,
+        on_reply: Callable[[float], None] = None,
     ):
+        """
+        收到预期的回复后立即执行下一个动作，`action_interval`为相邻两个动作开始的最小间隔。
+
+        :param start: 从第几个动作开始（之前的动作已在检查点中记录为完成）
+        :param on_action_done: 每个动作完成后以已完成的动作数调用
+        :param reply_timeout: 等待回复的超时时间（秒）
+        :param on_reply: 收到预期的回复时以回复延迟（秒，从上一个动作完成时算起）调用
+        """
         self.log(f"开始执行: \n{chat}")
-        for action in chat.actions:
-            self.log(f"等待处理动作: {action}")
-            await self.wait_for(chat, action)
-            self.log(f"处理完成: {action}")
+        if start:
+            self.log(f"前{start}个动作已完成，从第{start + 1}个动作继续")
+        loop = asyncio.get_running_loop()
+        last_started = last_done = None
+        success_action = None  # 最近完成的、设置了成功标志的动作
+        route_key = self.get_route_key(chat.chat_id, chat.message_thread_id)
+        try:
+            for index, action in enumerate(chat.actions[start:], start):
+                self.context.pending_actions[route_key] = chat.actions[index:]
+                if last_started is not None:
+                    gap = chat.action_interval - (loop.time() - last_started)
+                    if success_action is not None:
+                        await self.wait_success_reply(chat, success_action, gap)
+                    elif gap > 0:
+                        await asyncio.sleep(gap)
+                self.log(f"等待处理动作: {action}")
+                last_started = loop.time()
+                await self.wait_for(
+                    chat,
+                    action,
+                    timeout=reply_timeout,
+                    success_action=success_action,
+                    since=last_done,
+                    on_reply=on_reply,
+                )
+                last_done = loop.time()
+                self.log(f"处理完成: {action}")
+                if on_action_done is not None:
+                    on_action_done(index + 1)
+                self.context.waiting_message = None
+                if action.success_pattern:
+                    success_action = action
+        except SignSucceeded as e:
             self.context.waiting_message = None
-            await asyncio.sleep(chat.action_interval)
+            self.log(f"收到成功回复，跳过剩余动作: {e}")
+        finally:
+            self.context.pending_actions.pop(route_key, None)
+            self.cancel_solutions(chat.chat_id)
 
     async def run(
-        self, num_of_dialogs=20, only_once: bool = False, force_rerun: bool = False
+        self,
+        num_of_dialogs=20,
+        only_once: bool = False,
+        force_rerun: bool = False,
+        retry_failed: int = 0,
+        ignore_checkpoints: bool = False,
     ):
+        kwargs = {
+            "only_once": only_once,
+            "force_rerun": force_rerun,
+            "retry_failed": retry_failed,
+            "ignore_checkpoints": ignore_checkpoints,
+        }
         if self.app.in_memory or self.app.session_string:
-            return await self.in_memory_run(
-                num_of_dialogs, only_once=only_once, force_rerun=force_rerun
-            )
-        return await self.normal_run(
-            num_of_dialogs, only_once=only_once, force_rerun=force_rerun
-        )
+            return await self.in_memory_run(num_of_dialogs, **kwargs)
+        return await self.normal_run(num_of_dialogs, **kwargs)
 
-    async def in_memory_run(
-        self, num_of_dialogs=20, only_once: bool = False, force_rerun: bool = False
-    ):
+    async def in_memory_run(self, num_of_dialogs=20, **kwargs):
         async with self.app:
-            await self.normal_run(
-                num_of_dialogs, only_once=only_once, force_rerun=force_rerun
-            )
+            await self.normal_run(num_of_dialogs, **kwargs)
 
     async def normal_run(
-        self, num_of_dialogs=20, only_once: bool = False, force_rerun: bool = False
+        self,
+        num_of_dialogs=20,
+        only_once: bool = False,
+        force_rerun: bool = False,
+        retry_failed: int = 0,
+        ignore_checkpoints: bool = False,
     ):
+        """
+        :param force_rerun: 忽略上次执行时间，立即执行
+        :param retry_failed: 失败的聊天最多重试的次数，间隔按指数退避
+        :param ignore_checkpoints: 忽略检查点，本周期内已完成的聊天也重新执行
+        """
         if self.user is None:
             await self.login(num_of_dialogs, print_chat=True)
 
@@ -942,32 +1295,91 @@ class UserSigner(BaseUserWorker[SignConfigV3]):
         if config.requires_ai:
             self.ensure_ai_cfg()
 
-        sign_record = self.load_sign_record()
-        chat_ids = [c.chat_id for c in config.chats]
+        sign_record = self.get_sign_record()
 
-        async def sign_once():
-            for chat in config.chats:
+        def save_progress(chat_key: str, done: int):
+            checkpoints[chat_key] = {"status": "running", "actions_done": done}
+            sign_record.save_checkpoint(slot, chat_key, "running", done)
+
+        async def sign_chats(chats: list[SignChatV3]) -> list[SignChatV3]:
+            failed = []
+            for chat in chats:
                 route_key = self.get_route_key(chat.chat_id, chat.message_thread_id)
-                self.context.sign_chats[route_key].append(chat)
+                chat_key = self.get_chat_key(chat)
+                checkpoint = checkpoints.get(chat_key) or {}
+                start = self.get_resume_index(chat, checkpoint.get("actions_done", 0))
+
+                if chat not in self.context.sign_chats[route_key]:
+                    self.context.sign_chats[route_key].append(chat)
+                timeout = reply_timeout(sign_record.get_latencies(chat_key))
+                if timeout != REPLY_TIMEOUT_DEFAULT:
+                    self.log(f"根据历史回复延迟，等待回复的超时时间为{timeout:.1f}秒")
                 try:
-                    await self.sign_a_chat(chat)
-                except errors.RPCError as _e:
+                    await self.sign_a_chat(
+                        chat,
+                        start,
+                        functools.partial(save_progress, chat_key),
+                        reply_timeout=timeout,
+                        on_reply=functools.partial(sign_record.add_latency, chat_key),
+                    )
+                except (errors.RPCError, SignActionTimeout) as _e:
                     self.log(f"签到失败: {_e} \nchat: \n{chat}")
                     logger.warning(_e, exc_info=True)
+                    failed.append(chat)
+                    done = (checkpoints.get(chat_key) or {}).get("actions_done", 0)
+                    checkpoints[chat_key] = {"status": "failed", "actions_done": done}
+                    sign_record.save_checkpoint(slot, chat_key, "failed", done, str(_e))
+                    sign_record.add_chat_result(
+                        chat.chat_id, chat.message_thread_id, "failed", str(_e)
+                    )
                     continue
+                checkpoints[chat_key] = {
+                    "status": "success",
+                    "actions_done": len(chat.actions),
+                }
+                sign_record.save_checkpoint(
+                    slot, chat_key, "success", len(chat.actions)
+                )
+                sign_record.add_chat_result(
+                    chat.chat_id, chat.message_thread_id, "success"
+                )
 
                 self.context.chat_messages[route_key].clear()
+                arrivals = self.context.message_arrivals
+                for key in [key for key in arrivals if key[0] == route_key]:
+                    del arrivals[key]
                 await asyncio.sleep(config.sign_interval)
-            sign_record[str(now.date())] = now.isoformat()
-            with open(self.sign_record_file, "w", encoding="utf-8") as fp:
-                json.dump(sign_record, fp)
+            return failed
+
+        async def sign_once():
+            chats = [
+                chat
+                for chat in config.chats
+                if (checkpoints.get(self.get_chat_key(chat)) or {}).get("status")
+                != "success"
+            ]
+            if skipped := len(config.chats) - len(chats):
+                self.log(f"本周期内已完成{skipped}个聊天，跳过")
+            sign_record.start_run(now)
+            failed = await sign_chats(chats)
+            for attempt in range(retry_failed):
+                if not failed:
+                    break
+                delay = _RETRY_BACKOFF_SECONDS * 2**attempt
+                self.log(
+                    f"{len(failed)}个聊天执行失败，{delay}秒后进行第{attempt + 1}次重试"
+                )
+                await asyncio.sleep(delay)
+                failed = await sign_chats(failed)
+            sign_record.finish_run(get_now(), "failed" if failed else "success")
 
         def need_sign(last_date_str):
             if force_rerun:
                 return True
-            if last_date_str not in sign_record:
+            last_sign_at = sign_record.last_sign_at(last_date_str)
+            if last_sign_at is None:
                 return True
-            _last_sign_at = datetime.fromisoformat(sign_record[last_date_str])
+            _last_sign_at = datetime.fromisoformat(last_sign_at)
             self.log(f"上次执行时间: {_last_sign_at}")
             _cron_it = croniter(self._validate_sign_at(config.sign_at), _last_sign_at)
             _next_run: datetime = _cron_it.next(datetime)
@@ -976,39 +1388,86 @@ class UserSigner(BaseUserWorker[SignConfigV3]):
                 return False
             return True
 
-        while True:
-            self.log(f"为以下Chat添加消息回调处理函数：{chat_ids}")
-            self.app.add_handler(
-                MessageHandler(self.on_message, filters.chat(chat_ids))
-            )
-            self.app.add_handler(
-                EditedMessageHandler(self.on_edited_message, filters.chat(chat_ids))
-            )
-            try:
-                async with self.app:
-                    now = get_now()
-                    self.log(f"当前时间: {now}")
-                    now_date_str = str(now.date())
-                    self.context = self.ensure_ctx()
-                    if need_sign(now_date_str):
-                        await sign_once()
-
-            except (OSError, errors.Unauthorized) as e:
-                logger.exception(e)
-                await asyncio.sleep(30)
-                continue
+        config_reloaded = asyncio.Event()
 
-            if only_once:
-                break
-            cron_it = croniter(self._validate_sign_at(config.sign_at), now)
-            next_run: datetime = cron_it.next(datetime) + timedelta(
-                seconds=random.randint(0, int(config.random_seconds))
-            )
-            self.log(f"下次运行时间: {next_run}")
-            await asyncio.sleep((next_run - now).total_seconds())
+        async def apply_config(new_config: SignConfigV3):
+            nonlocal config
+            config = new_config
+            self.subscribe_routes(self.get_config_routes(config))
+            config_reloaded.set()
+
+        watcher = None
+        if not only_once:
+            watcher = asyncio.create_task(self.watch_config(apply_config))
+        try:
+            while True:
+                self.subscribe_routes(self.get_config_routes(config))
+                try:
+                    async with self.app:
+                        now = get_now()
+                        self.log(f"当前时间: {now}")
+                        now_date_str = str(now.date())
+                        self.context = self.ensure_ctx()
+                        slot = self.get_sign_slot(config, now)
+                        checkpoints = (
+                            {}
+                            if ignore_checkpoints
+                            else sign_record.load_checkpoints(slot)
+                        )
+                        if need_sign(now_date_str):
+                            await sign_once()
+
+                except (OSError, errors.Unauthorized) as e:
+                    logger.exception(e)
+                    await asyncio.sleep(30)
+                    continue
+
+                if only_once:
+                    break
+                while True:
+                    config_reloaded.clear()
+                    cron_it = croniter(self._validate_sign_at(config.sign_at), now)
+                    next_run: datetime = cron_it.next(datetime) + timedelta(
+                        seconds=random.randint(0, int(config.random_seconds))
+                    )
+                    self.log(f"下次运行时间: {next_run}")
+                    try:
+                        await asyncio.wait_for(
+                            config_reloaded.wait(),
+                            timeout=(next_run - get_now()).total_seconds(),
+                        )
+                    except asyncio.TimeoutError:
+                        break
+                    self.log("配置已更新，重新计算下次运行时间")
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            self.unsubscribe_routes()
+
+    def get_config_routes(self, config: SignConfigV3) -> list[RouteKey]:
+        return [
+            self.get_route_key(c.chat_id, c.message_thread_id) for c in config.chats
+        ]
+
+    def subscribe_routes(self, routes: list[RouteKey]):
+        self.log(f"为以下Chat订阅消息：{routes}")
+        self.app.route_dispatcher.subscribe(
+            self,
+            routes,
+            on_message=self.on_message,
+            on_edited_message=self.on_edited_message,
+        )
 
-    async def run_once(self, num_of_dialogs):
-        return await self.run(num_of_dialogs, only_once=True, force_rerun=True)
+    async def run_once(
+        self, num_of_dialogs, retry_failed: int = 0, ignore_checkpoints: bool = False
+    ):
+        return await self.run(
+            num_of_dialogs,
+            only_once=True,
+            force_rerun=True,
+            retry_failed=retry_failed,
+            ignore_checkpoints=ignore_checkpoints,
+        )
 
     async def send_text(
         self,
@@ -1059,6 +1518,11 @@ class UserSigner(BaseUserWorker[SignConfigV3]):
             self.log("忽略意料之外的聊天", level="WARNING")
             return
         self.context.chat_messages[route_key][message.id] = message
+        self.context.message_arrivals[(route_key, message.id)] = (
+            asyncio.get_running_loop().time()
+        )
+        self.context.message_events[route_key].set()
+        self.prefetch_solutions(route_key, message)
 
     async def on_message(self, client: Client, message: Message):
         self.log(
@@ -1098,14 +1562,97 @@ class UserSigner(BaseUserWorker[SignConfigV3]):
                         return True
         return False
 
+    @staticmethod
+    def can_solve(action: ActionT, message: Message) -> bool:
+        """该消息是否是`action`需要用大模型处理的消息（计算题或图片选项）"""
+        if isinstance(action, ReplyByCalculationProblemAction):
+            return bool(message.text)
+        if isinstance(action, ChooseOptionByImageAction):
+            return bool(
+                message.photo and isinstance(message.reply_markup, InlineKeyboardMarkup)
+            )
+        return False
+
+    def get_solution(self, action: ActionT, message: Message) -> asyncio.Task:
+        """
+        返回处理该消息的任务（计算题的答案或选中的选项文本），已开始的任务会被复用。
+        消息被编辑后视为新的消息。
+        """
+        key = (
+            message.chat.id,
+            message.id,
+            action.action,
+            getattr(message, "edit_date", None),
+        )
+        task = self.context.solutions.get(key)
+        if task is None:
+            if isinstance(action, ReplyByCalculationProblemAction):
+                coro = self._solve_calculation_problem(message)
+            else:
+                coro = self._solve_option_by_image(message)
+            task = asyncio.create_task(coro)
+            task.add_done_callback(_retrieve_exception)
+            self.context.solutions[key] = task
+        return task
+
+    def prefetch_solutions(self, route_key: RouteKey, message: Message):
+        """
+        当前或下一个动作需要识别图片或计算时，收到消息即开始下载图片、调用大模型，
+        `wait_for`处理到该消息时直接使用已完成或进行中的结果。
+        """
+        current, *rest = self.context.pending_actions.get(route_key) or [None]
+        candidates = [current]
+        # 当前动作会用掉的消息不属于下一个动作
+        if rest and not self.may_consume(current, message):
+            candidates.append(rest[0])
+        for action in candidates:
+            if self.can_solve(action, message):
+                self.log(f"收到消息，提前开始处理: {action}")
+                self.get_solution(action, message)
+
+    def may_consume(self, action: ActionT, message: Message) -> bool:
+        if isinstance(action, ClickKeyboardByTextAction):
+            markup = message.reply_markup
+            return isinstance(markup, InlineKeyboardMarkup) and any(
+                action.text in (btn.text or "")
+                for row in markup.inline_keyboard
+                for btn in row
+            )
+        return self.can_solve(action, message)
+
+    def cancel_solutions(self, chat_id: int):
+        for key in [k for k in self.context.solutions if k[0] == chat_id]:
+            self.context.solutions.pop(key).cancel()
+
+    async def _solve_calculation_problem(self, message: Message) -> str:
+        self.log(f"问题: \n{message.text}")
+        answer = await self.get_ai_tools().calculate_problem(message.text)
+        self.log(f"回答为: {answer}")
+        return answer
+
+    async def _solve_option_by_image(self, message: Message) -> str:
+        flat_buttons = (b for row in message.reply_markup.inline_keyboard for b in row)
+        options = [btn.text for btn in flat_buttons if btn.text]
+        image_buffer: BinaryIO = await self.app.download_media(
+            message.photo.file_id, in_memory=True
+        )
+        image_buffer.seek(0)
+        image_bytes = image_buffer.read()
+        result_index = await self.get_ai_tools().choose_option_by_image(
+            image_bytes,
+            "选择正确的选项",
+            list(enumerate(options)),
+        )
+        result = options[result_index]
+        self.log(f"选择结果为: {result}")
+        return result
+
     async def _reply_by_calculation_problem(
         self, action: ReplyByCalculationProblemAction, message
     ):
-        if message.text:
+        if self.can_solve(action, message):
             self.log("检测到文本回复，尝试调用大模型进行计算题回答")
-            self.log(f"问题: \n{message.text}")
-            answer = await self.get_ai_tools().calculate_problem(message.text)
-            self.log(f"回答为: {answer}")
+            answer = await self.get_solution(action, message)
             await self.send_message(
                 message.chat.id,
                 answer,
@@ -1115,38 +1662,88 @@ class UserSigner(BaseUserWorker[SignConfigV3]):
         return False
 
     async def _choose_option_by_image(self, action: ChooseOptionByImageAction, message):
-        if reply_markup := message.reply_markup:
-            if isinstance(reply_markup, InlineKeyboardMarkup) and message.photo:
-                flat_buttons = (b for row in reply_markup.inline_keyboard for b in row)
-                option_to_btn = {btn.text: btn for btn in flat_buttons if btn.text}
-                self.log("检测到图片，尝试调用大模型进行图片识别并选择选项")
-                image_buffer: BinaryIO = await self.app.download_media(
-                    message.photo.file_id, in_memory=True
-                )
-                image_buffer.seek(0)
-                image_bytes = image_buffer.read()
-                options = list(option_to_btn)
-                result_index = await self.get_ai_tools().choose_option_by_image(
-                    image_bytes,
-                    "选择正确的选项",
-                    list(enumerate(options)),
-                )
-                result = options[result_index]
-                self.log(f"选择结果为: {result}")
-                target_btn = option_to_btn.get(result.strip())
-                if not target_btn:
-                    self.log("未找到匹配的按钮", level="WARNING")
-                    return False
-                await self.request_callback_answer(
-                    self.app,
-                    message.chat.id,
-                    message.id,
-                    target_btn.callback_data,
-                )
-                return True
+        if self.can_solve(action, message):
+            flat_buttons = (
+                b for row in message.reply_markup.inline_keyboard for b in row
+            )
+            option_to_btn = {btn.text: btn for btn in flat_buttons if btn.text}
+            self.log("检测到图片，尝试调用大模型进行图片识别并选择选项")
+            result = await self.get_solution(action, message)
+            target_btn = option_to_btn.get(result.strip())
+            if not target_btn:
+                self.log("未找到匹配的按钮", level="WARNING")
+                return False
+            await self.request_callback_answer(
+                self.app,
+                message.chat.id,
+                message.id,
+                target_btn.callback_data,
+            )
+            return True
         return False
 
-    async def wait_for(self, chat: SignChatV3, action: ActionT, timeout=10):
+    async def wait_messages(
+        self,
+        route_key: RouteKey,
+        timeout: float,
+        handle: Callable[[Message], Awaitable[bool]],
+    ) -> bool:
+        """
+        将`route_key`已收到和新收到的消息依次交给`handle`，`handle`返回True时结束等待。
+        收到新消息（或消息被编辑）时立即处理，而不是轮询。
+
+        :return: 超时返回False
+        """
+        event = self.context.message_events[route_key]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            event.clear()
+            messages_dict = self.context.chat_messages.get(route_key) or {}
+            for message in list(messages_dict.values()):
+                if message is None:
+                    continue
+                self.context.waiting_message = message
+                if await handle(message):
+                    # 将消息ID对应value置为None，保证收到消息的编辑时消息所处的顺序
+                    self.context.chat_messages[route_key][message.id] = None
+                    return True
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(event.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return False
+
+    async def wait_success_reply(
+        self, chat: SignChatV3, success_action: ActionT, timeout: float
+    ):
+        """在`timeout`内等待匹配`success_action.success_pattern`的回复"""
+        route_key = self.get_route_key(chat.chat_id, chat.message_thread_id)
+
+        async def handle(message: Message) -> bool:
+            if success_action.is_success_reply(message):
+                self.context.chat_messages[route_key][message.id] = None
+                raise SignSucceeded(message)
+            return False
+
+        await self.wait_messages(route_key, max(timeout, 0), handle)
+
+    async def wait_for(
+        self,
+        chat: SignChatV3,
+        action: ActionT,
+        timeout: float = REPLY_TIMEOUT_DEFAULT,
+        success_action: ActionT = None,
+        since: float = None,
+        on_reply: Callable[[float], None] = None,
+    ):
+        """
+        :param success_action: 等待期间若收到匹配其成功标志的回复，抛出`SignSucceeded`
+        :param since: 开始等待回复的时间（`loop.time()`），用于计算回复延迟，默认为现在
+        :param on_reply: 动作完成时以回复延迟（秒）调用
+        """
         route_key = self.get_route_key(chat.chat_id, chat.message_thread_id)
         if isinstance(action, SendTextAction):
             return await self.send_message(
@@ -1162,36 +1759,38 @@ class UserSigner(BaseUserWorker[SignConfigV3]):
                 chat.delete_after,
                 message_thread_id=chat.message_thread_id,
             )
-        self.context.waiter.add(route_key)
-        start = time.perf_counter()
-        last_message = None
-        while time.perf_counter() - start < timeout:
-            await asyncio.sleep(0.3)
-            messages_dict = self.context.chat_messages.get(route_key)
-            if not messages_dict:
-                continue
-            messages = list(messages_dict.values())
-            # 暂无新消息
-            if messages[-1] == last_message:
-                continue
-            last_message = messages[-1]
-            for message in messages:
-                self.context.waiting_message = message
-                ok = False
-                if isinstance(action, ClickKeyboardByTextAction):
-                    ok = await self._click_keyboard_by_text(action, message)
-                elif isinstance(action, ReplyByCalculationProblemAction):
-                    ok = await self._reply_by_calculation_problem(action, message)
-                elif isinstance(action, ChooseOptionByImageAction):
-                    ok = await self._choose_option_by_image(action, message)
-                if ok:
-                    self.context.waiter.sub(route_key)
-                    # 将消息ID对应value置为None，保证收到消息的编辑时消息所处的顺序
-                    self.context.chat_messages[route_key][message.id] = None
-                    return None
+
+        async def handle(message: Message) -> bool:
+            if success_action is not None and success_action.is_success_reply(message):
+                self.context.waiter.sub(route_key)
+                self.context.chat_messages[route_key][message.id] = None
+                raise SignSucceeded(message)
+            # 消息可能在开始等待之前（如动作间隔期间）就已到达
+            received_at = self.context.message_arrivals.get(
+                (route_key, message.id), loop.time()
+            )
+            ok = False
+            if isinstance(action, ClickKeyboardByTextAction):
+                ok = await self._click_keyboard_by_text(action, message)
+            elif isinstance(action, ReplyByCalculationProblemAction):
+                ok = await self._reply_by_calculation_problem(action, message)
+            elif isinstance(action, ChooseOptionByImageAction):
+                ok = await self._choose_option_by_image(action, message)
+            if not ok:
                 self.log(f"忽略消息: {readable_message(message)}")
+            elif on_reply is not None:
+                on_reply(max(0.0, received_at - since))
+            return ok
+
+        loop = asyncio.get_running_loop()
+        if since is None:
+            since = loop.time()
+        self.context.waiter.add(route_key)
+        if await self.wait_messages(route_key, timeout, handle):
+            self.context.waiter.sub(route_key)
+            return None
         self.log(f"等待超时: \nchat: \n{chat} \naction: {action}", level="WARNING")
-        return None
+        raise SignActionTimeout(f"等待超时: {action}")
 
     async def request_callback_answer(
         self,
@@ -1261,151 +1860,39 @@ class UserSigner(BaseUserWorker[SignConfigV3]):
                 print_to_user(f"{message.date}: {message.text}")
 
 
-class UserMonitor(BaseUserWorker[MonitorConfig]):
-    _workdir = ".monitor"
-    _tasks_dir = "monitors"
-    cfg_cls = MonitorConfig
-    config: MonitorConfig
-
-    def ask_one(self):
-        input_ = UserInput()
-        chat_id = (input_("Chat ID（登录时最近对话输出中的ID）: ")).strip()
-        if not chat_id.startswith("@"):
-            chat_id = int(chat_id)
-        rules = ["exact", "contains", "regex", "all"]
-        while rule := (input_(f"匹配规则({', '.join(rules)}): ") or "exact"):
-            if rule in rules:
-                break
-            print_to_user("不存在的规则, 请重新输入!")
-        rule_value = None
-        if rule != "all":
-            while not (rule_value := input_("规则值（不可为空）: ")):
-                print_to_user("不可为空！")
-                continue
-        from_user_ids = (
-            input_(
-                "只匹配来自特定用户ID的消息（多个用逗号隔开, 匹配所有用户直接回车）: "
-            )
-            or None
-        )
-        always_ignore_me = input_("总是忽略自己发送的消息（y/N）: ").lower() == "y"
-        if from_user_ids:
-            from_user_ids = [
-                i if i.startswith("@") else int(i) for i in from_user_ids.split(",")
-            ]
-        default_send_text = input_("默认发送文本（不需要则回车）: ") or None
-        ai_reply = False
-        ai_prompt = None
-        use_ai_reply = input_("是否使用AI进行回复(y/N): ") or "n"
-        if use_ai_reply.lower() == "y":
-            ai_reply = True
-            while not (ai_prompt := input_("输入你的提示词（作为`system prompt`）: ")):
-                print_to_user("不可为空！")
-                continue
-            print_to_user(OPENAI_USE_PROMPT)
-
-        send_text_search_regex = None
-        if not ai_reply:
-            send_text_search_regex = (
-                input_("从消息中提取发送文本的正则表达式（不需要则直接回车）: ") or None
-            )
-
-        if default_send_text or ai_reply or send_text_search_regex:
-            delete_after = (
-                input_(
-                    "发送消息后等待N秒进行删除（'0'表示立即删除, 不需要删除直接回车）， N: "
-                )
-                or None
-            )
-            if delete_after:
-                delete_after = int(delete_after)
-            forward_to_chat_id = (
-                input_("转发消息到该聊天ID，默认为消息来源：")
-            ).strip()
-            if forward_to_chat_id and not forward_to_chat_id.startswith("@"):
-                forward_to_chat_id = int(forward_to_chat_id)
-        else:
-            delete_after = None
-            forward_to_chat_id = None
-
-        push_via_server_chan = (
-            input_("是否通过Server酱推送消息(y/N): ") or "n"
-        ).lower() == "y"
-        server_chan_send_key = None
-        if push_via_server_chan:
-            server_chan_send_key = (
-                input_(
-                    "Server酱的SendKey（不填将从环境变量`SERVER_CHAN_SEND_KEY`读取）: "
-                )
-                or None
-            )
-
-        forward_to_external = (
-            input_("是否需要转发到外部（UDP, Http）(y/N): ").lower() == "y"
-        )
-        external_forwards = None
-        if forward_to_external:
-            external_forwards = []
-            if input_("是否需要转发到UDP(y/N): ").lower() == "y":
-                addr = input_("请输入UDP服务器地址和端口（形如`127.0.0.1:1234`）: ")
-                host, port = addr.split(":")
-                external_forwards.append(
-                    {
-                        "host": host,
-                        "port": int(port),
-                    }
-                )
-
-            if input_("是否需要转发到Http(y/N): ").lower() == "y":
-                url = input_("请输入Http地址（形如`http://127.0.0.1:1234`）: ")
-                external_forwards.append(
-                    {
-                        "url": url,
-                    }
-                )
+MatchIndex = dict[Union[int, str], list[tuple[int, MatchConfig]]]
 
-        return MatchConfig.model_validate(
-            {
-                "chat_id": chat_id,
-                "rule": rule,
-                "rule_value": rule_value,
-                "from_user_ids": from_user_ids,
-                "always_ignore_me": always_ignore_me,
-                "default_send_text": default_send_text,
-                "ai_reply": ai_reply,
-                "ai_prompt": ai_prompt,
-                "send_text_search_regex": send_text_search_regex,
-                "delete_after": delete_after,
-                "forward_to_chat_id": forward_to_chat_id,
-                "push_via_server_chan": push_via_server_chan,
-                "server_chan_send_key": server_chan_send_key,
-                "external_forwards": external_forwards,
-            }
-        )
 
-    def ask_for_config(self) -> "MonitorConfig":
-        i = 1
-        print_to_user(f"开始配置任务<{self.task_name}>")
-        print_to_user(
-            "聊天chat id和用户user id均同时支持整数id和字符串username, username必须以@开头，如@neo"
-        )
-        match_cfgs = []
-        while True:
-            print_to_user(f"\n配置第{i}个监控项")
-            try:
-                match_cfgs.append(self.ask_one())
-            except Exception as e:
-                print_to_user(e)
-                print_to_user("配置失败")
-                i -= 1
-            continue_ = input("继续配置？(y/N)：")
-            if continue_.strip().lower() != "y":
-                break
-            i += 1
-        config = MonitorConfig(match_cfgs=match_cfgs)
-        if config.requires_ai:
-            print_to_user(OPENAI_USE_PROMPT)
-        return config
+class UserMonitor(MonitorTaskManager, BaseUserWorker[MonitorConfig]):
+    config: MonitorConfig
+    match_index: MatchIndex = None
+    # 同时处理的监控项数量上限，以及单个监控项每一步（生成回复、发送、推送）的超时
+    max_concurrency: int = _MONITOR_CONCURRENCY
+    rule_timeout: Optional[float] = _MONITOR_RULE_TIMEOUT
+    catch_up_limit: int = _MONITOR_CATCH_UP_LIMIT
+    # 为空时不监控被编辑的消息
+    edit_window: Optional[float] = None
+    _rule_semaphore: Optional[asyncio.Semaphore] = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 每个目标聊天最后一个待发送的回复，新回复在其之后发送以保持顺序
+        self._chat_tails: dict[Union[int, str], asyncio.Task] = {}
+        self._rule_tasks: set[asyncio.Task] = set()
+        self._reply_limiters: dict[str, ReplyLimiter] = {}
+        # 汇总发送的监控项的缓冲区，以缓冲区文件名为键
+        self._digests: dict[str, DigestBuffer] = {}
+        self._digest_rules: dict[str, MatchConfig] = {}
+        self._flushing_digests: set[str] = set()
+        # 配置开启存档时为工作目录的存档写入器
+        self._archive: Optional[ArchiveWriter] = None
+        # 已处理的消息，登录后改为持久化到磁盘
+        self._processed = ProcessedMessages()
+        self._fired = FiredRules()
+        self._edits = EditCoalescer(0, self.process_edited_message)
+        self._last_message_ids: Optional[LastMessageIds] = None
+        # 补发离线消息期间收到的实时消息，补发完成后按顺序处理
+        self._live_backlog: Optional[list[Message]] = None
 
     @classmethod
     async def udp_forward(cls, f: UDPForward, message: Message):
@@ -1419,23 +1906,39 @@ class UserMonitor(BaseUserWorker[MonitorConfig]):
         finally:
             transport.close()
 
+    @property
+    def outbox(self) -> OutboxDispatcher:
+        return get_outbox_dispatcher(self.workdir)
+
     @classmethod
     async def http_api_callback(cls, f: HttpCallback, message: Message):
+        await deliver_http(cls.http_callback_payload(f, message))
+
+    @staticmethod
+    def http_callback_payload(f: HttpCallback, message: Message) -> dict:
         headers = f.headers or {}
         headers.update({"Content-Type": "application/json"})
-        content = str(message).encode("utf-8")
-        async with httpx.AsyncClient() as client:
-            await client.post(
-                str(f.url),
-                content=content,
-                headers=headers,
-                timeout=10,
+        payload = {"url": str(f.url), "headers": headers, "content": str(message)}
+        if f.max_batch_size:
+            payload.update(
+                max_batch_size=f.max_batch_size, linger_ms=f.linger_ms, gzip=f.gzip
             )
+        return payload
 
     async def forward_to_external(self, match_cfg: MatchConfig, message: Message):
         if not match_cfg.external_forwards:
             return
         for forward in match_cfg.external_forwards:
+            if isinstance(forward, FileForward):
+                # 高频写入，不逐条记录日志
+                get_file_sink(
+                    forward.path,
+                    forward.prefix,
+                    forward.max_bytes,
+                    forward.rotate_seconds,
+                    forward.compress,
+                ).write(message)
+                continue
             self.log(f"转发消息至{forward}")
             if isinstance(forward, UDPForward):
                 asyncio.create_task(
@@ -1445,47 +1948,489 @@ class UserMonitor(BaseUserWorker[MonitorConfig]):
                     )
                 )
             elif isinstance(forward, HttpCallback):
-                asyncio.create_task(
-                    self.http_api_callback(
-                        forward,
-                        message,
-                    )
+                # 先写入外发队列，接口暂时不可用时稍后重试
+                self.outbox.submit(
+                    "http_batch" if forward.max_batch_size else "http",
+                    str(forward.url),
+                    self.http_callback_payload(forward, message),
                 )
 
+    def get_username_cache(self, user: User = None) -> JSONFileCache:
+        user = user or self.user
+        ttl = float(os.environ.get(USERNAME_CACHE_TTL_ENV, 24 * 3600))
+        return JSONFileCache(self.get_user_dir(user) / "usernames.json", ttl=ttl)
+
+    async def resolve_usernames(
+        self, usernames: Iterable[str], refresh: bool = False
+    ) -> dict[str, int]:
+        """
+        将username解析为id，结果缓存在磁盘上
+        :param refresh: 忽略缓存重新解析
+        """
+        cache = self.get_username_cache()
+        resolved = {}
+        fetched = {}
+        for username in sorted(usernames):
+            chat_id = None if refresh else cache.get(username)
+            if chat_id is None:
+                try:
+                    chat = await self._call_telegram_api(
+                        "contacts.ResolveUsername",
+                        lambda u=username: self.app.get_chat(u),
+                    )
+                    chat_id = fetched[username] = chat.id
+                except (errors.RPCError, KeyError, ValueError) as e:
+                    self.log(f"解析username失败: @{username}, {e}", level="WARNING")
+                    # fall back to a stale entry rather than string matching
+                    chat_id = cache.get(username, ttl=-1)
+            if chat_id is not None:
+                resolved[username] = chat_id
+        if fetched:
+            cache.update(fetched)
+        return resolved
+
+    @staticmethod
+    def build_match_index(
+        config: MonitorConfig, resolved: dict[str, int]
+    ) -> MatchIndex:
+        """按chat id索引监控项，未能解析的username以小写username为键"""
+        index: MatchIndex = defaultdict(list)
+        for position, match_cfg in enumerate(config.match_cfgs):
+            match_cfg = match_cfg.resolve_usernames(resolved)
+            key, _ = normalize_route_key(match_cfg.chat_id)
+            index[key].append((position, match_cfg))
+        return dict(index)
+
+    def matchers_for(self, chat: Chat) -> list[MatchConfig]:
+        index = self.match_index or {}
+        entries = list(index.get(chat.id, []))
+        if chat.username:
+            entries.extend(index.get(chat.username.lower(), []))
+            entries.sort(key=lambda entry: entry[0])
+        return [match_cfg for _, match_cfg in entries]
+
+    def apply_match_index(self, index: MatchIndex):
+        self.match_index = index
+        # keep the budget of unchanged rules across reloads
+        limiters = self._reply_limiters
+        self._reply_limiters = {
+            match_cfg.rule_key: limiters.get(match_cfg.rule_key)
+            or ReplyLimiter(
+                match_cfg.cooldown_seconds,
+                match_cfg.max_replies_per_minute,
+                match_cfg.sender_cooldown_seconds,
+            )
+            for entries in index.values()
+            for _, match_cfg in entries
+            if match_cfg.limits_replies
+        }
+        self.load_digests(index)
+        self.app.route_dispatcher.subscribe(
+            self,
+            [(key, None) for key in index],
+            on_message=self.on_message,
+            on_edited_message=(
+                self.on_edited_message if self.edit_window is not None else None
+            ),
+            message_filter=lambda message: bool(message.text),
+        )
+
+    async def refresh_usernames(self, interval: float):
+        """定期重新解析username，以发现username的变更"""
+        while True:
+            await asyncio.sleep(interval)
+            config = self.config
+            if not config.usernames:
+                continue
+            try:
+                resolved = await self.resolve_usernames(config.usernames, refresh=True)
+            except Exception as e:
+                self.log(f"刷新username缓存失败: {e}", level="WARNING")
+                continue
+            index = self.build_match_index(config, resolved)
+            if index.keys() != (self.match_index or {}).keys():
+                self.log("username解析结果已变化，已更新监控项")
+            self.apply_match_index(index)
+
+    def get_rule_semaphore(self) -> asyncio.Semaphore:
+        if self._rule_semaphore is None:
+            self._rule_semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+        return self._rule_semaphore
+
+    async def with_rule_timeout(self, aw: Awaitable, step: str):
+        try:
+            return await asyncio.wait_for(aw, self.rule_timeout)
+        except asyncio.TimeoutError as e:
+            raise asyncio.TimeoutError(f"{step}超时（{self.rule_timeout}秒）") from e
+
     async def on_message(self, client, message: Message):
-        for match_cfg in self.config.match_cfgs:
+        if self._live_backlog is not None:
+            self._live_backlog.append(message)
+            return
+        await self.process_message(message)
+
+    async def process_message(self, message: Message):
+        """
+        为每个匹配的监控项创建后台任务后立即返回，不阻塞后续更新的处理。
+        发往同一聊天的回复按消息到达的顺序发送；已经处理过的消息直接跳过
+        """
+        if not self._processed.add(message.chat.id, message.id):
+            self.log(
+                f"消息已处理过，跳过: {message.chat.id}/{message.id}", level="DEBUG"
+            )
+            return
+        if self._last_message_ids is not None:
+            self._last_message_ids.update(message.chat.id, message.id)
+        if self._archive is not None:
+            self._archive.write(archive_record(self.user.id, message))
+        await self.run_rules(message)
+
+    async def on_edited_message(self, client, message: Message):
+        self._edits.submit(message)
+
+    async def process_edited_message(self, message: Message):
+        """连续编辑合并后的最终版本，只触发此前没有对这条消息触发过的监控项"""
+        self.log(f"消息被编辑: {message.chat.id}/{message.id}", level="DEBUG")
+        if self._archive is not None:
+            self._archive.write(archive_record(self.user.id, message))
+        await self.run_rules(message)
+
+    async def run_rules(self, message: Message):
+        for match_cfg in self.matchers_for(message.chat):
             if not match_cfg.match(message):
                 continue
+            if not self._fired.fire(message.chat.id, message.id, match_cfg.rule_key):
+                self.log(f"监控项已对该消息触发过，跳过: {match_cfg}", level="DEBUG")
+                continue
             self.log(f"匹配到监控项：{match_cfg}")
             await self.forward_to_external(match_cfg, message)
-            try:
-                send_text = await self.get_send_text(match_cfg, message)
-                if not send_text:
-                    self.log("发送内容为空", level="WARNING")
-                else:
-                    forward_to_chat_id = match_cfg.forward_to_chat_id or message.chat.id
-                    self.log(f"发送文本：{send_text}至{forward_to_chat_id}")
-                    await self.send_message(
-                        forward_to_chat_id,
-                        send_text,
-                        delete_after=match_cfg.delete_after,
+            if reason := self.acquire_reply(match_cfg, message):
+                self.log(f"回复受到限制（{reason}），跳过", level="DEBUG")
+                continue
+            target = match_cfg.forward_to_chat_id or message.chat.id
+            previous = self._chat_tails.get(target)
+            task = asyncio.create_task(
+                self.handle_match(match_cfg, message, target, previous)
+            )
+            self._chat_tails[target] = task
+            self._rule_tasks.add(task)
+            task.add_done_callback(functools.partial(self._on_rule_done, target))
+
+    def acquire_reply(self, match_cfg: MatchConfig, message: Message) -> Optional[str]:
+        """
+        检查监控项的冷却时间和回复频率
+        :return: 允许回复时为``None``，否则为被限制的原因
+        """
+        if not match_cfg.limits_replies:
+            return None
+        limiter = self._reply_limiters[match_cfg.rule_key]
+        sender = message.from_user or getattr(message, "sender_chat", None)
+        return limiter.acquire(sender.id if sender else None)
+
+    def report_suppressed(self):
+        """输出各监控项自上次报告以来被限制的回复次数"""
+        limiters = self._reply_limiters
+        for entries in (self.match_index or {}).values():
+            for _, match_cfg in entries:
+                limiter = limiters.get(match_cfg.rule_key)
+                if limiter is None or not limiter.suppressed:
+                    continue
+                suppressed = limiter.pop_suppressed()
+                details = "，".join(
+                    f"{_SUPPRESSION_REASONS[reason]}: {count}"
+                    for reason, count in sorted(suppressed.items())
+                )
+                self.log(
+                    f"监控项{match_cfg.chat_id}（{match_cfg.rule}）"
+                    f"有{suppressed.total()}次回复被限制（{details}）"
+                )
+
+    async def report_suppressed_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.report_suppressed()
+
+    def _on_rule_done(self, target: Union[int, str], task: asyncio.Task):
+        self._rule_tasks.discard(task)
+        if self._chat_tails.get(target) is task:
+            del self._chat_tails[target]
+
+    async def cancel_rule_tasks(self):
+        tasks = list(self._rule_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def handle_match(
+        self,
+        match_cfg: MatchConfig,
+        message: Message,
+        target: Union[int, str],
+        previous: Optional[asyncio.Task] = None,
+    ):
+        """
+        处理一个匹配的监控项
+        :param target: 回复发送到的聊天
+        :param previous: 同一聊天中前一个回复的任务，本回复在其完成后发送
+        """
+        semaphore = self.get_rule_semaphore()
+        try:
+            async with semaphore:
+                send_text = await self.with_rule_timeout(
+                    self.get_send_text(match_cfg, message), "生成回复"
+                )
+            if previous is not None:
+                # the previous rule reports its own errors
+                await asyncio.gather(previous, return_exceptions=True)
+            if match_cfg.digest:
+                self.add_to_digest(match_cfg, message, target, send_text)
+                return
+            if not send_text:
+                self.log("发送内容为空", level="WARNING")
+            else:
+                self.log(f"发送文本：{send_text}至{target}")
+                async with semaphore:
+                    sent = await self.with_rule_timeout(
+                        self.send_message(target, send_text), "发送消息"
                     )
+                if match_cfg.delete_after is not None:
+                    self.schedule_delete(sent, match_cfg.delete_after)
+
+            if match_cfg.push_via_server_chan:
+                self.push_via_server_chan(
+                    match_cfg,
+                    f"匹配到监控项：{match_cfg.chat_id}",
+                    f"消息内容为:\n\n{message.text}",
+                )
+        except asyncio.TimeoutError as e:
+            self.log(f"处理监控项{match_cfg.chat_id}失败: {e}", level="WARNING")
+        except IndexError as e:
+            logger.exception(e)
+        except Exception as e:
+            self.log(f"处理监控项{match_cfg.chat_id}失败: {e}", level="ERROR")
+
+    def push_via_server_chan(self, match_cfg: MatchConfig, title: str, desp: str):
+        server_chan_send_key = match_cfg.server_chan_send_key or os.environ.get(
+            "SERVER_CHAN_SEND_KEY"
+        )
+        if not server_chan_send_key:
+            self.log("未配置Server酱的SendKey", level="WARNING")
+            return
+        self.outbox.submit(
+            "server_chan",
+            server_chan_destination(server_chan_send_key),
+            {"send_key": server_chan_send_key, "title": title, "desp": desp},
+        )
+
+    def get_digest_dir(self) -> pathlib.Path:
+        return self.task_dir / str(self.user.id) / DIGEST_DIR_NAME
+
+    def load_digests(self, index: MatchIndex):
+        """
+        打开汇总发送的监控项的缓冲区，配置中已不存在的监控项的缓冲区保留，
+        其中的记录将尽快发送（不再推送）
+        """
+        if self.user is None:
+            return
+        digests = self._digests
+        self._digests = {}
+        self._digest_rules = {}
+        for entries in index.values():
+            for _, match_cfg in entries:
+                if match_cfg.digest:
+                    self._digest_rules[digest_file_name(match_cfg.rule_key)] = match_cfg
+        digest_dir = self.get_digest_dir()
+        names = {path.name for path in digest_dir.glob("*.jsonl")}
+        for name in names | self._digest_rules.keys():
+            buffer = digests.get(name)
+            if buffer is None:
+                buffer = DigestBuffer(digest_dir / name)
+            if name in self._digest_rules or buffer:
+                self._digests[name] = buffer
+
+    def add_to_digest(
+        self,
+        match_cfg: MatchConfig,
+        message: Message,
+        target: Union[int, str],
+        send_text: Optional[str],
+    ):
+        if not send_text and not match_cfg.push_via_server_chan:
+            self.log("发送内容为空", level="WARNING")
+            return
+        name = digest_file_name(match_cfg.rule_key)
+        buffer = self._digests[name]
+        buffer.append(
+            {
+                "at": time.time(),
+                "chat_id": message.chat.id,
+                "message_id": message.id,
+                "text": message.text,
+                "target": target,
+                "send_text": send_text,
+            }
+        )
+        self.log(f"已加入摘要，待发送{len(buffer)}条", level="DEBUG")
+        if len(buffer) >= match_cfg.digest.max_items:
+            self.schedule_flush_digest(name)
+
+    def schedule_flush_digest(self, name: str):
+        if name in self._flushing_digests:
+            return
+        self._flushing_digests.add(name)
+        task = asyncio.create_task(self.flush_digest(name))
+        self._rule_tasks.add(task)
+        task.add_done_callback(self._rule_tasks.discard)
+        task.add_done_callback(lambda _: self._flushing_digests.discard(name))
+
+    async def flush_digest(self, name: str):
+        """发送缓冲区中的记录，失败时放回缓冲区，下次重试"""
+        buffer = self._digests.get(name)
+        if buffer is None:
+            return
+        match_cfg = self._digest_rules.get(name)
+        entries = buffer.take()
+        if not entries:
+            return
+        try:
+            await self.send_digest(match_cfg, entries)
+        except Exception as e:
+            self.log(f"发送摘要失败，将稍后重试: {e}", level="WARNING")
+            buffer.restore(entries)
+            return
+        buffer.done()
+        if match_cfg is None:
+            buffer.discard()
+            self._digests.pop(name, None)
 
-                if match_cfg.push_via_server_chan:
-                    server_chan_send_key = (
-                        match_cfg.server_chan_send_key
-                        or os.environ.get("SERVER_CHAN_SEND_KEY")
+    async def send_digest(self, match_cfg: Optional[MatchConfig], entries: list[dict]):
+        """
+        将多条匹配记录合并为一条消息（过长时拆分）和一次推送
+        :param match_cfg: 监控项，为``None``时表示该监控项已从配置中移除，只发送消息
+        """
+        texts_by_target: dict[Union[int, str], list[str]] = {}
+        for entry in entries:
+            if entry["send_text"]:
+                texts_by_target.setdefault(entry["target"], []).append(
+                    entry["send_text"]
+                )
+        for target, texts in texts_by_target.items():
+            self.log(f"发送摘要（{len(texts)}条）至{target}")
+            for chunk in split_digest(texts):
+                async with self.get_rule_semaphore():
+                    sent = await self.with_rule_timeout(
+                        self.send_message(target, chunk), "发送摘要"
                     )
-                    if not server_chan_send_key:
-                        self.log("未配置Server酱的SendKey", level="WARNING")
-                    else:
-                        await sc_send(
-                            server_chan_send_key,
-                            f"匹配到监控项：{match_cfg.chat_id}",
-                            f"消息内容为:\n\n{message.text}",
+                if match_cfg and match_cfg.delete_after is not None:
+                    self.schedule_delete(sent, match_cfg.delete_after)
+        if match_cfg and match_cfg.push_via_server_chan:
+            self.push_via_server_chan(
+                match_cfg,
+                f"匹配到监控项：{match_cfg.chat_id}（{len(entries)}条）",
+                "\n\n".join(f"- {entry['text']}" for entry in entries),
+            )
+
+    async def flush_digests_periodically(self, interval: float):
+        """定期发送到期的摘要：第一条记录加入后超过`digest.interval`秒"""
+        while True:
+            await asyncio.sleep(interval)
+            now = time.time()
+            for name, buffer in list(self._digests.items()):
+                if not buffer:
+                    continue
+                match_cfg = self._digest_rules.get(name)
+                if match_cfg is None or now - buffer.first_at >= (
+                    match_cfg.digest.interval
+                ):
+                    self.schedule_flush_digest(name)
+
+    def get_last_message_ids_file(self) -> pathlib.Path:
+        return self.task_dir / str(self.user.id) / LAST_MESSAGE_IDS_FILE_NAME
+
+    def get_processed_dir(self) -> pathlib.Path:
+        return self.task_dir / str(self.user.id) / PROCESSED_DIR_NAME
+
+    def save_progress(self):
+        """保存各聊天最后处理的消息id和已处理消息的记录"""
+        self._last_message_ids.save()
+        self._processed.save()
+
+    async def save_progress_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.save_progress()
+
+    async def get_missed_messages(self, chat_id: int, after_id: int) -> list[Message]:
+        """`after_id`之后的文本消息（最多最新的`catch_up_limit`条），按时间顺序"""
+
+        async def _collect_messages():
+            messages = []
+            async for message in self.app.get_chat_history(
+                chat_id, limit=self.catch_up_limit, min_id=after_id + 1
+            ):
+                if message.id > after_id and message.text:
+                    messages.append(message)
+            messages.reverse()
+            return messages
+
+        return await self._call_telegram_api(
+            "messages.GetHistory", _collect_messages, exclusive=False
+        )
+
+    async def catch_up(self):
+        """
+        补发离线期间监控聊天中的消息，期间收到的实时消息在补发完成后处理，
+        两者重复的消息只处理一次
+        """
+        try:
+            last_ids = self._last_message_ids
+            index = self.match_index or {}
+            chat_ids = [chat_id for chat_id in last_ids.chat_ids() if chat_id in index]
+            semaphore = asyncio.Semaphore(_CATCH_UP_CONCURRENCY)
+
+            async def fetch(chat_id: int) -> list[Message]:
+                async with semaphore:
+                    try:
+                        return await self.get_missed_messages(
+                            chat_id, last_ids.get(chat_id)
                         )
-            except IndexError as e:
-                logger.exception(e)
+                    except Exception as e:
+                        self.log(f"获取{chat_id}的离线消息失败: {e}", level="WARNING")
+                        return []
+
+            results = await asyncio.gather(*(fetch(chat_id) for chat_id in chat_ids))
+            count = 0
+            for messages in results:
+                for message in messages:
+                    await self.process_message(message)
+                count += len(messages)
+            if count:
+                self.log(f"已补发{len(chat_ids)}个聊天中离线期间的{count}条消息")
+        finally:
+            while self._live_backlog:
+                backlog, self._live_backlog = self._live_backlog, []
+                for message in backlog:
+                    await self.process_message(message)
+            self._live_backlog = None
+
+    def schedule_delete(self, message: Message, delete_after: int):
+        """在后台延迟删除已发送的消息，不占用监控项的处理时间"""
+
+        async def delete():
+            await asyncio.sleep(delete_after)
+            try:
+                await self._call_telegram_api("messages.DeleteMessages", message.delete)
+            except errors.RPCError as e:
+                self.log(f"删除消息失败: {e}", level="WARNING")
+            else:
+                self.log(f"Message「{message.text}」 to {message.chat.id} deleted!")
+
+        self.log(
+            f"Message「{message.text}」 to {message.chat.id} will be deleted after {delete_after} seconds."
+        )
+        task = asyncio.create_task(delete())
+        self._rule_tasks.add(task)
+        task.add_done_callback(self._rule_tasks.discard)
 
     async def get_send_text(self, match_cfg: MatchConfig, message: Message) -> str:
         send_text = match_cfg.get_send_text(message.text)
@@ -1496,20 +2441,86 @@ class UserMonitor(BaseUserWorker[MonitorConfig]):
             )
         return send_text
 
-    async def run(self, num_of_dialogs=20):
+    async def run(
+        self,
+        num_of_dialogs=20,
+        max_concurrency: int = None,
+        rule_timeout: Optional[float] = None,
+        catch_up_limit: Optional[int] = None,
+    ):
+        """
+        :param max_concurrency: 同时处理的监控项数量上限
+        :param rule_timeout: 秒, 单个监控项每一步的超时，``0`` 表示不限制
+        :param catch_up_limit: 重启后每个聊天最多补发的离线消息数量，``0`` 表示不补发
+        """
+        if max_concurrency:
+            self.max_concurrency = max_concurrency
+            self._rule_semaphore = None
+        if rule_timeout is not None:
+            self.rule_timeout = rule_timeout or None
+        if catch_up_limit is not None:
+            self.catch_up_limit = catch_up_limit
         if self.user is None:
             await self.login(num_of_dialogs, print_chat=True)
+        self._last_message_ids = LastMessageIds(self.get_last_message_ids_file())
+        self._processed = ProcessedMessages(self.get_processed_dir())
 
         cfg = self.load_config(self.cfg_cls)
         if cfg.requires_ai:
             self.ensure_ai_cfg()
 
-        self.app.add_handler(
-            MessageHandler(self.on_message, filters.text & filters.chat(cfg.chat_ids)),
-        )
-        async with self.app:
-            self.log("开始监控...")
-            await idle()
+        background_tasks = []
+        # match by username until the client is connected and can resolve them
+        self.apply_match_index(self.build_match_index(cfg, {}))
+        outbox = self.outbox
+        outbox.start()
+        try:
+            async with self.app:
+                if self.catch_up_limit and len(self._last_message_ids):
+                    # 补发完成前先缓存实时消息
+                    self._live_backlog = []
+                await self.apply_config(cfg)
+                background_tasks = [
+                    asyncio.create_task(
+                        self.save_progress_periodically(_PROGRESS_SAVE_INTERVAL)
+                    ),
+                    asyncio.create_task(
+                        self.refresh_usernames(_USERNAME_REFRESH_INTERVAL)
+                    ),
+                    asyncio.create_task(self.watch_config(self.apply_config)),
+                    asyncio.create_task(
+                        self.flush_digests_periodically(_DIGEST_CHECK_INTERVAL)
+                    ),
+                    asyncio.create_task(
+                        self.report_suppressed_periodically(
+                            _SUPPRESSION_REPORT_INTERVAL
+                        )
+                    ),
+                ]
+                if self._live_backlog is not None:
+                    background_tasks.append(asyncio.create_task(self.catch_up()))
+                self.log("开始监控...")
+                await idle()
+        finally:
+            for task in background_tasks:
+                task.cancel()
+            self.unsubscribe_routes()
+            await self._edits.cancel()
+            await self.cancel_rule_tasks()
+            self.save_progress()
+            if self._processed.hits:
+                self.log(f"共跳过{self._processed.hits}条重复的消息")
+            self.report_suppressed()
+            await outbox.release()
+            await asyncio.to_thread(close_file_sinks)
+            await asyncio.to_thread(close_archive_writers)
+
+    async def apply_config(self, config: MonitorConfig):
+        """解析username并重建监控项索引，无需重新连接客户端"""
+        resolved = await self.resolve_usernames(config.usernames)
+        self.edit_window = self._edits.window = config.edit_window
+        self.apply_match_index(self.build_match_index(config, resolved))
+        self._archive = get_archive_writer(self.workdir) if config.archive else None
 
 
 class _UDPProtocol(asyncio.DatagramProtocol):
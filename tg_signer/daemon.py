@@ -0,0 +1,187 @@
+import asyncio
+import json
+import logging
+import os
+import pathlib
+import socket
+from typing import Any, Optional, Union
+
+from tg_signer.utils import capture_user_output
+
+logger = logging.getLogger("tg-signer")
+
+DAEMON_SOCKET_ENV = "TG_SIGNER_DAEMON_SOCKET"
+DAEMON_SOCKET_NAME = "daemon.sock"
+DAEMON_CONNECT_TIMEOUT = 0.5
+DAEMON_REQUEST_TIMEOUT = 600
+
+# methods of `UserSigner` that CLI commands may forward to the daemon
+DAEMON_METHODS = frozenset(
+    {
+        "send_text",
+        "send_dice_cli",
+        "schedule_messages",
+        "get_schedule_messages",
+        "list_topics",
+    }
+)
+
+
+class DaemonError(Exception):
+    pass
+
+
+def get_daemon_socket(workdir: Union[str, pathlib.Path]) -> pathlib.Path:
+    path = os.environ.get(DAEMON_SOCKET_ENV)
+    if path:
+        return pathlib.Path(path)
+    return pathlib.Path(workdir) / DAEMON_SOCKET_NAME
+
+
+def get_account_key(session_dir: Union[str, pathlib.Path], account: str) -> str:
+    """与``Client.key``一致，用于确认守护进程是否管理该账号"""
+    return str(pathlib.Path(session_dir).joinpath(account).resolve())
+
+
+class SignerDaemon:
+    """
+    常驻进程：保持各账号的客户端处于连接状态，并通过Unix socket接收CLI转发的请求。
+
+    协议为每行一个JSON：请求为``{"account_key", "method", "params"}``，
+    响应为``{"ok": true, "output": [...]}``或``{"ok": false, "error", "code"}``。
+    """
+
+    def __init__(self, signers: list, socket_path: Union[str, pathlib.Path]):
+        self.signers = {signer.app.key: signer for signer in signers}
+        self.socket_path = pathlib.Path(socket_path)
+        self.server: Optional[asyncio.AbstractServer] = None
+        self._connected: list = []
+
+    async def start(self, num_of_dialogs: int = 20):
+        # 先占用socket再登录，已有守护进程在运行时不必登录各账号
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.socket_path.exists():
+            if await asyncio.to_thread(ping_daemon, self.socket_path):
+                raise DaemonError(f"守护进程已在运行: {self.socket_path}")
+            self.socket_path.unlink()
+        self.server = await asyncio.start_unix_server(
+            self.handle_connection, path=str(self.socket_path), start_serving=False
+        )
+        os.chmod(self.socket_path, 0o600)
+        for signer in self.signers.values():
+            await signer.app.__aenter__()
+            self._connected.append(signer)
+            await signer.login(num_of_dialogs, print_chat=False)
+            signer.log("守护进程已保持该账号连接")
+        await self.server.start_serving()
+        logger.info(f"守护进程已启动，监听: {self.socket_path}")
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+        while self._connected:
+            await self._connected.pop().app.__aexit__(None, None, None)
+
+    async def serve_forever(self, num_of_dialogs: int = 20):
+        try:
+            await self.start(num_of_dialogs)
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            while line := await reader.readline():
+                try:
+                    response = await self.handle_request(json.loads(line))
+                except json.JSONDecodeError as e:
+                    response = {"ok": False, "code": "bad_request", "error": str(e)}
+                writer.write(json.dumps(response, ensure_ascii=False).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, request: dict) -> dict[str, Any]:
+        method = request.get("method")
+        if method == "ping":
+            return {"ok": True, "accounts": list(self.signers)}
+        if method not in DAEMON_METHODS:
+            return {
+                "ok": False,
+                "code": "bad_request",
+                "error": f"不支持的方法: {method}",
+            }
+        signer = self.signers.get(request.get("account_key"))
+        if signer is None:
+            return {"ok": False, "code": "unknown_account", "error": "未管理该账号"}
+        with capture_user_output() as output:
+            try:
+                await getattr(signer, method)(**(request.get("params") or {}))
+            except Exception as e:
+                logger.error(f"守护进程处理请求失败: {method}, {e}", exc_info=True)
+                return {
+                    "ok": False,
+                    "code": "failed",
+                    "error": str(e),
+                    "output": output,
+                }
+        return {"ok": True, "output": output}
+
+
+def _request(
+    socket_path: pathlib.Path, payload: dict, timeout: float
+) -> Optional[dict]:
+    if not hasattr(socket, "AF_UNIX") or not socket_path.exists():
+        return None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(DAEMON_CONNECT_TIMEOUT)
+        try:
+            sock.connect(str(socket_path))
+        except OSError:
+            return None
+        sock.settimeout(timeout)
+        sock.sendall(json.dumps(payload, ensure_ascii=False).encode() + b"\n")
+        with sock.makefile("rb") as fp:
+            line = fp.readline()
+    if not line:
+        raise DaemonError("守护进程未返回结果")
+    return json.loads(line)
+
+
+def ping_daemon(socket_path: Union[str, pathlib.Path]) -> Optional[list[str]]:
+    """返回守护进程管理的账号，守护进程不可用时返回``None``"""
+    try:
+        response = _request(
+            pathlib.Path(socket_path), {"method": "ping"}, DAEMON_CONNECT_TIMEOUT
+        )
+    except (OSError, DaemonError, json.JSONDecodeError):
+        return None
+    return response.get("accounts") if response else None
+
+
+def call_daemon(
+    socket_path: Union[str, pathlib.Path],
+    account_key: str,
+    method: str,
+    params: dict,
+    timeout: float = DAEMON_REQUEST_TIMEOUT,
+) -> Optional[list[str]]:
+    """
+    将请求转发给守护进程并返回其输出。守护进程不可用或未管理该账号时返回``None``，
+    由调用方在本进程中执行。
+    """
+    payload = {"account_key": account_key, "method": method, "params": params}
+    response = _request(pathlib.Path(socket_path), payload, timeout)
+    if response is None or response.get("code") == "unknown_account":
+        return None
+    if not response.get("ok"):
+        raise DaemonError(response.get("error") or "守护进程处理请求失败")
+    return response.get("output") or []
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+from typing import Iterator, Optional
+
+from .utils import make_dirs, write_text_atomic
+
+logger = logging.getLogger("tg-signer")
+
+DIGEST_DIR_NAME = "digests"
+# Telegram单条文本消息的最大长度
+MAX_MESSAGE_LENGTH = 4096
+
+
+def digest_file_name(rule_key: str) -> str:
+    return hashlib.sha1(rule_key.encode("utf-8")).hexdigest()[:16] + ".jsonl"
+
+
+class DigestBuffer:
+    """
+    一个监控项等待汇总发送的匹配记录。
+
+    记录追加写入JSONL文件，重启后不会丢失。发送前`take`将文件移到一旁，
+    发送过程中进程退出时，下次打开缓冲区会重新载入这些记录。
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+        self.taking_path = self.path.with_name(self.path.name + ".sending")
+        make_dirs(self.path.parent)
+        entries = list(self._read(self.path))
+        if self.taking_path.exists():
+            entries = self._write(list(self._read(self.taking_path)) + entries)
+            self.taking_path.unlink()
+        self.size = len(entries)
+        self.first_at: Optional[float] = entries[0]["at"] if entries else None
+
+    @staticmethod
+    def _read(path: pathlib.Path) -> Iterator[dict]:
+        if not path.is_file():
+            return
+        with open(path, encoding="utf-8") as fp:
+            for line in fp:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程退出时写了一半的行
+                    logger.warning(f"忽略损坏的摘要记录: {path}")
+
+    def __len__(self):
+        return self.size
+
+    def append(self, entry: dict):
+        with open(self.path, "a", encoding="utf-8") as fp:
+            fp.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        if not self.size:
+            self.first_at = entry["at"]
+        self.size += 1
+
+    def take(self) -> list[dict]:
+        """取出所有待发送的记录，发送成功后调用`done`，失败时调用`restore`"""
+        if not self.size:
+            return []
+        os.replace(self.path, self.taking_path)
+        self.size = 0
+        self.first_at = None
+        return list(self._read(self.taking_path))
+
+    def done(self):
+        self.taking_path.unlink(missing_ok=True)
+
+    def restore(self, entries: list[dict]):
+        """将发送失败的记录放回缓冲区，下次一并发送"""
+        entries = self._write(entries + list(self._read(self.path)))
+        self.taking_path.unlink(missing_ok=True)
+        self.size = len(entries)
+        self.first_at = entries[0]["at"] if entries else None
+
+    def _write(self, entries: list[dict]) -> list[dict]:
+        entries = sorted(entries, key=lambda e: e["at"])
+        write_text_atomic(
+            self.path,
+            "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries),
+        )
+        return entries
+
+    def discard(self):
+        self.path.unlink(missing_ok=True)
+        self.taking_path.unlink(missing_ok=True)
+        self.size = 0
+        self.first_at = None
+
+
+def split_digest(lines: list[str], limit: int = MAX_MESSAGE_LENGTH) -> list[str]:
+    """将多行文本按消息长度限制拼接为尽量少的消息"""
+    chunks = []
+    current = ""
+    for line in lines:
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            chunks.append(current)
+            candidate = line
+        current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
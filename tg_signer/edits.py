@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Hashable, Optional
+
+from pyrogram.types import Message
+
+logger = logging.getLogger("tg-signer")
+
+# 消息一直在被编辑时，最多等待`window`的该倍数后也处理最后的版本
+MAX_WAIT_FACTOR = 10
+
+
+class _PendingEdit:
+    __slots__ = ("message", "first_at", "handle")
+
+    def __init__(self, message: Message, first_at: float):
+        self.message = message
+        self.first_at = first_at
+        self.handle: Optional[asyncio.TimerHandle] = None
+
+
+class EditCoalescer:
+    """
+    合并同一条消息的连续编辑：最后一次编辑后`window`秒内没有新的编辑时，
+    只将最后的版本交给`on_final`。
+    """
+
+    def __init__(
+        self,
+        window: float,
+        on_final: Callable[[Message], Awaitable[None]],
+    ):
+        self.window = window
+        self.on_final = on_final
+        self._pending: dict[Hashable, _PendingEdit] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, message: Message):
+        key = (message.chat.id, message.id)
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = _PendingEdit(message, now)
+        else:
+            pending.message = message
+            pending.handle.cancel()
+        delay = min(self.window, pending.first_at + self.window * MAX_WAIT_FACTOR - now)
+        pending.handle = loop.call_later(max(0.0, delay), self._flush, key)
+
+    def _flush(self, key: Hashable):
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        task = asyncio.create_task(self.on_final(pending.message))
+        self._tasks.add(task)
+        task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and (e := task.exception()) is not None:
+            logger.error(
+                f"处理编辑的消息时发生错误: {e}",
+                exc_info=(type(e), e, e.__traceback__),
+            )
+
+    async def cancel(self):
+        """丢弃尚未处理的编辑"""
+        for pending in self._pending.values():
+            pending.handle.cancel()
+        self._pending.clear()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,249 @@
+import collections
+import gzip
+import json
+import logging
+import os
+import pathlib
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Literal, Optional, Union
+
+from pyrogram.types import Object
+
+logger = logging.getLogger("tg-signer")
+
+CompressionT = Optional[Literal["gzip", "zstd"]]
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# 待写入的记录超过该数量时丢弃新记录，避免磁盘写入跟不上时内存无限增长
+DEFAULT_MAX_PENDING = 200_000
+FLUSH_INTERVAL_SECONDS = 0.2
+# 待写入的记录达到该数量时立即唤醒写入线程
+WAKE_BATCH_SIZE = 1000
+WRITE_BUFFER_SIZE = 1024 * 1024
+SEGMENT_SUFFIX = ".jsonl"
+COMPRESSED_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def _default(obj: Any):
+    """
+    与`Object.default`的输出相同，但先跳过值为``None``的属性：消息对象的大部分属性
+    为``None``，这样序列化快数倍
+    """
+    if not isinstance(obj, Object):
+        return Object.default(obj)
+    data = {"_": obj.__class__.__name__}
+    for attr, value in obj.__dict__.items():
+        if value is None or attr.startswith("_") or attr == "raw":
+            continue
+        data[attr] = "*" * 9 if attr == "phone_number" else value
+    return data
+
+
+def dumps_compact(obj: Any) -> str:
+    if isinstance(obj, str):
+        return obj
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":"))
+
+
+def compress_segment(path: pathlib.Path, compress: CompressionT) -> pathlib.Path:
+    """压缩写完的分段文件，完成后删除原文件"""
+    if compress == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            logger.warning("未安装zstandard（pip install zstandard），改用gzip压缩")
+            compress = "gzip"
+    target = path.with_name(path.name + COMPRESSED_SUFFIXES[compress])
+    tmp_path = target.with_name(target.name + ".tmp")
+    with open(path, "rb") as src:
+        if compress == "zstd":
+            with open(tmp_path, "wb") as raw:
+                with zstandard.ZstdCompressor().stream_writer(raw) as dst:
+                    shutil.copyfileobj(src, dst, WRITE_BUFFER_SIZE)
+        else:
+            with gzip.open(tmp_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, WRITE_BUFFER_SIZE)
+    os.replace(tmp_path, target)
+    path.unlink()
+    return target
+
+
+class JsonlFileSink:
+    """
+    将记录以紧凑的JSON行追加写入按大小或时间轮转的分段文件。
+
+    `write`只把记录放入内存队列，序列化和写盘都在单独的线程中批量进行，
+    不阻塞事件循环；写完的分段在后台压缩。
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, pathlib.Path],
+        prefix: str = "messages",
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        rotate_seconds: Optional[float] = None,
+        compress: CompressionT = None,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ):
+        self.directory = pathlib.Path(directory)
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compress = compress
+        self.max_pending = max_pending
+        self.written = 0
+        self.dropped = 0
+        self._pending: collections.deque = collections.deque()
+        self._wakeup = threading.Condition()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._compressor = ThreadPoolExecutor(
+            1, thread_name_prefix="tg-signer-compress"
+        )
+        self._fp = None
+        self._segment: Optional[pathlib.Path] = None
+        self._segment_bytes = 0
+        self._segment_started_at = 0.0
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # 上次运行留下的未压缩分段
+        for path in sorted(self.directory.glob(f"{self.prefix}-*{SEGMENT_SUFFIX}")):
+            self._finish_segment(path)
+        self._thread = threading.Thread(
+            target=self._run, name=f"tg-signer-sink-{self.prefix}", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, record: Any) -> bool:
+        """放入待写入队列，不等待写盘；队列已满时丢弃并返回``False``"""
+        if self._closed or len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return False
+        self._pending.append(record)
+        if len(self._pending) >= WAKE_BATCH_SIZE:
+            with self._wakeup:
+                self._wakeup.notify()
+        return True
+
+    def close(self):
+        """写完队列中剩余的记录并等待压缩完成"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            with self._wakeup:
+                self._wakeup.notify()
+            self._thread.join()
+        self._compressor.shutdown(wait=True)
+        if self.dropped:
+            logger.warning(f"写入{self.directory}时共丢弃{self.dropped}条记录")
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                if not self._closed and len(self._pending) < WAKE_BATCH_SIZE:
+                    self._wakeup.wait(FLUSH_INTERVAL_SECONDS)
+            closed = self._closed
+            try:
+                self._drain()
+            except Exception as e:
+                logger.error(f"写入{self.directory}失败: {e}", exc_info=True)
+            if closed:
+                self._close_segment()
+                return
+
+    def _drain(self):
+        pending = self._pending
+        if self._fp is not None and self._should_rotate():
+            self._close_segment()
+        while pending:
+            if self._fp is None:
+                self._open_segment()
+            lines = []
+            size = 0
+            budget = self.max_bytes - self._segment_bytes
+            while pending and len(lines) < WAKE_BATCH_SIZE and size < budget:
+                line = (dumps_compact(pending.popleft()) + "\n").encode("utf-8")
+                lines.append(line)
+                size += len(line)
+            self._fp.write(b"".join(lines))
+            self._segment_bytes += size
+            self.written += len(lines)
+            if self._should_rotate():
+                self._close_segment()
+        if self._fp is not None:
+            self._fp.flush()
+
+    def _should_rotate(self) -> bool:
+        if self._segment_bytes >= self.max_bytes:
+            return True
+        return bool(
+            self.rotate_seconds
+            and time.time() - self._segment_started_at >= self.rotate_seconds
+        )
+
+    def _open_segment(self):
+        name = f"{self.prefix}-{datetime.now():%Y%m%d-%H%M%S-%f}{SEGMENT_SUFFIX}"
+        self._segment = self.directory / name
+        self._fp = open(self._segment, "ab", buffering=WRITE_BUFFER_SIZE)
+        self._segment_bytes = 0
+        self._segment_started_at = time.time()
+
+    def _close_segment(self):
+        if self._fp is None:
+            return
+        self._fp.close()
+        self._fp = None
+        self._finish_segment(self._segment)
+
+    def _finish_segment(self, path: pathlib.Path):
+        if self.compress:
+            self._compressor.submit(self._compress, path)
+
+    def _compress(self, path: pathlib.Path):
+        try:
+            compress_segment(path, self.compress)
+        except Exception as e:
+            logger.error(f"压缩{path}失败: {e}")
+
+
+_FILE_SINKS: dict[tuple[pathlib.Path, str], JsonlFileSink] = {}
+
+
+def get_file_sink(
+    directory: Union[str, pathlib.Path],
+    prefix: str = "messages",
+    max_bytes: int = DEFAULT_MAX_BYTES,
+    rotate_seconds: Optional[float] = None,
+    compress: CompressionT = None,
+) -> JsonlFileSink:
+    """同一目录和前缀共用一个写入器，配置变化时下一个分段起生效"""
+    key = (pathlib.Path(directory).resolve(), prefix)
+    sink = _FILE_SINKS.get(key)
+    if sink is None or sink.closed:
+        sink = _FILE_SINKS[key] = JsonlFileSink(
+            key[0], prefix, max_bytes, rotate_seconds, compress
+        )
+        sink.start()
+    else:
+        sink.max_bytes = max_bytes
+        sink.rotate_seconds = rotate_seconds
+        sink.compress = compress
+    return sink
+
+
+def close_file_sinks():
+    while _FILE_SINKS:
+        _, sink = _FILE_SINKS.popitem()
+        sink.close()
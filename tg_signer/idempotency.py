@@ -0,0 +1,160 @@
+import logging
+import os
+import pathlib
+import struct
+from collections import OrderedDict
+from typing import Optional, Union
+
+logger = logging.getLogger("tg-signer")
+
+PROCESSED_DIR_NAME = "processed"
+# 每个聊天记录最近多少个消息id（位），8KB
+WINDOW_BITS = 64 * 1024
+# 内存中保留的聊天位图数量，超出时写回磁盘并淘汰最久未使用的
+MAX_CACHED_CHATS = 256
+# 记住最近多少条消息触发过的监控项
+FIRED_MESSAGES_SIZE = 10_000
+
+_HEADER = struct.Struct("<q")
+
+
+class ChatBitmap:
+    """
+    一个聊天中已处理的消息id，每个id占一位。
+
+    同一聊天的消息id是递增的，只记录从`base`开始的`WINDOW_BITS`个id；
+    新id超出窗口时窗口前移，丢弃较早的一半。
+    """
+
+    __slots__ = ("base", "bits", "dirty")
+
+    def __init__(self, base: int = 0, bits: bytearray = None):
+        self.base = base
+        self.bits = bits if bits is not None else bytearray(WINDOW_BITS // 8)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: pathlib.Path) -> Optional["ChatBitmap"]:
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        if len(data) != _HEADER.size + WINDOW_BITS // 8:
+            logger.warning(f"忽略损坏的已处理消息记录: {path}")
+            return None
+        (base,) = _HEADER.unpack_from(data)
+        return cls(base, bytearray(data[_HEADER.size :]))
+
+    def dump(self) -> bytes:
+        return _HEADER.pack(self.base) + bytes(self.bits)
+
+    def _slide(self, message_id: int):
+        # 保持base为8的倍数，按字节移动
+        new_base = (message_id - WINDOW_BITS // 2) // 8 * 8
+        shift = (new_base - self.base) // 8
+        size = len(self.bits)
+        if shift >= size:
+            self.bits = bytearray(size)
+        else:
+            self.bits = self.bits[shift:] + bytearray(shift)
+        self.base = new_base
+
+    def add(self, message_id: int) -> bool:
+        """记录`message_id`，已经记录过时返回``False``；早于窗口的id视为未处理"""
+        offset = message_id - self.base
+        if offset < 0:
+            return True
+        if offset >= WINDOW_BITS:
+            self._slide(message_id)
+            offset = message_id - self.base
+        index, mask = offset >> 3, 1 << (offset & 7)
+        if self.bits[index] & mask:
+            return False
+        self.bits[index] |= mask
+        self.dirty = True
+        return True
+
+
+class ProcessedMessages:
+    """
+    已处理消息的幂等记录：每个聊天一个位图文件，内存中按LRU保留最多`max_chats`个。
+
+    `directory`为空时只保存在内存中。
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, pathlib.Path, None] = None,
+        max_chats: int = MAX_CACHED_CHATS,
+    ):
+        self.directory = pathlib.Path(directory) if directory else None
+        self.max_chats = max_chats
+        self.hits = 0
+        self.misses = 0
+        self._chats: OrderedDict[int, ChatBitmap] = OrderedDict()
+
+    def _path(self, chat_id: int) -> pathlib.Path:
+        return self.directory / f"{chat_id}.bin"
+
+    def _get(self, chat_id: int) -> ChatBitmap:
+        chats = self._chats
+        bitmap = chats.get(chat_id)
+        if bitmap is not None:
+            chats.move_to_end(chat_id)
+            return bitmap
+        if self.directory is not None:
+            bitmap = ChatBitmap.load(self._path(chat_id))
+        if bitmap is None:
+            bitmap = ChatBitmap()
+        chats[chat_id] = bitmap
+        if len(chats) > self.max_chats:
+            evicted_id, evicted = chats.popitem(last=False)
+            self._save(evicted_id, evicted)
+        return bitmap
+
+    def add(self, chat_id: int, message_id: int) -> bool:
+        """记录消息，已经处理过时返回``False``并计入`hits`"""
+        if self._get(chat_id).add(message_id):
+            self.misses += 1
+            return True
+        self.hits += 1
+        return False
+
+    def _save(self, chat_id: int, bitmap: ChatBitmap):
+        if self.directory is None or not bitmap.dirty:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(chat_id)
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_bytes(bitmap.dump())
+        os.replace(tmp_path, path)
+        bitmap.dirty = False
+
+    def save(self):
+        """将内存中有变化的位图写入磁盘"""
+        for chat_id, bitmap in self._chats.items():
+            self._save(chat_id, bitmap)
+
+
+class FiredRules:
+    """最近的消息已经触发过的监控项（LRU），同一监控项对一条消息只触发一次"""
+
+    def __init__(self, maxsize: int = FIRED_MESSAGES_SIZE):
+        self.maxsize = maxsize
+        self._messages: OrderedDict[tuple[int, int], set[str]] = OrderedDict()
+
+    def fire(self, chat_id: int, message_id: int, rule_key: str) -> bool:
+        """记录监控项被触发，已经触发过时返回``False``"""
+        key = (chat_id, message_id)
+        messages = self._messages
+        rules = messages.get(key)
+        if rules is None:
+            rules = messages[key] = set()
+            if len(messages) > self.maxsize:
+                messages.popitem(last=False)
+        else:
+            messages.move_to_end(key)
+        if rule_key in rules:
+            return False
+        rules.add(rule_key)
+        return True
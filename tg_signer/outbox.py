@@ -0,0 +1,524 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Optional, Union
+
+import httpx
+
+from tg_signer.notification.server_chan import sc_send
+
+logger = logging.getLogger("tg-signer")
+
+OUTBOX_FILE_NAME = "outbox.db"
+OUTBOX_WORKERS_ENV = "TG_SIGNER_OUTBOX_WORKERS"
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deliveries
+(
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind            TEXT    NOT NULL,
+    destination     TEXT    NOT NULL,
+    payload         TEXT    NOT NULL,
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL    NOT NULL,
+    created_at      REAL    NOT NULL,
+    last_error      TEXT,
+    claimed_by      TEXT,
+    claimed_until   REAL
+);
+
+CREATE INDEX IF NOT EXISTS idx_deliveries_destination ON deliveries (destination, id);
+
+CREATE TABLE IF NOT EXISTS dead_letters
+(
+    id          INTEGER PRIMARY KEY,
+    kind        TEXT    NOT NULL,
+    destination TEXT    NOT NULL,
+    payload     TEXT    NOT NULL,
+    attempts    INTEGER NOT NULL,
+    created_at  REAL    NOT NULL,
+    failed_at   REAL    NOT NULL,
+    last_error  TEXT
+);
+"""
+
+DEFAULT_WORKERS = 4
+MAX_ATTEMPTS = 8
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 300.0
+DELIVERY_TIMEOUT_SECONDS = 30.0
+# 认领一个目的地队首投递的租期，超过租期未完成时其他进程可以接手
+CLAIM_SECONDS = 60.0
+
+# 批量发送时等待凑够一批的轮询间隔
+LINGER_POLL_SECONDS = 0.01
+# 这些类型的处理函数接收记录的列表，可以将多条记录合并为一次投递
+BATCH_KINDS = {"http_batch"}
+
+DeliveryHandler = Callable[[Union[dict, list[dict]]], Awaitable[Any]]
+
+
+def get_outbox_file(workdir: Union[str, pathlib.Path]) -> pathlib.Path:
+    return pathlib.Path(workdir) / OUTBOX_FILE_NAME
+
+
+def backoff_delay(attempts: int) -> float:
+    """第`attempts`次失败后的等待时间：指数退避，带少量随机抖动"""
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+class Outbox:
+    """
+    SQLite（WAL模式）持久化的外发队列，记录在投递成功后才删除（至少一次投递）。
+
+    同一目的地的记录按加入顺序投递，队首失败时后面的记录等待重试；
+    超过最大尝试次数的记录移入死信表，可通过`tg-signer outbox replay`重新投递。
+    """
+
+    def __init__(self, path: Union[str, pathlib.Path]):
+        self.path = pathlib.Path(path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return self.connect()
+
+    def connect(self) -> sqlite3.Connection:
+        """打开数据库并按需创建表"""
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                with conn:
+                    conn.executescript(SCHEMA)
+                    conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock, self.conn:
+            return self.conn.execute(sql, params)
+
+    def enqueue(self, kind: str, destination: str, payload: dict) -> int:
+        now = time.time()
+        cursor = self._execute(
+            "INSERT INTO deliveries (kind, destination, payload, next_attempt_at, created_at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (kind, destination, json.dumps(payload, ensure_ascii=False), now, now),
+        )
+        return cursor.lastrowid
+
+    def _heads(self) -> list[sqlite3.Row]:
+        return self.conn.execute(
+            "SELECT * FROM deliveries WHERE id IN"
+            " (SELECT MIN(id) FROM deliveries GROUP BY destination)"
+        ).fetchall()
+
+    def due_destinations(self, now: float) -> list[str]:
+        """队首记录已到重试时间且未被其他进程认领的目的地"""
+        return [
+            row["destination"]
+            for row in self._heads()
+            if row["next_attempt_at"] <= now
+            and (row["claimed_until"] is None or row["claimed_until"] <= now)
+        ]
+
+    def next_attempt_at(self) -> Optional[float]:
+        times = [
+            max(row["next_attempt_at"], row["claimed_until"] or 0)
+            for row in self._heads()
+        ]
+        return min(times, default=None)
+
+    def claim_head(
+        self, destination: str, owner: str, now: float, lease: float = CLAIM_SECONDS
+    ) -> Optional[sqlite3.Row]:
+        """认领目的地的队首记录，未到重试时间或已被其他进程认领时返回``None``"""
+        with self._lock, self.conn:
+            row = self.conn.execute(
+                "SELECT * FROM deliveries WHERE destination = ? ORDER BY id LIMIT 1",
+                (destination,),
+            ).fetchone()
+            if row is None or row["next_attempt_at"] > now:
+                return None
+            cursor = self.conn.execute(
+                "UPDATE deliveries SET claimed_by = ?, claimed_until = ?"
+                " WHERE id = ? AND (claimed_until IS NULL OR claimed_until <= ?"
+                " OR claimed_by = ?)",
+                (owner, now + lease, row["id"], now, owner),
+            )
+            if not cursor.rowcount:
+                return None
+            return row
+
+    def batch_rows(
+        self, destination: str, first_id: int, kind: str, limit: int, now: float
+    ) -> list[sqlite3.Row]:
+        """从队首开始、类型相同且已到投递时间的连续记录，最多`limit`条"""
+        rows = self.conn.execute(
+            "SELECT * FROM deliveries WHERE destination = ? AND id >= ?"
+            " ORDER BY id LIMIT ?",
+            (destination, first_id, limit),
+        ).fetchall()
+        batch = []
+        for row in rows:
+            if row["kind"] != kind or row["next_attempt_at"] > now:
+                break
+            batch.append(row)
+        return batch
+
+    def claim_rows(
+        self, ids: list[int], owner: str, now: float, lease: float = CLAIM_SECONDS
+    ):
+        self._execute(
+            f"UPDATE deliveries SET claimed_by = ?, claimed_until = ?"
+            f" WHERE id IN ({', '.join('?' * len(ids))})",
+            (owner, now + lease, *ids),
+        )
+
+    def unclaim_rows(self, ids: list[int]):
+        self._execute(
+            f"UPDATE deliveries SET claimed_by = NULL, claimed_until = NULL"
+            f" WHERE id IN ({', '.join('?' * len(ids))})",
+            tuple(ids),
+        )
+
+    def ack(self, *delivery_ids: int):
+        self._execute(
+            f"DELETE FROM deliveries WHERE id IN ({', '.join('?' * len(delivery_ids))})",
+            delivery_ids,
+        )
+
+    def retry(
+        self, delivery_id: int, attempts: int, next_attempt_at: float, error: str
+    ):
+        self._execute(
+            "UPDATE deliveries SET attempts = ?, next_attempt_at = ?, last_error = ?,"
+            " claimed_by = NULL, claimed_until = NULL WHERE id = ?",
+            (attempts, next_attempt_at, error, delivery_id),
+        )
+
+    def bury(self, delivery_id: int, attempts: int, error: str):
+        """将记录移入死信表"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO dead_letters"
+                " (id, kind, destination, payload, attempts, created_at, failed_at,"
+                " last_error)"
+                " SELECT id, kind, destination, payload, ?, created_at, ?, ?"
+                " FROM deliveries WHERE id = ?",
+                (attempts, time.time(), error, delivery_id),
+            )
+            self.conn.execute("DELETE FROM deliveries WHERE id = ?", (delivery_id,))
+
+    def replay(
+        self, ids: Optional[list[int]] = None, destination: Optional[str] = None
+    ) -> int:
+        """将死信重新加入队列（排在该目的地现有记录之后），返回记录数"""
+        filters, params = [], []
+        if ids:
+            filters.append(f"id IN ({', '.join('?' * len(ids))})")
+            params.extend(ids)
+        if destination:
+            filters.append("destination = ?")
+            params.append(destination)
+        where = f" WHERE {' AND '.join(filters)}" if filters else ""
+        now = time.time()
+        with self._lock, self.conn:
+            rows = self.conn.execute(
+                f"SELECT * FROM dead_letters{where} ORDER BY id", params
+            ).fetchall()
+            self.conn.executemany(
+                "INSERT INTO deliveries"
+                " (kind, destination, payload, next_attempt_at, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        row["kind"],
+                        row["destination"],
+                        row["payload"],
+                        now,
+                        row["created_at"],
+                    )
+                    for row in rows
+                ],
+            )
+            self.conn.executemany(
+                "DELETE FROM dead_letters WHERE id = ?", [(row["id"],) for row in rows]
+            )
+        return len(rows)
+
+    def stats(self) -> list[dict]:
+        """每个目的地待投递和死信的数量"""
+        rows = self.conn.execute(
+            "SELECT destination, SUM(pending) AS pending, SUM(dead) AS dead FROM ("
+            " SELECT destination, 1 AS pending, 0 AS dead FROM deliveries"
+            " UNION ALL SELECT destination, 0, 1 FROM dead_letters"
+            ") GROUP BY destination ORDER BY destination"
+        )
+        return [dict(row) for row in rows]
+
+    def list_deliveries(self, dead: bool = False, limit: int = 20) -> list[dict]:
+        table = "dead_letters" if dead else "deliveries"
+        rows = self.conn.execute(f"SELECT * FROM {table} ORDER BY id LIMIT ?", (limit,))
+        return [dict(row) for row in rows]
+
+
+_HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+_HTTP_CLIENT_LOOP: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """投递共用的HTTP客户端，复用连接，避免每次请求都重新建立连接和SSL上下文"""
+    global _HTTP_CLIENT, _HTTP_CLIENT_LOOP
+    loop = asyncio.get_running_loop()
+    if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed or _HTTP_CLIENT_LOOP is not loop:
+        _HTTP_CLIENT = httpx.AsyncClient()
+        _HTTP_CLIENT_LOOP = loop
+    return _HTTP_CLIENT
+
+
+async def close_http_client():
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is not None:
+        client, _HTTP_CLIENT = _HTTP_CLIENT, None
+        await client.aclose()
+
+
+async def deliver_http(payload: dict):
+    response = await get_http_client().post(
+        payload["url"],
+        content=payload["content"].encode("utf-8"),
+        headers=payload.get("headers") or {},
+        timeout=10,
+    )
+    response.raise_for_status()
+
+
+async def deliver_http_batch(payloads: list[dict]):
+    """将多条消息合并为一个JSON数组POST，可选gzip压缩"""
+    first = payloads[0]
+    content = ("[" + ",".join(p["content"] for p in payloads) + "]").encode("utf-8")
+    headers = dict(first.get("headers") or {})
+    if first.get("gzip"):
+        content = gzip.compress(content)
+        headers["Content-Encoding"] = "gzip"
+    response = await get_http_client().post(
+        first["url"], content=content, headers=headers, timeout=10
+    )
+    response.raise_for_status()
+
+
+async def deliver_server_chan(payload: dict):
+    result = await sc_send(payload["send_key"], payload["title"], payload["desp"])
+    if isinstance(result, dict) and result.get("code", 0) != 0:
+        raise RuntimeError(f"Server酱推送失败: {result.get('message')}")
+
+
+DEFAULT_HANDLERS: dict[str, DeliveryHandler] = {
+    "http": deliver_http,
+    "http_batch": deliver_http_batch,
+    "server_chan": deliver_server_chan,
+}
+
+
+def server_chan_destination(send_key: str) -> str:
+    """不在队列中以明文展示SendKey"""
+    return "server_chan:" + hashlib.sha1(send_key.encode("utf-8")).hexdigest()[:8]
+
+
+class OutboxDispatcher:
+    """
+    投递外发队列中的记录：最多`workers`个目的地同时投递，每个目的地同一时间只有
+    一个协程按顺序投递，失败后指数退避重试，超过`max_attempts`次后移入死信表。
+    """
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        workers: int = None,
+        handlers: dict[str, DeliveryHandler] = None,
+        max_attempts: int = MAX_ATTEMPTS,
+    ):
+        self.outbox = outbox
+        self.workers = max(1, int(workers or DEFAULT_WORKERS))
+        self.handlers = handlers or DEFAULT_HANDLERS
+        self.max_attempts = max_attempts
+        # 多个进程共用一个队列时，用于区分认领者
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.delivered = 0
+        self.failed = 0
+        self.batches = 0
+        self._active: dict[str, asyncio.Task] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._users = 0
+
+    def submit(self, kind: str, destination: str, payload: dict) -> int:
+        """加入队列（写入磁盘后返回），并唤醒投递循环"""
+        delivery_id = self.outbox.enqueue(kind, destination, payload)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return delivery_id
+
+    def start(self):
+        self._users += 1
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self.run())
+
+    async def release(self):
+        """使用者退出，最后一个使用者退出时停止投递，未投递的记录保留在队列中"""
+        self._users = max(0, self._users - 1)
+        if self._users:
+            return
+        tasks = [self._task, *self._active.values()] if self._task else []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._active.clear()
+        await close_http_client()
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            for destination in self.outbox.due_destinations(now):
+                if len(self._active) >= self.workers:
+                    break
+                if destination in self._active:
+                    continue
+                task = asyncio.create_task(self.drain(destination))
+                self._active[destination] = task
+                task.add_done_callback(lambda _, d=destination: self._on_drained(d))
+            next_at = self.outbox.next_attempt_at()
+            timeout = 1.0 if next_at is None else min(max(next_at - now, 0.05), 1.0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _on_drained(self, destination: str):
+        self._active.pop(destination, None)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def drain(self, destination: str):
+        """按顺序投递一个目的地的记录，直到队列为空或队首需要等待重试"""
+        while True:
+            row = self.outbox.claim_head(destination, self.owner, time.time())
+            if row is None:
+                return
+            if row["kind"] in BATCH_KINDS and not row["attempts"]:
+                delivered = await self.deliver_batch(row)
+            else:
+                delivered = await self.deliver(row)
+            if not delivered:
+                return
+
+    async def deliver_batch(self, head: sqlite3.Row) -> bool:
+        """
+        等待最多`linger_ms`凑够`max_batch_size`条后一次投递；批量投递失败时逐条投递，
+        各自按单条记录重试
+        """
+        payload = json.loads(head["payload"])
+        limit = payload.get("max_batch_size") or 1
+        deadline = head["created_at"] + payload.get("linger_ms", 0) / 1000
+        while True:
+            now = time.time()
+            rows = self.outbox.batch_rows(
+                head["destination"], head["id"], head["kind"], limit, now
+            )
+            if len(rows) >= limit or now >= deadline:
+                break
+            await asyncio.sleep(min(deadline - now, LINGER_POLL_SECONDS))
+        if len(rows) <= 1:
+            return await self.deliver(head)
+        ids = [row["id"] for row in rows]
+        self.outbox.claim_rows(ids, self.owner, time.time())
+        try:
+            await asyncio.wait_for(
+                self.handlers[head["kind"]](
+                    [json.loads(row["payload"]) for row in rows]
+                ),
+                DELIVERY_TIMEOUT_SECONDS,
+            )
+        except Exception as e:
+            logger.warning(
+                f"批量投递{len(rows)}条至{head['destination']}失败，改为逐条投递: "
+                f"{type(e).__name__}: {e}"
+            )
+            for index, row in enumerate(rows):
+                if not await self.deliver(row):
+                    self.outbox.unclaim_rows(ids[index + 1 :])
+                    return False
+            return True
+        self.outbox.ack(*ids)
+        self.delivered += len(rows)
+        self.batches += 1
+        return True
+
+    async def deliver(self, row: sqlite3.Row) -> bool:
+        handler = self.handlers.get(row["kind"])
+        try:
+            if handler is None:
+                raise ValueError(f"未知的投递类型: {row['kind']}")
+            payload = json.loads(row["payload"])
+            if row["kind"] in BATCH_KINDS:
+                payload = [payload]
+            await asyncio.wait_for(handler(payload), DELIVERY_TIMEOUT_SECONDS)
+        except Exception as e:
+            self.failed += 1
+            error = f"{type(e).__name__}: {e}"
+            attempts = row["attempts"] + 1
+            if attempts >= self.max_attempts:
+                logger.error(
+                    f"投递至{row['destination']}失败{attempts}次，已移入死信: {error}"
+                )
+                self.outbox.bury(row["id"], attempts, error)
+                return True
+            delay = backoff_delay(attempts)
+            logger.warning(
+                f"投递至{row['destination']}失败（第{attempts}次），"
+                f"{delay:.1f}秒后重试: {error}"
+            )
+            self.outbox.retry(row["id"], attempts, time.time() + delay, error)
+            return False
+        self.outbox.ack(row["id"])
+        self.delivered += 1
+        return True
+
+
+_DISPATCHERS: dict[pathlib.Path, OutboxDispatcher] = {}
+
+
+def get_outbox_dispatcher(workdir: Union[str, pathlib.Path]) -> OutboxDispatcher:
+    """同一进程中共用一个工作目录的队列的多个监控任务共享同一个投递器"""
+    path = get_outbox_file(workdir).resolve()
+    dispatcher = _DISPATCHERS.get(path)
+    if dispatcher is None:
+        dispatcher = _DISPATCHERS[path] = OutboxDispatcher(
+            Outbox(path), workers=os.environ.get(OUTBOX_WORKERS_ENV)
+        )
+    return dispatcher
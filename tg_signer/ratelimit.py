@@ -0,0 +1,110 @@
+import time
+from collections import Counter, OrderedDict
+from typing import Hashable, Optional
+
+SUPPRESSED_BY_COOLDOWN = "cooldown"
+SUPPRESSED_BY_RATE = "rate"
+SUPPRESSED_BY_SENDER = "sender"
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate` tokens per second up to
+    `capacity`. Checking and consuming are O(1).
+    """
+
+    __slots__ = ("capacity", "rate", "tokens", "updated_at")
+
+    def __init__(self, capacity: float, rate: float, now: float = None):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated_at = time.monotonic() if now is None else now
+
+    def _refill(self, now: float):
+        elapsed = max(0.0, now - self.updated_at)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def available(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= 1
+
+    def consume(self):
+        self.tokens -= 1
+
+
+class ReplyLimiter:
+    """
+    Limits the replies of one monitor rule.
+
+    `cooldown_seconds` is a bucket holding one token, `max_replies_per_minute`
+    a bucket holding that many tokens refilled over a minute, and
+    `sender_cooldown_seconds` allows one reply per sender within the window.
+    A reply consumes from every bucket only when all of them allow it, so a
+    suppressed match never uses up budget.
+    """
+
+    def __init__(
+        self,
+        cooldown_seconds: Optional[float] = None,
+        max_replies_per_minute: Optional[int] = None,
+        sender_cooldown_seconds: Optional[float] = None,
+    ):
+        now = time.monotonic()
+        self.buckets: list[tuple[str, TokenBucket]] = []
+        if cooldown_seconds:
+            self.buckets.append(
+                (SUPPRESSED_BY_COOLDOWN, TokenBucket(1, 1 / cooldown_seconds, now))
+            )
+        if max_replies_per_minute:
+            self.buckets.append(
+                (
+                    SUPPRESSED_BY_RATE,
+                    TokenBucket(
+                        max_replies_per_minute, max_replies_per_minute / 60, now
+                    ),
+                )
+            )
+        self.sender_cooldown_seconds = sender_cooldown_seconds
+        # sender -> time of the last reply, oldest first
+        self._senders: OrderedDict[Hashable, float] = OrderedDict()
+        self.suppressed: Counter[str] = Counter()
+
+    def _prune_senders(self, now: float):
+        window = self.sender_cooldown_seconds
+        senders = self._senders
+        while senders:
+            sender, replied_at = next(iter(senders.items()))
+            if now - replied_at < window:
+                break
+            del senders[sender]
+
+    def acquire(self, sender: Hashable = None, now: float = None) -> Optional[str]:
+        """
+        Try to take a reply slot.
+
+        :return: ``None`` if the reply may be sent, otherwise the reason it
+            was suppressed.
+        """
+        now = time.monotonic() if now is None else now
+        check_sender = self.sender_cooldown_seconds and sender is not None
+        if check_sender:
+            self._prune_senders(now)
+            if sender in self._senders:
+                self.suppressed[SUPPRESSED_BY_SENDER] += 1
+                return SUPPRESSED_BY_SENDER
+        for reason, bucket in self.buckets:
+            if not bucket.available(now):
+                self.suppressed[reason] += 1
+                return reason
+        for _, bucket in self.buckets:
+            bucket.consume()
+        if check_sender:
+            self._senders[sender] = now
+        return None
+
+    def pop_suppressed(self) -> Counter[str]:
+        """Return the suppression counts since the previous call and reset them."""
+        suppressed, self.suppressed = self.suppressed, Counter()
+        return suppressed
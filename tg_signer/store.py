@@ -0,0 +1,576 @@
+import json
+import logging
+import pathlib
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Iterator, Optional, Union
+
+from tg_signer.utils import write_text_atomic
+
+logger = logging.getLogger("tg-signer")
+
+STORE_FILE_NAME = "tg-signer.db"
+LATENCY_FILE_NAME = "latencies.json"
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks
+(
+    name       TEXT NOT NULL,
+    kind       TEXT NOT NULL DEFAULT 'signer',
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (kind, name)
+);
+
+CREATE TABLE IF NOT EXISTS runs
+(
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    task        TEXT NOT NULL,
+    user_id     TEXT NOT NULL DEFAULT '',
+    run_date    TEXT NOT NULL,
+    started_at  TEXT NOT NULL,
+    finished_at TEXT,
+    status      TEXT NOT NULL DEFAULT 'running'
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_runs_task_user_started
+    ON runs (task, user_id, started_at);
+CREATE INDEX IF NOT EXISTS idx_runs_task_user_date ON runs (task, user_id, run_date);
+CREATE INDEX IF NOT EXISTS idx_runs_date ON runs (run_date);
+
+CREATE TABLE IF NOT EXISTS chat_results
+(
+    id                INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id            INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    chat_id           INTEGER NOT NULL,
+    message_thread_id INTEGER,
+    status            TEXT NOT NULL,
+    error             TEXT,
+    finished_at       TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_chat_results_run ON chat_results (run_id);
+
+CREATE TABLE IF NOT EXISTS checkpoints
+(
+    task         TEXT    NOT NULL,
+    user_id      TEXT    NOT NULL,
+    slot         TEXT    NOT NULL,
+    chat_key     TEXT    NOT NULL,
+    status       TEXT    NOT NULL,
+    actions_done INTEGER NOT NULL DEFAULT 0,
+    error        TEXT,
+    updated_at   TEXT    NOT NULL,
+    PRIMARY KEY (task, user_id, slot, chat_key)
+);
+
+CREATE TABLE IF NOT EXISTS latencies
+(
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    task        TEXT NOT NULL,
+    user_id     TEXT NOT NULL,
+    chat_key    TEXT NOT NULL,
+    latency     REAL NOT NULL,
+    recorded_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_latencies_chat ON latencies (task, user_id, chat_key);
+"""
+
+# 每个聊天保留的最近回复延迟数量
+LATENCY_HISTORY_SIZE = 50
+# 根据延迟历史计算等待回复的超时时间：高分位数 * 系数，并限制在上下限之间
+REPLY_TIMEOUT_DEFAULT = 10.0
+REPLY_TIMEOUT_MIN = 3.0
+REPLY_TIMEOUT_MAX = 60.0
+REPLY_TIMEOUT_PERCENTILE = 0.95
+REPLY_TIMEOUT_FACTOR = 1.5
+REPLY_TIMEOUT_MIN_SAMPLES = 5
+
+
+def percentile(values: list[float], q: float) -> float:
+    """最近秩法计算分位数，`q`取值0~1"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(q * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def reply_timeout(latencies: list[float]) -> float:
+    """
+    等待机器人回复的超时时间（秒）。
+    样本不足时使用默认值，否则取延迟的高分位数乘以系数，并限制在上下限之间。
+    """
+    if len(latencies) < REPLY_TIMEOUT_MIN_SAMPLES:
+        return REPLY_TIMEOUT_DEFAULT
+    timeout = percentile(latencies, REPLY_TIMEOUT_PERCENTILE) * REPLY_TIMEOUT_FACTOR
+    return min(max(timeout, REPLY_TIMEOUT_MIN), REPLY_TIMEOUT_MAX)
+
+
+def get_store_file(workdir: Union[str, pathlib.Path]) -> pathlib.Path:
+    return pathlib.Path(workdir) / STORE_FILE_NAME
+
+
+class SignStore:
+    """
+    SQLite存储（WAL模式）：任务、每次运行和每个聊天的执行结果。
+
+    存储是可选的，`tg-signer store migrate`创建数据库后，签到记录将写入数据库而不是
+    `signs/<task>/<user_id>/sign_record.json`。
+    """
+
+    def __init__(self, path: Union[str, pathlib.Path]):
+        self.path = pathlib.Path(path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return self.connect()
+
+    def connect(self) -> sqlite3.Connection:
+        """打开数据库并按需创建表"""
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                with conn:
+                    conn.executescript(SCHEMA)
+                    conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock, self.conn:
+            return self.conn.execute(sql, params)
+
+    def add_task(self, name: str, kind: str = "signer"):
+        self._execute(
+            "INSERT OR IGNORE INTO tasks (name, kind, created_at) VALUES (?, ?, ?)",
+            (name, kind, datetime.now().isoformat()),
+        )
+
+    def list_tasks(self, kind: str = "signer") -> list[str]:
+        rows = self.conn.execute(
+            "SELECT name FROM tasks WHERE kind = ? ORDER BY name", (kind,)
+        )
+        return [row["name"] for row in rows]
+
+    def start_run(
+        self, task: str, user_id: Union[int, str], started_at: datetime
+    ) -> int:
+        self.add_task(task)
+        cursor = self._execute(
+            "INSERT INTO runs (task, user_id, run_date, started_at) VALUES (?, ?, ?, ?)",
+            (task, str(user_id), str(started_at.date()), started_at.isoformat()),
+        )
+        return cursor.lastrowid
+
+    def add_chat_result(
+        self,
+        run_id: int,
+        chat_id: int,
+        message_thread_id: Optional[int],
+        status: str,
+        error: str = None,
+    ):
+        self._execute(
+            "INSERT INTO chat_results"
+            " (run_id, chat_id, message_thread_id, status, error, finished_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                run_id,
+                chat_id,
+                message_thread_id,
+                status,
+                error,
+                datetime.now().isoformat(),
+            ),
+        )
+
+    def finish_run(self, run_id: int, finished_at: datetime, status: str = "success"):
+        self._execute(
+            "UPDATE runs SET finished_at = ?, status = ? WHERE id = ?",
+            (finished_at.isoformat(), status, run_id),
+        )
+
+    def last_run_at(
+        self, task: str, user_id: Union[int, str], run_date: str
+    ) -> Optional[str]:
+        """`run_date`当天最后一次成功运行的开始时间"""
+        row = self.conn.execute(
+            "SELECT started_at FROM runs"
+            " WHERE task = ? AND user_id = ? AND run_date = ? AND status = 'success'"
+            " ORDER BY started_at DESC LIMIT 1",
+            (task, str(user_id), run_date),
+        ).fetchone()
+        return row["started_at"] if row else None
+
+    def load_checkpoints(
+        self, task: str, user_id: Union[int, str], slot: str
+    ) -> dict[str, dict[str, Any]]:
+        rows = self.conn.execute(
+            "SELECT chat_key, status, actions_done, error FROM checkpoints"
+            " WHERE task = ? AND user_id = ? AND slot = ?",
+            (task, str(user_id), slot),
+        )
+        return {
+            row["chat_key"]: {
+                "status": row["status"],
+                "actions_done": row["actions_done"],
+                "error": row["error"],
+            }
+            for row in rows
+        }
+
+    def save_checkpoint(
+        self,
+        task: str,
+        user_id: Union[int, str],
+        slot: str,
+        chat_key: str,
+        status: str,
+        actions_done: int,
+        error: str = None,
+    ):
+        self._execute(
+            "INSERT OR REPLACE INTO checkpoints"
+            " (task, user_id, slot, chat_key, status, actions_done, error, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                task,
+                str(user_id),
+                slot,
+                chat_key,
+                status,
+                actions_done,
+                error,
+                datetime.now().isoformat(),
+            ),
+        )
+
+    def add_latency(
+        self, task: str, user_id: Union[int, str], chat_key: str, latency: float
+    ):
+        """记录一次回复延迟（秒），每个聊天只保留最近`LATENCY_HISTORY_SIZE`条"""
+        params = (task, str(user_id), chat_key)
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO latencies (task, user_id, chat_key, latency, recorded_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (*params, latency, datetime.now().isoformat()),
+            )
+            self.conn.execute(
+                "DELETE FROM latencies WHERE task = ? AND user_id = ? AND chat_key = ?"
+                " AND id NOT IN (SELECT id FROM latencies"
+                " WHERE task = ? AND user_id = ? AND chat_key = ?"
+                " ORDER BY id DESC LIMIT ?)",
+                (*params, *params, LATENCY_HISTORY_SIZE),
+            )
+
+    def get_latencies(
+        self, task: str, user_id: Union[int, str], chat_key: str
+    ) -> list[float]:
+        rows = self.conn.execute(
+            "SELECT latency FROM latencies WHERE task = ? AND user_id = ? AND chat_key = ?"
+            " ORDER BY id",
+            (task, str(user_id), chat_key),
+        )
+        return [row["latency"] for row in rows]
+
+    def latency_history(
+        self, task: str, user_id: Union[int, str]
+    ) -> dict[str, list[float]]:
+        """任务下每个聊天的回复延迟，按时间先后排列"""
+        history: dict[str, list[float]] = {}
+        rows = self.conn.execute(
+            "SELECT chat_key, latency FROM latencies WHERE task = ? AND user_id = ?"
+            " ORDER BY chat_key, id",
+            (task, str(user_id)),
+        )
+        for row in rows:
+            history.setdefault(row["chat_key"], []).append(row["latency"])
+        return history
+
+    @staticmethod
+    def _run_filters(
+        task: str = None, user_id: Union[int, str] = None, keyword: str = None
+    ) -> tuple[str, tuple]:
+        clauses, params = [], []
+        if task is not None:
+            clauses.append("task = ?")
+            params.append(task)
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(str(user_id))
+        if keyword:
+            clauses.append("(task LIKE ? OR user_id LIKE ?)")
+            params.extend([f"%{keyword}%"] * 2)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, tuple(params)
+
+    def query_runs(
+        self,
+        task: str = None,
+        user_id: Union[int, str] = None,
+        keyword: str = None,
+        limit: int = 50,
+        offset: int = 0,
+    ) -> list[dict[str, Any]]:
+        """按开始时间倒序分页查询运行记录"""
+        where, params = self._run_filters(task, user_id, keyword)
+        rows = self.conn.execute(
+            f"SELECT * FROM runs{where} ORDER BY started_at DESC LIMIT ? OFFSET ?",
+            (*params, limit, offset),
+        )
+        return [dict(row) for row in rows]
+
+    def count_runs(
+        self, task: str = None, user_id: Union[int, str] = None, keyword: str = None
+    ) -> int:
+        where, params = self._run_filters(task, user_id, keyword)
+        return self.conn.execute(
+            f"SELECT COUNT(*) FROM runs{where}", params
+        ).fetchone()[0]
+
+    def run_groups(self, keyword: str = None) -> list[dict[str, Any]]:
+        """每个(任务, 用户)的运行次数"""
+        where, params = self._run_filters(keyword=keyword)
+        rows = self.conn.execute(
+            f"SELECT task, user_id, COUNT(*) AS runs FROM runs{where}"
+            " GROUP BY task, user_id ORDER BY task, user_id",
+            params,
+        )
+        return [dict(row) for row in rows]
+
+    def chat_results(self, run_id: int) -> list[dict[str, Any]]:
+        rows = self.conn.execute(
+            "SELECT * FROM chat_results WHERE run_id = ? ORDER BY id", (run_id,)
+        )
+        return [dict(row) for row in rows]
+
+    def import_sign_record(
+        self, task: str, user_id: Union[int, str], sign_record: dict[str, str]
+    ) -> int:
+        """导入`sign_record.json`的内容，已导入的记录会被跳过"""
+        self.add_task(task)
+        rows = [
+            (task, str(user_id), run_date, finished_at, finished_at)
+            for run_date, finished_at in sign_record.items()
+        ]
+        with self._lock, self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO runs"
+                " (task, user_id, run_date, started_at, finished_at, status)"
+                " VALUES (?, ?, ?, ?, ?, 'success')",
+                rows,
+            )
+            return self.conn.total_changes - before
+
+
+class FileSignRecord:
+    """
+    `signs/<task>/<user_id>/sign_record.json`：每天最后一次完成的时间；
+    同目录下的`checkpoints.json`保存最近一个执行周期内每个聊天的进度，
+    `latencies.json`保存每个聊天最近的回复延迟。
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.checkpoint_file = path.with_name("checkpoints.json")
+        self.latency_file = path.with_name(LATENCY_FILE_NAME)
+        self.records: dict[str, str] = {}
+        if path.is_file():
+            with open(path, "r", encoding="utf-8") as fp:
+                self.records = json.load(fp)
+        else:
+            self._dump()
+
+    def _dump(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as fp:
+            json.dump(self.records, fp)
+
+    def last_sign_at(self, run_date: str) -> Optional[str]:
+        return self.records.get(run_date)
+
+    def start_run(self, started_at: datetime):
+        self._started_at = started_at
+
+    def load_checkpoints(self, slot: str) -> dict[str, dict[str, Any]]:
+        if not self.checkpoint_file.is_file():
+            return {}
+        with open(self.checkpoint_file, "r", encoding="utf-8") as fp:
+            data = json.load(fp)
+        if data.get("slot") != slot:
+            return {}
+        return data.get("chats", {})
+
+    def save_checkpoint(
+        self,
+        slot: str,
+        chat_key: str,
+        status: str,
+        actions_done: int,
+        error: str = None,
+    ):
+        # 只保留当前周期，文件大小与聊天数量成正比
+        chats = self.load_checkpoints(slot)
+        chats[chat_key] = {
+            "status": status,
+            "actions_done": actions_done,
+            "error": error,
+        }
+        write_text_atomic(
+            self.checkpoint_file,
+            json.dumps({"slot": slot, "chats": chats}, ensure_ascii=False),
+        )
+
+    def add_chat_result(
+        self,
+        chat_id: int,
+        message_thread_id: Optional[int],
+        status: str,
+        error: str = None,
+    ):
+        pass
+
+    def finish_run(self, finished_at: datetime, status: str = "success"):
+        if status != "success":
+            return
+        self.records[str(self._started_at.date())] = self._started_at.isoformat()
+        self._dump()
+
+    def latency_history(self) -> dict[str, list[float]]:
+        return load_latency_file(self.latency_file)
+
+    def get_latencies(self, chat_key: str) -> list[float]:
+        return self.latency_history().get(chat_key, [])
+
+    def add_latency(self, chat_key: str, latency: float):
+        history = self.latency_history()
+        latencies = history.setdefault(chat_key, [])
+        latencies.append(round(latency, 3))
+        del latencies[:-LATENCY_HISTORY_SIZE]
+        write_text_atomic(self.latency_file, json.dumps(history))
+
+
+class StoreSignRecord:
+    """与`FileSignRecord`接口一致，记录写入`SignStore`"""
+
+    def __init__(self, store: SignStore, task: str, user_id: Union[int, str]):
+        self.store = store
+        self.task = task
+        self.user_id = str(user_id)
+        self.run_id: Optional[int] = None
+
+    def last_sign_at(self, run_date: str) -> Optional[str]:
+        return self.store.last_run_at(self.task, self.user_id, run_date)
+
+    def start_run(self, started_at: datetime):
+        self.run_id = self.store.start_run(self.task, self.user_id, started_at)
+
+    def load_checkpoints(self, slot: str) -> dict[str, dict[str, Any]]:
+        return self.store.load_checkpoints(self.task, self.user_id, slot)
+
+    def save_checkpoint(
+        self,
+        slot: str,
+        chat_key: str,
+        status: str,
+        actions_done: int,
+        error: str = None,
+    ):
+        self.store.save_checkpoint(
+            self.task, self.user_id, slot, chat_key, status, actions_done, error
+        )
+
+    def add_chat_result(
+        self,
+        chat_id: int,
+        message_thread_id: Optional[int],
+        status: str,
+        error: str = None,
+    ):
+        self.store.add_chat_result(
+            self.run_id, chat_id, message_thread_id, status, error
+        )
+
+    def finish_run(self, finished_at: datetime, status: str = "success"):
+        self.store.finish_run(self.run_id, finished_at, status)
+
+    def latency_history(self) -> dict[str, list[float]]:
+        return self.store.latency_history(self.task, self.user_id)
+
+    def get_latencies(self, chat_key: str) -> list[float]:
+        return self.store.get_latencies(self.task, self.user_id, chat_key)
+
+    def add_latency(self, chat_key: str, latency: float):
+        self.store.add_latency(self.task, self.user_id, chat_key, latency)
+
+
+def load_latency_file(path: pathlib.Path) -> dict[str, list[float]]:
+    if not path.is_file():
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as fp:
+            data = json.load(fp)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def iter_sign_record_files(
+    signs_dir: pathlib.Path,
+) -> Iterator[tuple[str, str, pathlib.Path]]:
+    """遍历`signs/<task>/<user_id>/sign_record.json`，返回(任务, 用户id, 文件)"""
+    for record_file in sorted(signs_dir.glob("*/*/sign_record.json")):
+        yield record_file.parent.parent.name, record_file.parent.name, record_file
+
+
+def migrate_workdir(workdir: Union[str, pathlib.Path]) -> tuple[SignStore, int]:
+    """
+    创建（或打开）工作目录的存储，并导入已有的任务和签到记录。
+    原有的文件保持不变，重复执行是安全的。
+    """
+    workdir = pathlib.Path(workdir)
+    store = SignStore(get_store_file(workdir))
+    # 工作目录为空时也要创建数据库以启用存储
+    store.connect()
+    signs_dir = workdir / "signs"
+    imported = 0
+    if signs_dir.is_dir():
+        for task_dir in sorted(p for p in signs_dir.iterdir() if p.is_dir()):
+            store.add_task(task_dir.name)
+        for task, user_id, record_file in iter_sign_record_files(signs_dir):
+            try:
+                with open(record_file, "r", encoding="utf-8") as fp:
+                    sign_record = json.load(fp)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"无法读取签到记录 {record_file}: {e}")
+                continue
+            if isinstance(sign_record, dict):
+                imported += store.import_sign_record(task, user_id, sign_record)
+    monitors_dir = workdir / "monitors"
+    if monitors_dir.is_dir():
+        for task_dir in sorted(p for p in monitors_dir.iterdir() if p.is_dir()):
+            store.add_task(task_dir.name, kind="monitor")
+    return store, imported
+
+
+def open_store(workdir: Union[str, pathlib.Path]) -> Optional[SignStore]:
+    """工作目录已启用存储（数据库文件存在）时返回存储，否则返回``None``"""
+    store_file = get_store_file(workdir)
+    if not store_file.is_file():
+        return None
+    return SignStore(store_file)
@@ -0,0 +1,540 @@
+import asyncio
+import json
+import logging
+import os
+import pathlib
+from datetime import time as dt_time
+from typing import Awaitable, Callable, Generic, List, Optional, Type, TypeVar
+
+from pydantic import ValidationError
+
+from tg_signer.config import (
+    ActionT,
+    BaseJSONConfig,
+    ChooseOptionByImageAction,
+    ClickKeyboardByTextAction,
+    MatchConfig,
+    MonitorConfig,
+    ReplyByCalculationProblemAction,
+    SendDiceAction,
+    SendTextAction,
+    SignChatV3,
+    SignConfigV3,
+    SupportAction,
+)
+
+from .utils import (
+    UserInput,
+    file_version,
+    make_dirs,
+    print_to_user,
+    write_text_atomic,
+)
+
+logger = logging.getLogger("tg-signer")
+
+OPENAI_USE_PROMPT = "当前任务需要配置大模型，请确保运行前正确设置`OPENAI_API_KEY`, `OPENAI_BASE_URL`, `OPENAI_MODEL`等环境变量，或通过`tg-signer llm-config`持久化配置。"
+
+CONFIG_WATCH_INTERVAL_ENV = "TG_SIGNER_CONFIG_WATCH_INTERVAL"
+_CONFIG_WATCH_INTERVAL = 5
+
+ConfigT = TypeVar("ConfigT", bound=BaseJSONConfig)
+
+# (config file, config class) -> (file version, parsed config), shared by all
+# workers of the process so that e.g. `multi-run` parses a config only once
+_CONFIG_CACHE: dict[tuple[str, type], tuple[tuple[int, int], BaseJSONConfig]] = {}
+
+
+class TaskManager(Generic[ConfigT]):
+    """
+    任务配置的管理：列出、读写、导入导出和交互式配置。
+
+    只读写工作目录下的文件，不会创建Telegram客户端，供不需要联网的命令使用。
+    """
+
+    _workdir = "."
+    _tasks_dir = "tasks"
+    cfg_cls: Type["ConfigT"] = BaseJSONConfig
+
+    def __init__(self, task_name: str = None, workdir=None):
+        self.task_name = task_name or "my_task"
+        if workdir:
+            self._workdir = pathlib.Path(workdir)
+        self._config = None
+        self._config_version: Optional[tuple[int, int]] = None
+
+    @property
+    def workdir(self) -> pathlib.Path:
+        workdir = self._workdir
+        make_dirs(workdir)
+        return pathlib.Path(workdir)
+
+    @property
+    def tasks_dir(self):
+        tasks_dir = self.workdir / self._tasks_dir
+        make_dirs(tasks_dir)
+        return pathlib.Path(tasks_dir)
+
+    @property
+    def task_dir(self):
+        task_dir = self.tasks_dir / self.task_name
+        make_dirs(task_dir)
+        return task_dir
+
+    @property
+    def config_file(self):
+        return self.task_dir.joinpath("config.json")
+
+    @property
+    def config(self) -> ConfigT:
+        return self._config or self.load_config()
+
+    @config.setter
+    def config(self, value):
+        self._config = value
+
+    @property
+    def log_prefix(self) -> str:
+        return f"任务「{self.task_name}」"
+
+    def log(self, msg, level: str = "INFO", **kwargs):
+        msg = f"{self.log_prefix}: {msg}"
+        if level.upper() == "INFO":
+            logger.info(msg, **kwargs)
+        elif level.upper() == "WARNING":
+            logger.warning(msg, **kwargs)
+        elif level.upper() == "ERROR":
+            logger.error(msg, **kwargs)
+        elif level.upper() == "CRITICAL":
+            logger.critical(msg, **kwargs)
+        else:
+            logger.debug(msg, **kwargs)
+
+    def ask_for_config(self):
+        raise NotImplementedError
+
+    def write_config(self, config: BaseJSONConfig):
+        config_file = self.config_file
+        write_text_atomic(
+            config_file, json.dumps(config.to_jsonable(), ensure_ascii=False)
+        )
+        version = file_version(config_file)
+        _CONFIG_CACHE[(str(config_file.resolve()), type(config))] = (version, config)
+        self._config_version = version
+
+    def reconfig(self):
+        config = self.ask_for_config()
+        self.write_config(config)
+        return config
+
+    def load_config(self, cfg_cls: Type[ConfigT] = None) -> ConfigT:
+        if not self.config_file.exists():
+            config = self.reconfig()
+        else:
+            config = self.read_config(cfg_cls)
+        self.config = config
+        return config
+
+    def read_config(self, cfg_cls: Type[ConfigT] = None) -> ConfigT:
+        """读取配置文件，文件未修改时直接返回进程内已解析的配置"""
+        cfg_cls = cfg_cls or self.cfg_cls
+        config_file = self.config_file
+        key = (str(config_file.resolve()), cfg_cls)
+        version = file_version(config_file)
+        cached = _CONFIG_CACHE.get(key)
+        if cached is not None and cached[0] == version:
+            self._config_version = version
+            return cached[1]
+        with open(config_file, "r", encoding="utf-8") as fp:
+            loaded = cfg_cls.load(json.load(fp))
+        if loaded is None:
+            raise ValueError(f"配置校验失败: {config_file}")
+        config, from_old = loaded
+        if from_old:
+            self.write_config(config)
+        else:
+            _CONFIG_CACHE[key] = (version, config)
+            self._config_version = version
+        return config
+
+    def config_changed(self) -> bool:
+        return file_version(self.config_file) != self._config_version
+
+    async def watch_config(
+        self,
+        on_change: Callable[[ConfigT], Awaitable[None]],
+        interval: float = None,
+    ):
+        """
+        定期检查配置文件，文件被修改（如通过webui或`import`）后将新配置交给`on_change`
+        :param interval: 检查间隔秒数，默认读取环境变量`TG_SIGNER_CONFIG_WATCH_INTERVAL`，为5秒
+        """
+        if interval is None:
+            interval = float(
+                os.environ.get(CONFIG_WATCH_INTERVAL_ENV, _CONFIG_WATCH_INTERVAL)
+            )
+        while True:
+            await asyncio.sleep(interval)
+            if not self.config_changed():
+                continue
+            try:
+                config = self.read_config()
+            except (OSError, ValueError, ValidationError) as e:
+                # keep running with the old config until the file is valid again
+                self._config_version = file_version(self.config_file)
+                self.log(f"配置文件无效，继续使用原配置: {e}", level="WARNING")
+                continue
+            self.log("检测到配置文件变化，应用新配置")
+            self.config = config
+            await on_change(config)
+
+    def get_task_list(self):
+        signs = []
+        for d in os.listdir(self.tasks_dir):
+            if self.tasks_dir.joinpath(d).is_dir():
+                signs.append(d)
+        return signs
+
+    def list_(self):
+        for d in self.get_task_list():
+            print_to_user(d)
+
+    def export(self):
+        with open(self.config_file, "r", encoding="utf-8") as fp:
+            data = fp.read()
+        return data
+
+    def import_(self, config_str: str):
+        write_text_atomic(self.config_file, config_str)
+
+    def ask_one(self):
+        raise NotImplementedError
+
+
+class SignerTaskManager(TaskManager[SignConfigV3]):
+    _workdir = ".signer"
+    _tasks_dir = "signs"
+    cfg_cls = SignConfigV3
+
+    def _ask_actions(
+        self, input_: UserInput, available_actions: List[SupportAction] = None
+    ) -> List[ActionT]:
+        print_to_user(f"{input_.index_str}开始配置<动作>，请按照实际签到顺序配置。")
+        available_actions = available_actions or list(SupportAction)
+        actions = []
+        while True:
+            try:
+                local_input_ = UserInput()
+                print_to_user(f"第{len(actions) + 1}个动作: ")
+                for action in available_actions:
+                    print_to_user(f"  {action.value}: {action.desc}")
+                print_to_user()
+                action_str = local_input_("输入对应的数字选择动作: ").strip()
+                action = SupportAction(int(action_str))
+                if action not in available_actions:
+                    raise ValueError(f"不支持的动作: {action}")
+                if len(actions) == 0 and action not in [
+                    SupportAction.SEND_TEXT,
+                    SupportAction.SEND_DICE,
+                ]:
+                    raise ValueError(
+                        f"第一个动作必须为「{SupportAction.SEND_TEXT.desc}」或「{SupportAction.SEND_DICE.desc}」"
+                    )
+                if action == SupportAction.SEND_TEXT:
+                    text = local_input_("输入要发送的文本: ")
+                    actions.append(SendTextAction(text=text))
+                elif action == SupportAction.SEND_DICE:
+                    dice = local_input_("输入要发送的骰子（如 🎲, 🎯）: ")
+                    actions.append(SendDiceAction(dice=dice))
+                elif action == SupportAction.CLICK_KEYBOARD_BY_TEXT:
+                    text_of_btn_to_click = local_input_("键盘中需要点击的按钮文本: ")
+                    actions.append(ClickKeyboardByTextAction(text=text_of_btn_to_click))
+                elif action == SupportAction.CHOOSE_OPTION_BY_IMAGE:
+                    print_to_user(
+                        "图片识别将使用大模型回答，请确保大模型支持图片识别。"
+                    )
+                    actions.append(ChooseOptionByImageAction())
+                elif action == SupportAction.REPLY_BY_CALCULATION_PROBLEM:
+                    print_to_user("计算题将使用大模型回答。")
+                    actions.append(ReplyByCalculationProblemAction())
+                else:
+                    raise ValueError(f"不支持的动作: {action}")
+                success_pattern = local_input_(
+                    "成功标志（正则表达式，之后收到匹配的回复即跳过剩余动作，可选）: "
+                ).strip()
+                if success_pattern:
+                    actions[-1] = actions[-1].model_validate(
+                        {**actions[-1].model_dump(), "success_pattern": success_pattern}
+                    )
+                if local_input_("是否继续添加动作？(y/N)：").strip().lower() != "y":
+                    break
+            except (ValueError, ValidationError) as e:
+                print_to_user("错误: ")
+                print_to_user(e)
+        input_.incr()
+        return actions
+
+    def ask_one(self) -> SignChatV3:
+        input_ = UserInput(numbering_lang="chinese_simple")
+        chat_id = int(input_("Chat ID（登录时最近对话输出中的ID）: "))
+        name = input_("Chat名称（可选）: ")
+        use_message_thread = (
+            input_("是否发送到话题（message_thread_id）？(y/N)：").strip().lower()
+            == "y"
+        )
+        message_thread_id = None
+        if use_message_thread:
+            message_thread_id = int(input_("message_thread_id: "))
+        actions = self._ask_actions(input_)
+        delete_after = (
+            input_(
+                "等待N秒后删除消息（发送消息后等待进行删除, '0'表示立即删除, 不需要删除直接回车）, N: "
+            )
+            or None
+        )
+        if delete_after:
+            delete_after = int(delete_after)
+        cfgs = {
+            "chat_id": chat_id,
+            "message_thread_id": message_thread_id,
+            "name": name,
+            "delete_after": delete_after,
+            "actions": actions,
+        }
+        return SignChatV3.model_validate(cfgs)
+
+    def ask_for_config(self) -> "SignConfigV3":
+        chats = []
+        i = 1
+        print_to_user(f"开始配置任务<{self.task_name}>\n")
+        while True:
+            print_to_user(f"第{i}个任务: ")
+            try:
+                chat = self.ask_one()
+                print_to_user(chat)
+                print_to_user(f"第{i}个任务配置成功\n")
+                chats.append(chat)
+            except Exception as e:
+                print_to_user(e)
+                print_to_user("配置失败")
+                i -= 1
+            continue_ = input("继续配置任务？(y/N)：")
+            if continue_.strip().lower() != "y":
+                break
+            i += 1
+        sign_at_prompt = "签到时间（time或crontab表达式，如'06:00:00'或'0 6 * * *'）: "
+        sign_at_str = input(sign_at_prompt) or "06:00:00"
+        while not (sign_at := self._validate_sign_at(sign_at_str)):
+            print_to_user("请输入正确的时间格式")
+            sign_at_str = input(sign_at_prompt) or "06:00:00"
+
+        random_seconds_str = input("签到时间误差随机秒数（默认为0）: ") or "0"
+        random_seconds = int(float(random_seconds_str))
+        config = SignConfigV3.model_validate(
+            {
+                "chats": chats,
+                "sign_at": sign_at,
+                "random_seconds": random_seconds,
+            }
+        )
+        if config.requires_ai:
+            print_to_user(OPENAI_USE_PROMPT)
+        return config
+
+    def _validate_sign_at(
+        self,
+        sign_at_str: str,
+    ) -> Optional[str]:
+        sign_at_str = sign_at_str.replace("：", ":").strip()
+
+        try:
+            sign_at = dt_time.fromisoformat(sign_at_str)
+            crontab_expr = self._time_to_crontab(sign_at)
+        except ValueError:
+            from croniter import CroniterBadCronError, croniter
+
+            try:
+                croniter(sign_at_str)
+                crontab_expr = sign_at_str
+            except CroniterBadCronError:
+                self.log(f"时间格式错误: {sign_at_str}", level="error")
+                return None
+        return crontab_expr
+
+    @staticmethod
+    def _time_to_crontab(sign_at: dt_time) -> str:
+        return f"{sign_at.minute} {sign_at.hour} * * *"
+
+
+class MonitorTaskManager(TaskManager[MonitorConfig]):
+    _workdir = ".monitor"
+    _tasks_dir = "monitors"
+    cfg_cls = MonitorConfig
+
+    def ask_one(self):
+        input_ = UserInput()
+        chat_id = (input_("Chat ID（登录时最近对话输出中的ID）: ")).strip()
+        if not chat_id.startswith("@"):
+            chat_id = int(chat_id)
+        rules = ["exact", "contains", "regex", "all"]
+        while rule := (input_(f"匹配规则({', '.join(rules)}): ") or "exact"):
+            if rule in rules:
+                break
+            print_to_user("不存在的规则, 请重新输入!")
+        rule_value = None
+        if rule != "all":
+            while not (rule_value := input_("规则值（不可为空）: ")):
+                print_to_user("不可为空！")
+                continue
+        from_user_ids = (
+            input_(
+                "只匹配来自特定用户ID的消息（多个用逗号隔开, 匹配所有用户直接回车）: "
+            )
+            or None
+        )
+        always_ignore_me = input_("总是忽略自己发送的消息（y/N）: ").lower() == "y"
+        if from_user_ids:
+            from_user_ids = [
+                i if i.startswith("@") else int(i) for i in from_user_ids.split(",")
+            ]
+        default_send_text = input_("默认发送文本（不需要则回车）: ") or None
+        ai_reply = False
+        ai_prompt = None
+        use_ai_reply = input_("是否使用AI进行回复(y/N): ") or "n"
+        if use_ai_reply.lower() == "y":
+            ai_reply = True
+            while not (ai_prompt := input_("输入你的提示词（作为`system prompt`）: ")):
+                print_to_user("不可为空！")
+                continue
+            print_to_user(OPENAI_USE_PROMPT)
+
+        send_text_search_regex = None
+        if not ai_reply:
+            send_text_search_regex = (
+                input_("从消息中提取发送文本的正则表达式（不需要则直接回车）: ") or None
+            )
+
+        if default_send_text or ai_reply or send_text_search_regex:
+            delete_after = (
+                input_(
+                    "发送消息后等待N秒进行删除（'0'表示立即删除, 不需要删除直接回车）， N: "
+                )
+                or None
+            )
+            if delete_after:
+                delete_after = int(delete_after)
+            forward_to_chat_id = (
+                input_("转发消息到该聊天ID，默认为消息来源：")
+            ).strip()
+            if forward_to_chat_id and not forward_to_chat_id.startswith("@"):
+                forward_to_chat_id = int(forward_to_chat_id)
+        else:
+            delete_after = None
+            forward_to_chat_id = None
+
+        cooldown_seconds = max_replies_per_minute = sender_cooldown_seconds = None
+        if (default_send_text or ai_reply or send_text_search_regex) and (
+            input_("是否限制回复频率(y/N): ").lower() == "y"
+        ):
+            cooldown_seconds = (
+                input_("两次回复之间至少间隔N秒（不限制直接回车）, N: ") or None
+            )
+            max_replies_per_minute = (
+                input_("每分钟最多回复N次（不限制直接回车）, N: ") or None
+            )
+            sender_cooldown_seconds = (
+                input_("同一发送者N秒内只回复一次（不限制直接回车）, N: ") or None
+            )
+
+        push_via_server_chan = (
+            input_("是否通过Server酱推送消息(y/N): ") or "n"
+        ).lower() == "y"
+        server_chan_send_key = None
+        if push_via_server_chan:
+            server_chan_send_key = (
+                input_(
+                    "Server酱的SendKey（不填将从环境变量`SERVER_CHAN_SEND_KEY`读取）: "
+                )
+                or None
+            )
+
+        digest = None
+        replies = default_send_text or ai_reply or send_text_search_regex
+        if replies or push_via_server_chan:
+            if input_("是否将多次匹配汇总后再发送或推送(y/N): ").lower() == "y":
+                digest = {
+                    "interval": input_("第一次匹配后最多等待N秒（默认300）, N: ")
+                    or 300,
+                    "max_items": input_("累计N条后立即发送（默认50）, N: ") or 50,
+                }
+
+        forward_to_external = (
+            input_("是否需要转发到外部（UDP, Http）(y/N): ").lower() == "y"
+        )
+        external_forwards = None
+        if forward_to_external:
+            external_forwards = []
+            if input_("是否需要转发到UDP(y/N): ").lower() == "y":
+                addr = input_("请输入UDP服务器地址和端口（形如`127.0.0.1:1234`）: ")
+                host, port = addr.split(":")
+                external_forwards.append(
+                    {
+                        "host": host,
+                        "port": int(port),
+                    }
+                )
+
+            if input_("是否需要转发到Http(y/N): ").lower() == "y":
+                url = input_("请输入Http地址（形如`http://127.0.0.1:1234`）: ")
+                external_forwards.append(
+                    {
+                        "url": url,
+                    }
+                )
+
+        return MatchConfig.model_validate(
+            {
+                "chat_id": chat_id,
+                "rule": rule,
+                "rule_value": rule_value,
+                "from_user_ids": from_user_ids,
+                "always_ignore_me": always_ignore_me,
+                "default_send_text": default_send_text,
+                "ai_reply": ai_reply,
+                "ai_prompt": ai_prompt,
+                "send_text_search_regex": send_text_search_regex,
+                "delete_after": delete_after,
+                "forward_to_chat_id": forward_to_chat_id,
+                "push_via_server_chan": push_via_server_chan,
+                "server_chan_send_key": server_chan_send_key,
+                "external_forwards": external_forwards,
+                "cooldown_seconds": cooldown_seconds,
+                "max_replies_per_minute": max_replies_per_minute,
+                "sender_cooldown_seconds": sender_cooldown_seconds,
+                "digest": digest,
+            }
+        )
+
+    def ask_for_config(self) -> "MonitorConfig":
+        i = 1
+        print_to_user(f"开始配置任务<{self.task_name}>")
+        print_to_user(
+            "聊天chat id和用户user id均同时支持整数id和字符串username, username必须以@开头，如@neo"
+        )
+        match_cfgs = []
+        while True:
+            print_to_user(f"\n配置第{i}个监控项")
+            try:
+                match_cfgs.append(self.ask_one())
+            except Exception as e:
+                print_to_user(e)
+                print_to_user("配置失败")
+                i -= 1
+            continue_ = input("继续配置？(y/N)：")
+            if continue_.strip().lower() != "y":
+                break
+            i += 1
+        config = MonitorConfig(match_cfgs=match_cfgs)
+        if config.requires_ai:
+            print_to_user(OPENAI_USE_PROMPT)
+        return config
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Hashable, Optional
+
+logger = logging.getLogger("tg-signer")
+
+UPDATE_WORKERS_ENV = "TG_SIGNER_UPDATE_WORKERS"
+DEFAULT_POOL_SIZE = 16
+DEFAULT_QUEUE_SIZE = 1000
+# 有新的更新时，每隔该秒数记录一次队列状态
+STATS_LOG_INTERVAL = 300
+
+UpdateJob = Callable[[], Awaitable[None]]
+
+
+class UpdateWorkerPool:
+    """
+    Process-wide pool that processes the updates of every client.
+
+    Every key (the chat id) has its own queue drained by its own task, so
+    updates of one chat keep their order and a slow update only delays the
+    chat it belongs to. At most `size` updates run at the same time across
+    all chats. Per-chat queues are bounded: a full queue applies backpressure
+    to the client feeding it.
+    """
+
+    def __init__(self, size: int = None, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.size = max(1, int(size or DEFAULT_POOL_SIZE))
+        self.queue_size = queue_size
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._queues: dict[Hashable, asyncio.Queue[UpdateJob]] = {}
+        self._runners: dict[Hashable, asyncio.Task] = {}
+        self._reporter: Optional[asyncio.Task] = None
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.running = 0
+        self.max_depth = 0
+
+    @property
+    def started(self) -> bool:
+        return self.loop is not None
+
+    def start(self):
+        if self.started:
+            return
+        self.loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self.size)
+        self._reporter = self.loop.create_task(self._report(STATS_LOG_INTERVAL))
+        logger.debug(f"更新处理池已启动，并发数量: {self.size}")
+
+    async def submit(self, key: Hashable, job: UpdateJob):
+        self.start()
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = asyncio.Queue(self.queue_size)
+            queue.put_nowait(job)
+            self._runners[key] = self.loop.create_task(self._drain(key, queue))
+        else:
+            await queue.put(job)
+        self.submitted += 1
+        self.max_depth = max(self.max_depth, queue.qsize())
+
+    async def _drain(self, key: Hashable, queue: asyncio.Queue[UpdateJob]):
+        try:
+            while not queue.empty():
+                job = queue.get_nowait()
+                async with self._semaphore:
+                    self.running += 1
+                    try:
+                        await job()
+                        self.processed += 1
+                    except Exception as e:
+                        self.failed += 1
+                        logger.error(f"处理更新时发生错误: {e}", exc_info=True)
+                    finally:
+                        self.running -= 1
+                        queue.task_done()
+        finally:
+            # the queue is empty here and nothing was awaited since the check,
+            # so the next update of this chat starts a new runner
+            if self._queues.get(key) is queue:
+                del self._queues[key]
+                del self._runners[key]
+
+    async def _report(self, interval: float):
+        reported = 0
+        while True:
+            await asyncio.sleep(interval)
+            if self.submitted == reported:
+                continue
+            reported = self.submitted
+            stats = self.stats()
+            logger.info(
+                "更新处理池: 已提交{submitted}, 已处理{processed}, 失败{failed}, "
+                "处理中{running}, 排队{queued}（{chats}个聊天）, 最大队列长度{max_depth}".format(
+                    **stats
+                )
+            )
+
+    async def join(self):
+        while self._runners:
+            await asyncio.gather(*self._runners.values(), return_exceptions=True)
+
+    async def stop(self):
+        tasks = list(self._runners.values())
+        if self._reporter is not None:
+            tasks.append(self._reporter)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._runners.clear()
+        self._queues.clear()
+        self._reporter = None
+        self.loop = None
+
+    def stats(self) -> dict:
+        depths = {key: queue.qsize() for key, queue in self._queues.items()}
+        return {
+            "size": self.size,
+            "queue_size": self.queue_size,
+            "chats": len(depths),
+            "queued": sum(depths.values()),
+            "queue_depths": depths,
+            "running": self.running,
+            "max_depth": self.max_depth,
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
+
+
+_UPDATE_POOL: Optional[UpdateWorkerPool] = None
+_UPDATE_POOL_SIZE: Optional[int] = None
+
+
+def configure_update_pool(size: Optional[int]):
+    """Set the number of workers of the pools created afterwards."""
+    global _UPDATE_POOL_SIZE
+    _UPDATE_POOL_SIZE = size
+
+
+def get_update_pool() -> UpdateWorkerPool:
+    """Return the pool bound to the running event loop, creating it if needed."""
+    global _UPDATE_POOL
+    loop = asyncio.get_running_loop()
+    pool = _UPDATE_POOL
+    if pool is None or (pool.loop is not None and pool.loop is not loop):
+        size = _UPDATE_POOL_SIZE or os.environ.get(UPDATE_WORKERS_ENV)
+        pool = _UPDATE_POOL = UpdateWorkerPool(size)
+    return pool
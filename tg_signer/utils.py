@@ -1,4 +1,9 @@
-from typing import Dict, Literal
+import os
+import pathlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Literal, Optional
+from urllib import parse
 
 from typing_extensions import TypeAlias
 
@@ -267,5 +272,62 @@ class UserInput:
         return r
 
 
+_USER_OUTPUT: ContextVar[Optional[list[str]]] = ContextVar("user_output", default=None)
+
+
+@contextmanager
+def capture_user_output() -> Iterator[list[str]]:
+    """收集当前上下文中``print_to_user``的输出，而不是打印到终端"""
+    output: list[str] = []
+    token = _USER_OUTPUT.set(output)
+    try:
+        yield output
+    finally:
+        _USER_OUTPUT.reset(token)
+
+
 def print_to_user(*args, sep=" ", end="\n", flush=False, **kwargs):
+    output = _USER_OUTPUT.get()
+    if output is not None:
+        output.append(sep.join(map(str, args)))
+        return None
     return print(*args, sep=sep, end=end, flush=flush, **kwargs)
+
+
+def get_proxy(proxy: str = None):
+    proxy = proxy or os.environ.get("TG_PROXY")
+    if proxy:
+        r = parse.urlparse(proxy)
+        return {
+            "scheme": r.scheme,
+            "hostname": r.hostname,
+            "port": r.port,
+            "username": r.username,
+            "password": r.password,
+        }
+    return None
+
+
+def make_dirs(path: pathlib.Path, exist_ok=True):
+    path = pathlib.Path(path)
+    if not path.is_dir():
+        os.makedirs(path, exist_ok=exist_ok)
+    return path
+
+
+def write_text_atomic(path: pathlib.Path, text: str):
+    """先写入临时文件再替换，避免其他进程读到写了一半的文件"""
+    path = pathlib.Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as fp:
+        fp.write(text)
+    os.replace(tmp_path, path)
+
+
+def file_version(path: pathlib.Path) -> Optional[tuple[int, int]]:
+    """文件的(mtime_ns, size)，用于判断文件是否被修改，文件不存在时返回``None``"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
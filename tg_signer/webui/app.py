@@ -1,7 +1,8 @@
 import json
 import os
+from datetime import datetime
 from pathlib import Path
-from typing import Callable, Dict
+from typing import Callable, Dict, List
 
 from nicegui import app, ui
 from pydantic import TypeAdapter
@@ -14,6 +15,7 @@ from tg_signer.webui.data import (
     ConfigKind,
     delete_config,
     get_workdir,
+    latency_stats,
     list_log_files,
     list_task_names,
     load_config,
@@ -21,6 +23,7 @@ from tg_signer.webui.data import (
     load_sign_records,
     load_user_infos,
     save_config,
+    search_archive,
 )
 from tg_signer.webui.interactive import InteractiveSignerConfig
 from tg_signer.webui.schema_utils import clean_schema
@@ -60,7 +63,9 @@ MONITOR_TEMPLATE: Dict[str, object] = {
             "push_via_server_chan": False,
             "server_chan_send_key": None,
         }
-    ]
+    ],
+    "archive": False,
+    "edit_window": None,
 }
 
 
@@ -74,6 +79,7 @@ class UIState:
         self.log_path: Path = DEFAULT_LOG_FILE
         self.log_limit: int = 200
         self.record_filter: str = ""
+        self.record_page: int = 0
 
     def set_workdir(self, path_str: str) -> None:
         self.workdir = get_workdir(Path(path_str).expanduser())
@@ -254,7 +260,7 @@ class SignerBlock(BaseConfigBlock):
         self.record_btn.disable()
 
     def on_loaded(self, target: str):
-        records = load_sign_records(state.workdir)
+        records = load_sign_records(state.workdir, keyword=target, page_size=1)
         has_record = any(r.task == target for r in records)
         if has_record:
             self.record_btn.enable()
@@ -366,6 +372,9 @@ def user_info_block() -> Callable[[], None]:
     return refresh
 
 
+RECORD_PAGE_SIZE = 50
+
+
 class SignRecordBlock:
     def __init__(self):
         self.container = ui.column().classes("w-full gap-3")
@@ -379,25 +388,36 @@ class SignRecordBlock:
             ui.button("清除筛选", on_click=lambda: self._update_filter("")).props(
                 "outline"
             )
-        self.status = ui.label("").classes("text-sm text-gray-500")
+        with ui.row().classes("items-center gap-3"):
+            self.status = ui.label("").classes("text-sm text-gray-500")
+            ui.button("上一页", on_click=lambda: self._turn_page(-1)).props(
+                "flat dense"
+            )
+            self.page_label = ui.label("").classes("text-sm")
+            ui.button("下一页", on_click=lambda: self._turn_page(1)).props("flat dense")
 
     def _update_filter(self, value: str) -> None:
         state.record_filter = value or ""
+        state.record_page = 0
+        self.refresh()
+
+    def _turn_page(self, step: int) -> None:
+        state.record_page = max(0, state.record_page + step)
         self.refresh()
 
     def refresh(
         self,
     ) -> None:
         self.container.clear()
-        records = load_sign_records(state.workdir)
         keyword = (state.record_filter or "").lower().strip()
-        if keyword:
-            records = [
-                r
-                for r in records
-                if keyword in r.task.lower()
-                or (r.user_id and keyword in str(r.user_id).lower())
-            ]
+        records = load_sign_records(
+            state.workdir,
+            keyword=keyword,
+            page=state.record_page,
+            page_size=RECORD_PAGE_SIZE,
+        )
+        self.page_label.text = f"第 {state.record_page + 1} 页"
+        self.page_label.update()
         with self.container:
             if not records:
                 self.status.text = "未找到匹配的签到记录" if keyword else "尚无签到记录"
@@ -407,11 +427,11 @@ class SignRecordBlock:
             self.status.update()
             for record in records:
                 user_text = record.user_id or "默认"
-                header = f"{record.task} / {user_text}（{len(record.records)}条）"
+                header = f"{record.task} / {user_text}（{record.total}条）"
                 with ui.expansion(header, icon="event").classes("shadow-sm"):
                     ui.label(f"文件: {record.path}").classes("text-gray-500")
                     if not record.records:
-                        ui.label("暂无记录").classes("text-gray-500")
+                        ui.label("本页暂无记录").classes("text-gray-500")
                         continue
                     rows = [{"日期": k, "时间": v} for k, v in record.records]
                     ui.table(
@@ -421,6 +441,127 @@ class SignRecordBlock:
                         ],
                         rows=rows,
                     ).classes("w-full").props("flat dense")
+                    if record.latencies:
+                        self._latency_table(record.latencies)
+
+    @staticmethod
+    def _latency_table(latencies: Dict[str, List[float]]) -> None:
+        ui.label("回复延迟（秒），等待超时根据最近的延迟计算").classes(
+            "text-gray-500 mt-2"
+        )
+        rows = []
+        for chat_key, values in sorted(latencies.items()):
+            stats = latency_stats(values)
+            rows.append(
+                {
+                    "聊天": chat_key,
+                    "样本数": stats["samples"],
+                    "P50": f"{stats['p50']:.2f}",
+                    "P95": f"{stats['p95']:.2f}",
+                    "超时": f"{stats['timeout']:.1f}",
+                    "最近": ", ".join(f"{v:.2f}" for v in values[-10:]),
+                }
+            )
+        ui.table(
+            columns=[
+                {"name": name, "label": name, "field": name}
+                for name in ("聊天", "样本数", "P50", "P95", "超时", "最近")
+            ],
+            rows=rows,
+        ).classes("w-full").props("flat dense")
+
+    def __call__(self, *args, **kwargs):
+        return self.refresh()
+
+
+ARCHIVE_PAGE_SIZE = 50
+
+
+class ArchiveBlock:
+    def __init__(self):
+        self.page = 0
+        with ui.row().classes("items-end w-full gap-3 flex-wrap"):
+            self.query_input = ui.input(label="关键词", placeholder="消息文本").classes(
+                "min-w-[220px]"
+            )
+            self.chat_input = ui.input(
+                label="聊天", placeholder="id、username或标题"
+            ).classes("w-48")
+            self.sender_input = ui.input(
+                label="发送者", placeholder="id、username或名称"
+            ).classes("w-48")
+            self.since_input = ui.input(label="开始日期", placeholder="2024-01-01")
+            self.until_input = ui.input(
+                label="结束日期（不含）", placeholder="2024-02-01"
+            )
+            ui.button("搜索", on_click=self.search)
+        with ui.row().classes("items-center gap-3"):
+            self.status = ui.label("").classes("text-sm text-gray-500")
+            ui.button("上一页", on_click=lambda: self._turn_page(-1)).props(
+                "flat dense"
+            )
+            self.page_label = ui.label("").classes("text-sm")
+            ui.button("下一页", on_click=lambda: self._turn_page(1)).props("flat dense")
+        self.container = ui.column().classes("w-full gap-3")
+
+    def search(self) -> None:
+        self.page = 0
+        self.refresh()
+
+    def _turn_page(self, step: int) -> None:
+        self.page = max(0, self.page + step)
+        self.refresh()
+
+    @staticmethod
+    def _parse_date(value: str) -> datetime | None:
+        value = (value or "").strip()
+        return datetime.fromisoformat(value) if value else None
+
+    def refresh(self) -> None:
+        self.container.clear()
+        try:
+            total, rows = search_archive(
+                state.workdir,
+                query=self.query_input.value,
+                chat=self.chat_input.value,
+                sender=self.sender_input.value,
+                since=self._parse_date(self.since_input.value),
+                until=self._parse_date(self.until_input.value),
+                page=self.page,
+                page_size=ARCHIVE_PAGE_SIZE,
+            )
+        except Exception as exc:  # noqa: BLE001
+            notify_error(exc)
+            return
+        pages = max(1, -(-total // ARCHIVE_PAGE_SIZE))
+        self.page_label.text = f"第 {self.page + 1} / {pages} 页"
+        self.page_label.update()
+        self.status.text = f"共 {total} 条消息"
+        self.status.update()
+        if not rows:
+            return
+        with self.container:
+            ui.table(
+                columns=[
+                    {"name": name, "label": name, "field": name, "align": "left"}
+                    for name in ("时间", "聊天", "发送者", "消息")
+                ],
+                rows=[
+                    {
+                        "时间": datetime.fromtimestamp(row["date"]).isoformat(
+                            sep=" ", timespec="seconds"
+                        ),
+                        "聊天": row["chat_title"]
+                        or row["chat_username"]
+                        or str(row["chat_id"]),
+                        "发送者": row["sender_name"]
+                        or row["sender_username"]
+                        or str(row["sender_id"] or ""),
+                        "消息": row["text"],
+                    }
+                    for row in rows
+                ],
+            ).classes("w-full").props("flat dense wrap-cells")
 
     def __call__(self, *args, **kwargs):
         return self.refresh()
@@ -566,6 +707,7 @@ def _build_dashboard(container) -> None:
             tab_configs = ui.tab("配置管理")
             tab_users = ui.tab("用户信息")
             tab_records = ui.tab("签到记录")
+            tab_archive = ui.tab("消息存档")
             tab_logs = ui.tab("日志")
 
         def goto_records(task_name: str) -> None:
@@ -596,10 +738,18 @@ def _build_dashboard(container) -> None:
                 refreshers.append(user_info_block())
 
             with ui.tab_panel(tab_records):
-                ui.label("签到记录 sign_record.json").classes("text-gray-600")
+                ui.label("签到记录 sign_record.json / tg-signer.db").classes(
+                    "text-gray-600"
+                )
                 refresh_records = SignRecordBlock()
                 refreshers.append(refresh_records)
 
+            with ui.tab_panel(tab_archive):
+                ui.label(
+                    '监控消息存档 archive.db（在监控配置中设置 "archive": true 开启）'
+                ).classes("text-gray-600")
+                refreshers.append(ArchiveBlock())
+
             with ui.tab_panel(tab_logs):
                 ui.label("查看日志文件的最新行。").classes("text-gray-600")
                 refreshers.append(log_block())
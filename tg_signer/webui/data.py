@@ -2,10 +2,21 @@ import json
 import os
 from collections import deque
 from dataclasses import dataclass
+from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, Iterable, List, Literal, Optional, Tuple
 
+from tg_signer.archive import MessageArchive, get_archive_file
 from tg_signer.config import BaseJSONConfig, MonitorConfig, SignConfigV3
+from tg_signer.store import (
+    LATENCY_FILE_NAME,
+    SignStore,
+    load_latency_file,
+    open_store,
+    percentile,
+    reply_timeout,
+)
+from tg_signer.utils import write_text_atomic
 
 ConfigKind = Literal["signer", "monitor"]
 
@@ -34,6 +45,7 @@ class UserInfo:
     data: Dict[str, Any]
     path: Path
     latest_chats: List[Dict[str, Any]] = None
+    forum_topics: Dict[str, List[Dict[str, Any]]] = None
 
 
 @dataclass
@@ -42,6 +54,8 @@ class SignRecord:
     user_id: Optional[str]
     records: List[Tuple[str, str]]
     path: Path
+    total: int = 0
+    latencies: Dict[str, List[float]] = None  # 每个聊天最近的回复延迟（秒）
 
 
 def get_workdir(workdir: Optional[Path | str] = None) -> Path:
@@ -108,8 +122,10 @@ def save_config(
         cfg, _ = loaded
     config_file = _config_path(kind, name, workdir)
     config_file.parent.mkdir(parents=True, exist_ok=True)
-    with open(config_file, "w", encoding="utf-8") as fp:
-        json.dump(cfg.to_jsonable(), fp, ensure_ascii=False, indent=2)
+    # running tasks watch this file, never let them see a partial write
+    write_text_atomic(
+        config_file, json.dumps(cfg.to_jsonable(), ensure_ascii=False, indent=2)
+    )
     return config_file
 
 
@@ -162,11 +178,30 @@ def load_user_infos(workdir: Optional[Path | str] = None) -> List[UserInfo]:
                 data=data,
                 path=me_file,
                 latest_chats=latest_chats,
+                forum_topics=load_forum_topics(user_dir),
             )
         )
     return entries
 
 
+def load_forum_topics(user_dir: Path) -> Dict[str, List[Dict[str, Any]]]:
+    """Forum topics cached by login/list-topics, keyed by chat id."""
+    topics_file = user_dir / "forum_topics.json"
+    if not topics_file.is_file():
+        return {}
+    try:
+        with open(topics_file, "r", encoding="utf-8") as fp:
+            data = json.load(fp)
+    except (json.JSONDecodeError, OSError):
+        return {}
+    topics: Dict[str, List[Dict[str, Any]]] = {}
+    for chat_id, entry in data.items():
+        value = entry.get("value") if isinstance(entry, dict) else None
+        if isinstance(value, dict) and value.get("topics"):
+            topics[chat_id] = value["topics"]
+    return topics
+
+
 def _record_target(path: Path, signs_root: Path) -> Tuple[str, Optional[str]]:
     relative_parts = path.relative_to(signs_root).parts
     task = relative_parts[0]
@@ -176,31 +211,127 @@ def _record_target(path: Path, signs_root: Path) -> Tuple[str, Optional[str]]:
     return task, user_id
 
 
-def load_sign_records(workdir: Optional[Path | str] = None) -> List[SignRecord]:
+def load_sign_records(
+    workdir: Optional[Path | str] = None,
+    keyword: Optional[str] = None,
+    page: int = 0,
+    page_size: Optional[int] = None,
+) -> List[SignRecord]:
+    """
+    :param keyword: 按任务名或用户ID过滤
+    :param page: 页码（从0开始），每组记录均取该页
+    :param page_size: 每组每页的记录数，为空时返回全部
+    """
     base = get_workdir(workdir)
+    store = open_store(base)
+    if store is not None:
+        try:
+            return _load_store_records(store, keyword, page, page_size)
+        finally:
+            store.close()
     signs_dir = base / "signs"
     if not signs_dir.is_dir():
         return []
+    keyword = (keyword or "").lower().strip()
     records: List[SignRecord] = []
     for record_file in sorted(signs_dir.rglob("sign_record.json")):
+        task, user_id = _record_target(record_file, signs_dir)
+        if keyword and not (
+            keyword in task.lower() or (user_id and keyword in user_id.lower())
+        ):
+            continue
         try:
             with open(record_file, "r", encoding="utf-8") as fp:
                 data = json.load(fp)
         except (json.JSONDecodeError, OSError):
             continue
-        task, user_id = _record_target(record_file, signs_dir)
         items: Iterable[Tuple[str, str]] = (
             data.items() if isinstance(data, dict) else []
         )
         sorted_items = sorted(items, key=lambda kv: kv[0], reverse=True)
+        if page_size:
+            sorted_items = sorted_items[page * page_size : (page + 1) * page_size]
+        records.append(
+            SignRecord(
+                task=task,
+                user_id=user_id,
+                records=sorted_items,
+                path=record_file,
+                total=len(data) if isinstance(data, dict) else 0,
+                latencies=load_latency_file(record_file.with_name(LATENCY_FILE_NAME)),
+            )
+        )
+    return records
+
+
+def _load_store_records(
+    store: SignStore, keyword: Optional[str], page: int, page_size: Optional[int]
+) -> List[SignRecord]:
+    records: List[SignRecord] = []
+    for group in store.run_groups(keyword=(keyword or "").strip() or None):
+        runs = store.query_runs(
+            task=group["task"],
+            user_id=group["user_id"],
+            limit=page_size or -1,
+            offset=page * page_size if page_size else 0,
+        )
         records.append(
             SignRecord(
-                task=task, user_id=user_id, records=sorted_items, path=record_file
+                task=group["task"],
+                user_id=group["user_id"] or None,
+                records=[(run["run_date"], run["started_at"]) for run in runs],
+                path=store.path,
+                total=group["runs"],
+                latencies=store.latency_history(group["task"], group["user_id"]),
             )
         )
     return records
 
 
+def search_archive(
+    workdir: Optional[Path | str] = None,
+    query: Optional[str] = None,
+    chat: Optional[str] = None,
+    sender: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    page: int = 0,
+    page_size: int = 50,
+) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    搜索监控消息存档，返回匹配的总数和该页（从0开始）的消息；存档不存在时返回空结果
+    """
+    archive_file = get_archive_file(get_workdir(workdir))
+    if not archive_file.is_file():
+        return 0, []
+    archive = MessageArchive(archive_file)
+    try:
+        filters = {
+            "query": query,
+            "chat": chat,
+            "sender": sender,
+            "since": since,
+            "until": until,
+        }
+        total = archive.count(**filters)
+        rows = archive.search(**filters, limit=page_size, offset=page * page_size)
+    finally:
+        archive.close()
+    return total, rows
+
+
+def latency_stats(latencies: List[float]) -> Dict[str, Any]:
+    """回复延迟的统计：样本数、P50、P95及据此计算的等待超时（秒）"""
+    if not latencies:
+        return {"samples": 0, "p50": None, "p95": None, "timeout": reply_timeout([])}
+    return {
+        "samples": len(latencies),
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "timeout": reply_timeout(latencies),
+    }
+
+
 def tail_file(path: Path, limit: int = 200) -> List[str]:
     if not path.is_file():
         return []
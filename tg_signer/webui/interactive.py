@@ -169,6 +169,8 @@ class InteractiveSignerConfig:
                 with ui.dialog() as import_dialog, ui.card().classes("w-full max-w-lg"):
                     ui.label("从最近聊天快速导入").classes("text-lg font-bold mb-4")
 
+                    selected_user = {"value": None}
+
                     def on_chat_select(e: ValueChangeEventArguments):
                         selected_chat = e.value
                         if not selected_chat:
@@ -182,12 +184,36 @@ class InteractiveSignerConfig:
                         if not name_input.value:
                             name_input.value = label
 
+                        # Offer cached forum topics instead of calling the API
+                        user = selected_user["value"]
+                        topics = (user.forum_topics or {}).get(str(chat_id)) or []
+                        if topics:
+                            topic_select.options = {
+                                t["id"]: f"{t.get('title') or '-'} ({t['id']})"
+                                for t in topics
+                            }
+                            topic_select.value = None
+                            topic_select.enable()
+                            topic_select.update()
+                            return
+
+                        import_dialog.close()
+
+                    def on_topic_select(e: ValueChangeEventArguments):
+                        if e.value is None:
+                            return
+                        use_thread_input.value = True
+                        thread_id_input.enable()
+                        thread_id_input.value = e.value
                         import_dialog.close()
 
                     def on_user_select(e):
                         user_id = e.value
                         chat_select.options = {}
                         chat_select.value = None
+                        topic_select.options = {}
+                        topic_select.value = None
+                        topic_select.disable()
 
                         if not user_id:
                             chat_select.disable()
@@ -196,6 +222,7 @@ class InteractiveSignerConfig:
                         target_user = next(
                             (u for u in user_infos if u.user_id == user_id), None
                         )
+                        selected_user["value"] = target_user
                         if target_user and target_user.latest_chats:
                             options = {}
                             for c in target_user.latest_chats:
@@ -231,6 +258,14 @@ class InteractiveSignerConfig:
                         ).classes("w-full")
                         chat_select.disable()
 
+                        topic_select = ui.select(
+                            options={},
+                            label="选择话题（可选，来自本地话题缓存）",
+                            on_change=on_topic_select,
+                            with_input=True,
+                        ).classes("w-full")
+                        topic_select.disable()
+
                     ui.button("取消", on_click=import_dialog.close).props(
                         "flat"
                     ).classes("ml-auto mt-4")